@@ -0,0 +1,140 @@
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from routing_engine import node_positions, nearest_nodes, objective_weights, dijkstra, astar, path_from_predecessors
+from shared_arrays import share_graph, attached_graph
+
+# Discomfort sensitivity curves for many trips at once, without the app.
+# Takes a table of origin-destination (OD) pairs and a grid of Betas, and gives the relative distance (circuity) and
+# relative discomfort of the lowest-objective route for every pair and Beta, as in Find Routes and notebook 08.
+# The routing graph is copied once into shared memory; worker processes attach to it and route one group of origins each.
+# Run `python batch_curves.py od_pairs.csv output.csv [b|w]` from the repository root (b for cycling, the default, or w for walking).
+
+FOLDER = "discomfort_and_curve_data/"
+
+BETAS = [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0]
+
+def od_pairs_to_nodes(graph, od_pairs):
+    """Origin and destination node osmids for a table of OD pairs.
+
+od_pairs: DataFrame with origin and destination columns (node osmids), or with origin_lon, origin_lat,
+destination_lon and destination_lat columns (EPSG:4326), which are snapped to the nearest nodes.
+
+Returns a DataFrame with the same index and origin and destination columns.
+"""
+    if {"origin", "destination"}.issubset(od_pairs.columns):
+        return od_pairs[["origin", "destination"]].astype(np.int64)
+
+    origins, _ = nearest_nodes(graph, od_pairs["origin_lon"].to_numpy(), od_pairs["origin_lat"].to_numpy())
+    destinations, _ = nearest_nodes(graph, od_pairs["destination_lon"].to_numpy(), od_pairs["destination_lat"].to_numpy())
+
+    return pd.DataFrame({"origin": origins, "destination": destinations}, index = od_pairs.index)
+
+def route_costs_from_origin(graph, source, targets, betas):
+    """Length and discomfort of the lowest-objective route from one origin to each target (positions), for every Beta.
+
+Returns an array of shape (len(betas), len(targets), 2), with NaN where a target cannot be reached.
+"""
+    costs = np.full((len(betas), len(targets), 2), np.nan)
+
+    for b, beta in enumerate(betas):
+        weights = objective_weights(graph, beta)
+
+        if len(targets) == 1:
+            # a single target: A* only expands the nodes towards it
+            _, pred = astar(graph, weights, source, targets[0])
+        else:
+            _, pred = dijkstra(graph, weights, source)
+
+        for t, target in enumerate(targets):
+            path = path_from_predecessors(graph, pred, source, target)
+            if path is not None:
+                _, entries = path
+                costs[b, t] = graph["length"][entries].sum(), graph["discomfort"][entries].sum()
+
+    return costs
+
+def route_origin_group(task):
+    """Worker: route every OD pair of a group of origins on the shared graph."""
+    spec, heuristic_scale, betas, groups = task
+
+    with attached_graph(spec, heuristic_scale = heuristic_scale) as graph:
+        results = []
+        for source, rows, targets in groups:
+            results.append((rows, route_costs_from_origin(graph, source, targets, betas)))
+
+    return results
+
+def batch_curves(graph, od_pairs, betas = BETAS, n_workers = None, origins_per_task = 20):
+    """Relative distance and relative discomfort for every OD pair and Beta.
+
+graph: routing graph from routing_engine.build_csr_graph.
+
+od_pairs: DataFrame of OD pairs, see od_pairs_to_nodes.
+
+Returns a DataFrame with one row per OD pair and Beta: od (the index of od_pairs), origin, destination, beta,
+length, discomfort, straight_line_distance, relative_distance and relative_discomfort.
+Pairs that cannot be routed (or that start and end at the same node) have NaN relative values.
+"""
+    od_nodes = od_pairs_to_nodes(graph, od_pairs)
+
+    sources = node_positions(graph, od_nodes["origin"].to_numpy())
+    targets = node_positions(graph, od_nodes["destination"].to_numpy())
+
+    # all the trips from one origin share its shortest-path trees
+    groups = []
+    for source, rows in pd.Series(np.arange(len(od_nodes))).groupby(sources).groups.items():
+        rows = np.asarray(rows)
+        groups.append((int(source), rows, targets[rows]))
+
+    costs = np.full((len(od_nodes), len(betas), 2), np.nan)
+
+    with share_graph(graph) as spec:
+        tasks = [
+            (spec, graph["heuristic_scale"], list(betas), groups[start:start + origins_per_task])
+            for start in range(0, len(groups), origins_per_task)
+        ]
+
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            for results in executor.map(route_origin_group, tasks):
+                for rows, group_costs in results:
+                    costs[rows] = group_costs.transpose(1, 0, 2)
+
+    straight_line = np.hypot(*(graph["xy"][sources] - graph["xy"][targets]).T)
+
+    curves = pd.DataFrame({
+        "od": np.repeat(od_nodes.index.to_numpy(), len(betas)),
+        "origin": np.repeat(od_nodes["origin"].to_numpy(), len(betas)),
+        "destination": np.repeat(od_nodes["destination"].to_numpy(), len(betas)),
+        "beta": np.tile(np.asarray(betas, dtype = float), len(od_nodes)),
+        "length": costs[:, :, 0].ravel(),
+        "discomfort": costs[:, :, 1].ravel(), # weighted by Beta = 1, i.e. unweighted
+        "straight_line_distance": np.repeat(straight_line, len(betas)),
+    })
+
+    curves["relative_distance"] = (curves["length"] / curves["straight_line_distance"]).where(curves["straight_line_distance"] > 0)
+    curves["relative_discomfort"] = (curves["discomfort"] / curves["length"]).where(curves["length"] > 0)
+
+    return curves
+
+if __name__ == "__main__":
+    import geopandas as gpd
+
+    from routing_engine import build_csr_graph
+
+    od_path, output_path = sys.argv[1], sys.argv[2]
+    mode = sys.argv[3] if len(sys.argv) > 3 else "b"
+
+    edges = gpd.read_feather(FOLDER + f"G{mode}_edges.feather")
+    nodes = gpd.read_feather(FOLDER + f"G{mode}_nodes.feather")
+    graph = build_csr_graph(edges, nodes)
+
+    t0 = time.perf_counter()
+    curves = batch_curves(graph, pd.read_csv(od_path))
+    curves.to_csv(output_path, index = False)
+
+    print(f"{curves['od'].nunique()} OD pairs x {len(BETAS)} Betas in {time.perf_counter() - t0:.1f} s")
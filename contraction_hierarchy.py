@@ -0,0 +1,298 @@
+import os
+import json
+import heapq
+
+import numpy as np
+
+from routing_engine import node_positions, objective_weights
+from score_cache import file_hash
+
+# Optional contraction-hierarchy (CH) indexes for fast route queries, one per network and per Beta.
+# Nodes are contracted one at a time (least important first), adding shortcut arcs so that shortest distances between the
+# remaining nodes do not change. A query is then a bidirectional search that only moves towards more important nodes,
+# and shortcuts are unpacked back into the original edges.
+# Indexes are built offline and saved as .npy files, which are memory-mapped when loaded.
+# Run `python contraction_hierarchy.py` from the repository root to build the indexes for the Betas used in Find Routes.
+
+FOLDER = "discomfort_and_curve_data/"
+
+INDEX_FOLDER = FOLDER + "ch_index/"
+
+INDEX_ARRAYS = ["node_ids", "up_indptr", "up_arcs", "up_heads", "up_weights", "down_indptr", "down_arcs", "down_tails", "down_weights",
+                "arc_tail", "arc_head", "arc_weight", "arc_first", "arc_second", "arc_edge_row"]
+
+def witness_distances(out, source, excluded, targets, settle_limit):
+    """Distances from `source` to `targets` (dict of target: distance via the node being contracted) that avoid `excluded`.
+
+The search stops after `settle_limit` nodes, so some distances may be missing. A missing witness only adds an unneeded shortcut.
+"""
+    max_distance = max(targets.values())
+    dist = {source: 0.0}
+    settled = set()
+    heap = [(0.0, source)]
+    remaining = len(targets)
+
+    while heap and (len(settled) < settle_limit):
+        d, i = heapq.heappop(heap)
+        if i in settled:
+            continue
+        settled.add(i)
+        if i in targets:
+            remaining -= 1
+            if remaining == 0:
+                break
+        if d > max_distance:
+            break
+        for j, (w, _) in out[i].items():
+            if j == excluded:
+                continue
+            nd = d + w
+            if nd < dist.get(j, float("inf")):
+                dist[j] = nd
+                heapq.heappush(heap, (nd, j))
+
+    return dist
+
+def contract_graph(graph, weights, settle_limit = 100):
+    """Contract every node of a routing graph (from routing_engine.build_csr_graph) for one set of edge weights.
+
+Returns a dict of numpy arrays, see INDEX_ARRAYS. Arcs are the original edges followed by the shortcuts;
+a shortcut is made of two arcs (arc_first, arc_second), and an original edge has arc_first = -1 and its row in arc_edge_row.
+For each node, up_arcs are its arcs to more important nodes and down_arcs its arcs from more important nodes.
+up_heads, up_weights, down_tails and down_weights repeat the other end and the weight of these arcs, so queries only read slices.
+"""
+    num_nodes = len(graph["node_ids"])
+
+    arc_tail, arc_head, arc_weight, arc_first, arc_second, arc_edge_row = [], [], [], [], [], []
+
+    # the remaining graph: out[u][v] = inn[v][u] = (weight, arc)
+    out = [dict() for _ in range(num_nodes)]
+    inn = [dict() for _ in range(num_nodes)]
+
+    def add_arc(u, v, w, first, second, edge_row):
+        if (u == v) or ((v in out[u]) and (out[u][v][0] <= w)):
+            return
+        arc_tail.append(u)
+        arc_head.append(v)
+        arc_weight.append(w)
+        arc_first.append(first)
+        arc_second.append(second)
+        arc_edge_row.append(edge_row)
+        out[u][v] = inn[v][u] = (w, len(arc_tail) - 1)
+
+    for u, v, w, edge_row in zip(graph["tails"].tolist(), graph["heads"].tolist(), weights.tolist(), graph["edge_rows"].tolist()):
+        add_arc(u, v, w, -1, -1, edge_row)
+
+    def shortcuts_needed(v):
+        shortcuts = []
+        for u, (w_in, arc_in) in inn[v].items():
+            targets = {x: w_in + w_out for x, (w_out, _) in out[v].items() if x != u}
+            if not targets:
+                continue
+            dist = witness_distances(out, u, v, targets, settle_limit)
+            for x, via in targets.items():
+                if dist.get(x, float("inf")) > via:
+                    shortcuts.append((u, x, via, arc_in, out[v][x][1]))
+        return shortcuts
+
+    contracted_neighbors = [0] * num_nodes
+
+    def priority(v, shortcuts):
+        return len(shortcuts) - len(inn[v]) - len(out[v]) + contracted_neighbors[v]
+
+    heap = [(priority(v, shortcuts_needed(v)), v) for v in range(num_nodes)]
+    heapq.heapify(heap)
+
+    up_arcs = [None] * num_nodes
+    down_arcs = [None] * num_nodes
+
+    while heap:
+        _, v = heapq.heappop(heap)
+
+        # lazy update: contract v only if it is still the least important node
+        shortcuts = shortcuts_needed(v)
+        p = priority(v, shortcuts)
+        if heap and (p > heap[0][0]):
+            heapq.heappush(heap, (p, v))
+            continue
+
+        up_arcs[v] = [arc for _, arc in out[v].values()]
+        down_arcs[v] = [arc for _, arc in inn[v].values()]
+
+        for x in out[v]:
+            del inn[x][v]
+            contracted_neighbors[x] += 1
+        for u in inn[v]:
+            del out[u][v]
+            contracted_neighbors[u] += 1
+        out[v] = {}
+        inn[v] = {}
+
+        for u, x, w, arc_in, arc_out in shortcuts:
+            add_arc(u, x, w, arc_in, arc_out, -1)
+
+    up_indptr = np.zeros(num_nodes + 1, dtype = np.int64)
+    up_indptr[1:] = np.cumsum([len(arcs) for arcs in up_arcs])
+    down_indptr = np.zeros(num_nodes + 1, dtype = np.int64)
+    down_indptr[1:] = np.cumsum([len(arcs) for arcs in down_arcs])
+
+    up_arcs = np.array([arc for arcs in up_arcs for arc in arcs], dtype = np.int32)
+    down_arcs = np.array([arc for arcs in down_arcs for arc in arcs], dtype = np.int32)
+    arc_tail = np.array(arc_tail, dtype = np.int32)
+    arc_head = np.array(arc_head, dtype = np.int32)
+    arc_weight = np.array(arc_weight, dtype = float)
+
+    return {
+        "node_ids": graph["node_ids"],
+        "up_indptr": up_indptr,
+        "up_arcs": up_arcs,
+        "up_heads": arc_head[up_arcs],
+        "up_weights": arc_weight[up_arcs],
+        "down_indptr": down_indptr,
+        "down_arcs": down_arcs,
+        "down_tails": arc_tail[down_arcs],
+        "down_weights": arc_weight[down_arcs],
+        "arc_tail": arc_tail,
+        "arc_head": arc_head,
+        "arc_weight": arc_weight,
+        "arc_first": np.array(arc_first, dtype = np.int32),
+        "arc_second": np.array(arc_second, dtype = np.int32),
+        "arc_edge_row": np.array(arc_edge_row, dtype = np.int32),
+    }
+
+def index_path(mode, beta, index_folder = INDEX_FOLDER):
+    """mode: "b" for the cycling network, "w" for the walking network."""
+    return os.path.join(index_folder, f"G{mode}_beta{beta:g}")
+
+def save_index(index, mode, beta, folder = FOLDER, index_folder = INDEX_FOLDER):
+    """Write an index as .npy files, with the hash of the edges it was built from."""
+    path = index_path(mode, beta, index_folder)
+    os.makedirs(path, exist_ok = True)
+
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), index[name])
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"beta": beta, "edges_hash": file_hash(folder + f"G{mode}_edges.feather")}, f)
+
+def load_index(mode, beta, folder = FOLDER, index_folder = INDEX_FOLDER):
+    """Memory-map a saved index. Returns None if there is no index for this Beta, or if the edges changed since it was built."""
+    path = index_path(mode, beta, index_folder)
+
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["edges_hash"] != file_hash(folder + f"G{mode}_edges.feather"):
+            return None
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode = "r") for name in INDEX_ARRAYS}
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return None
+
+def unpack_arcs(index, arcs):
+    """Replace shortcuts by the original edges they stand for. Returns the original arcs in path order."""
+    arc_first, arc_second = index["arc_first"], index["arc_second"]
+
+    original = []
+    stack = arcs[::-1]
+    while stack:
+        a = stack.pop()
+        if arc_first[a] < 0:
+            original.append(a)
+        else:
+            stack.append(int(arc_second[a]))
+            stack.append(int(arc_first[a]))
+
+    return original
+
+def ch_shortest_path(index, node_o, node_d):
+    """Lowest-objective path between two nodes (osmids), for the Beta the index was built for.
+
+Returns (path_nodes, edge_rows), like routing_engine.shortest_path. Raises ValueError if the destination cannot be reached.
+"""
+    source, target = node_positions(index, [node_o, node_d])
+    source, target = int(source), int(target)
+
+    # side 0 searches forward from the origin on up arcs, side 1 backward from the destination on down arcs
+    indptrs = (index["up_indptr"], index["down_indptr"])
+    arc_lists = (index["up_arcs"], index["down_arcs"])
+    ends = (index["up_heads"], index["down_tails"])
+    arc_weights = (index["up_weights"], index["down_weights"])
+
+    dist = ({source: 0.0}, {target: 0.0})
+    parent = ({source: -1}, {target: -1})
+    settled = (set(), set())
+    heaps = ([(0.0, source)], [(0.0, target)])
+
+    best = 0.0 if source == target else float("inf")
+    meeting_node = source if source == target else -1
+
+    while heaps[0] or heaps[1]:
+        side = 0 if (heaps[0] and ((not heaps[1]) or (heaps[0][0][0] <= heaps[1][0][0]))) else 1
+        d, i = heapq.heappop(heaps[side])
+
+        if d >= best:
+            # nothing shorter can be found from this side
+            heaps[side].clear()
+            continue
+        if i in settled[side]:
+            continue
+        settled[side].add(i)
+
+        if i in dist[1 - side]:
+            total = d + dist[1 - side][i]
+            if total < best:
+                best = total
+                meeting_node = i
+
+        start, stop = indptrs[side][i], indptrs[side][i + 1]
+        for a, j, w in zip(arc_lists[side][start:stop].tolist(), ends[side][start:stop].tolist(), arc_weights[side][start:stop].tolist()):
+            nd = d + w
+            if nd < dist[side].get(j, float("inf")):
+                dist[side][j] = nd
+                parent[side][j] = a
+                heapq.heappush(heaps[side], (nd, j))
+
+    if meeting_node < 0:
+        raise ValueError(f"No path from node {node_o} to node {node_d}.")
+
+    arcs = []
+    i = meeting_node
+    while parent[0][i] >= 0:
+        a = parent[0][i]
+        arcs.append(a)
+        i = int(index["arc_tail"][a])
+    arcs.reverse()
+
+    i = meeting_node
+    while parent[1][i] >= 0:
+        a = parent[1][i]
+        arcs.append(a)
+        i = int(index["arc_head"][a])
+
+    original = unpack_arcs(index, arcs)
+
+    path_nodes = [index["node_ids"][source]] + [index["node_ids"][index["arc_head"][a]] for a in original]
+
+    return [int(n) for n in path_nodes], index["arc_edge_row"][original]
+
+if __name__ == "__main__":
+    import time
+    import geopandas as gpd
+
+    from routing_engine import build_csr_graph
+
+    # the Betas shown in Find Routes
+    betas = [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0]
+
+    for mode in ("b", "w"):
+        edges = gpd.read_feather(FOLDER + f"G{mode}_edges.feather")
+        nodes = gpd.read_feather(FOLDER + f"G{mode}_nodes.feather")
+        graph = build_csr_graph(edges, nodes)
+
+        for beta in betas:
+            t0 = time.perf_counter()
+            index = contract_graph(graph, objective_weights(graph, beta))
+            save_index(index, mode, beta)
+
+            num_shortcuts = int((index["arc_first"] >= 0).sum())
+            print(f"G{mode}, Beta={beta}: {num_shortcuts} shortcuts, built in {time.perf_counter() - t0:.1f} s")
@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import as_completed
+
+import pandas as pd
+import numpy as np
+import shapely
+
+from routing_engine import build_csr_graph, node_positions, objective_weights, dijkstra
+from shared_arrays import share_graph, attached_graph
+
+# City and barangay curves in the format of city_*_results.csv and brgy_*_results.csv, computed from shortest-path trees.
+# For every sampled origin and Beta, one search gives the lowest-objective route to every node. The length and discomfort
+# of these routes are summed along the tree for all nodes at once, and the expected values over all OD pairs of the
+# sampled nodes are probability-weighted reductions of the resulting matrices. This follows the path-by-path loop of
+# `expected_values_from_optimal_paths` in notebook 08, but it does not reproduce the committed CSVs: those used the demand
+# probabilities of notebook 05 (not in this repository) and the notebook's own barangay truncation and node sample, while
+# the defaults here are uniform probabilities and the truncation and sample of barangay_nodes and brgy_curve_inputs.
+# The graph of each network (or barangay) is built once; a Beta only changes the weight array, so Betas can be evaluated
+# concurrently by worker processes that share one copy of the graph.
+# Curves for other discomfort weights (see edges_with_discomfort) are kept in an on-disk cache keyed by the weights,
+# one CSV for the city and one per barangay, so every session can reuse them.
+# Run `python curve_analysis.py [output_folder] [beta_max num_betas]` from the repository root to recompute all the curves
+# with uniform probabilities, e.g. `python curve_analysis.py discomfort_and_curve_data/ 10 200` for 200 Betas from 0 to 10
+# (default: the Betas below). They are written to *_results_uniform.csv, next to (not over) the committed results.
+
+FOLDER = "discomfort_and_curve_data/"
+
+BETAS = [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0]
+
+# the barangay curves use fewer Betas and 10 sampled nodes per barangay (see notebook 08)
+BRGY_BETAS = [0.0, 1.0, 2.0, 3.0]
+
+N_SAMPLE_BRGY = 10
+
+CURVE_CACHE_FOLDER = FOLDER + "curve_cache/"
+
+def edges_with_discomfort(edges, scores):
+    """Edges with length and DISCOMFORT_WEIGHTED_BY_BETA recomputed from discomfort scores, e.g. from other weights.
+
+scores: score_weighted_by_main of every edge (Series indexed by (u, v, key)). As in notebook 08, the scores are
+min-max scaled to [0, 1] and multiplied by the length, which gives the discomfort term for Beta = 1.
+"""
+    score = scores.reindex(edges.index).to_numpy(dtype = float)
+    scaled = (score - np.nanmin(score)) / (np.nanmax(score) - np.nanmin(score))
+
+    result = pd.DataFrame({"length": edges["length"].to_numpy(dtype = float)}, index = edges.index)
+    result["DISCOMFORT_WEIGHTED_BY_BETA"] = scaled * result["length"].to_numpy()
+
+    return result
+
+def tree_costs(graph, pred, values):
+    """Sum of `values` (one per CSR entry) along the shortest-path tree `pred` (from dijkstra), from the root to every node.
+
+Uses pointer jumping: every node adds the sum of its current ancestor and then jumps to that ancestor's ancestor,
+so all the sums are done after log2(depth of the tree) vectorized steps. Nodes not in the tree get 0.
+"""
+    in_tree = pred >= 0
+    entries = pred[in_tree]
+
+    ancestor = np.arange(len(pred))
+    ancestor[in_tree] = graph["tails"][entries]
+    total = np.zeros(len(pred))
+    total[in_tree] = values[entries]
+
+    while True:
+        next_ancestor = ancestor[ancestor]
+        if np.array_equal(next_ancestor, ancestor):
+            break
+        total = total + total[ancestor]
+        ancestor = next_ancestor
+
+    return total
+
+def od_cost_matrices(graph, sampled_nodes, beta):
+    """Length and discomfort (weighted by Beta = 1) of the lowest-objective route between every pair of sampled nodes (osmids).
+
+Returns two arrays of shape (len(sampled_nodes), len(sampled_nodes)), with origins along the rows. Unreachable pairs are NaN.
+"""
+    positions = node_positions(graph, sampled_nodes)
+    weights = objective_weights(graph, beta)
+
+    lengths = np.full((len(positions), len(positions)), np.nan)
+    discomforts = np.full((len(positions), len(positions)), np.nan)
+
+    for k, source in enumerate(positions):
+        dist, pred = dijkstra(graph, weights, source)
+        reached = np.isfinite(dist[positions])
+        lengths[k, reached] = tree_costs(graph, pred, graph["length"])[positions[reached]]
+        discomforts[k, reached] = tree_costs(graph, pred, graph["discomfort"])[positions[reached]]
+
+    return lengths, discomforts
+
+def expected_values(graph, sampled_nodes, lengths, discomforts, beta, probability = None):
+    """Expected relative distance and relative discomfort over all OD pairs of the sampled nodes, as in notebook 08.
+
+probability: Series mapping sampled nodes to their probability of being an origin or destination (uniform if None).
+The probability of an OD pair is the product of the two, normalized over the pairs used.
+Pairs with the same origin and destination are not used, and neither are pairs without a route or with a route of zero length.
+
+Returns a dict with relative_distance, relative_discomfort_weighted and relative_discomfort.
+"""
+    if probability is None:
+        p = np.ones(len(sampled_nodes))
+    else:
+        p = probability.reindex(sampled_nodes).fillna(0).to_numpy(dtype = float)
+
+    positions = node_positions(graph, sampled_nodes)
+    xy = graph["xy"][positions]
+    straight_line = np.hypot(xy[:, None, 0] - xy[None, :, 0], xy[:, None, 1] - xy[None, :, 1])
+
+    used = (straight_line > 0) & np.isfinite(lengths) & (lengths > 0)
+    np.fill_diagonal(used, False)
+
+    joint = np.where(used, np.outer(p, p), 0)
+    joint = joint / joint.sum()
+
+    lengths = np.where(used, lengths, 1)
+    relative_discomfort = (joint * np.where(used, discomforts, 0) / lengths).sum()
+
+    return {
+        "relative_distance": (joint * lengths / np.where(used, straight_line, 1)).sum(),
+        "relative_discomfort_weighted": beta * relative_discomfort, # note this only matters for how the optimization worked but doesnt matter at all for interpretation
+        "relative_discomfort": relative_discomfort,
+    }
+
+def curve_row(graph, sampled_nodes, beta, probability = None):
+    """Expected values for one Beta, as a row of city_*_results.csv."""
+    lengths, discomforts = od_cost_matrices(graph, sampled_nodes, beta)
+    return {"beta": float(beta), **expected_values(graph, sampled_nodes, lengths, discomforts, beta, probability)}
+
+def curve_row_on_shared_graph(task):
+    """Worker: curve_row on a graph in shared memory."""
+    spec, sampled_nodes, beta, probability = task
+
+    with attached_graph(spec) as graph:
+        return curve_row(graph, sampled_nodes, beta, probability)
+
+def curve_results(graph, sampled_nodes, betas = BETAS, probability = None, executor = None):
+    """One row of expected values per Beta, in the format of city_*_results.csv, sorted by Beta.
+Betas can be any grid, e.g. np.linspace(0, 10, 200).
+
+executor: optional ProcessPoolExecutor. If given, the Betas are evaluated concurrently on one copy of the graph in shared memory.
+"""
+    betas = sorted(float(beta) for beta in betas)
+
+    if executor is None:
+        rows = [curve_row(graph, sampled_nodes, beta, probability) for beta in betas]
+
+    else:
+        with share_graph(graph) as spec:
+            rows = list(executor.map(curve_row_on_shared_graph, [(spec, sampled_nodes, beta, probability) for beta in betas]))
+
+    return pd.DataFrame(rows, columns = ["beta", "relative_distance", "relative_discomfort_weighted", "relative_discomfort"])
+
+def mask_exclude_nodes(nodes):
+    """Nodes that should not be sampled as origins or destinations: crossings, parking, private access and the like (see notebook 08)."""
+    exclude_notnull = [
+        f"TAG_{s}" for s in
+        ("crossing", "crossing:markings", "crossing:signals", "crossing:island", "traffic_signals", "traffic_signals:sound", "kerb", "crossing_ref", "traffic_calming", "traffic_calming:direction", "parking", "traffic_signals:vibration", "access:conditional")
+        if f"TAG_{s}" in nodes.columns
+    ]
+
+    false_mask = pd.Series([False] * nodes.shape[0], index = nodes.index)
+
+    mask1 = nodes["TAG_access"].isin(["private", "no", "customers", "delivery"]) if "TAG_access" in nodes.columns else false_mask
+    mask2 = nodes["TAG_amenity"].isin(["parking_entrance", "parking"]) if "TAG_amenity" in nodes.columns else false_mask
+    mask3 = nodes["TAG_highway"].isin(["crossing", "traffic_signals", "milestone", "stop", "give_way", "motor_junction", "elevator", "turning_circle"]) if "TAG_highway" in nodes.columns else false_mask
+
+    return (nodes[exclude_notnull].notnull().sum(axis = 1) > 0) | mask1 | mask2 | mask3
+
+def barangay_nodes(edges, nodes, polygon):
+    """Nodes of the network truncated to a barangay: the nodes in the polygon, and the nodes outside it with a neighbor inside it."""
+    inside = nodes.index[shapely.intersects_xy(polygon, nodes["x"].to_numpy(), nodes["y"].to_numpy())]
+
+    u = edges.index.get_level_values("u")
+    v = edges.index.get_level_values("v")
+    touching = u.isin(inside) | v.isin(inside)
+
+    return nodes.loc[nodes.index.isin(inside) | nodes.index.isin(u[touching]) | nodes.index.isin(v[touching])]
+
+def brgy_curve_inputs(edges, nodes, brgy_row, n_sample = N_SAMPLE_BRGY, random_state = 42):
+    """Network truncated to one barangay (a row of brgy_geo) and its sampled nodes.
+
+Returns (brgy_edges, brgy_nodes, sampled_nodes), with only the columns that build_csr_graph needs, so they are cheap to send to a worker.
+"""
+    brgy_nodes = barangay_nodes(edges, nodes, brgy_row["geometry"])
+
+    candidates = brgy_nodes.loc[~mask_exclude_nodes(brgy_nodes)]
+    sampled_nodes = candidates.sample(min(n_sample, len(candidates)), replace = False, random_state = random_state).index.tolist()
+
+    inside = edges.index.get_level_values("u").isin(brgy_nodes.index) & edges.index.get_level_values("v").isin(brgy_nodes.index)
+    brgy_edges = pd.DataFrame(edges.loc[inside, ["length", "DISCOMFORT_WEIGHTED_BY_BETA"]])
+
+    return brgy_edges, pd.DataFrame(brgy_nodes[["x", "y"]]), sampled_nodes
+
+def brgy_curve_task(task):
+    """Worker: the curves of one barangay, from the inputs of brgy_curve_inputs."""
+    brgy_edges, brgy_nodes, sampled_nodes, betas, probability, adm4_pcode, adm4_en = task
+
+    brgy_results = curve_results(build_csr_graph(brgy_edges, brgy_nodes), sampled_nodes, betas = betas, probability = probability)
+    brgy_results["adm4_pcode"] = adm4_pcode
+    brgy_results["adm4_en"] = adm4_en
+
+    return brgy_results[["relative_distance", "relative_discomfort_weighted", "relative_discomfort", "beta", "adm4_pcode", "adm4_en"]]
+
+def brgy_curve_results(edges, nodes, brgy_geo, betas = BRGY_BETAS, n_sample = N_SAMPLE_BRGY, probability = None, random_state = 42, executor = None):
+    """Curves per barangay, in the format of brgy_*_results.csv. Routes stay on the network truncated to each barangay.
+
+brgy_geo: barangay polygons (EPSG:4326) with adm4_pcode and adm4_en.
+
+executor: optional ProcessPoolExecutor, see curve_results.
+"""
+    results = []
+
+    for _, brgy_row in brgy_geo.iterrows():
+        brgy_edges, brgy_nodes, sampled_nodes = brgy_curve_inputs(edges, nodes, brgy_row, n_sample = n_sample, random_state = random_state)
+        graph = build_csr_graph(brgy_edges, brgy_nodes)
+
+        brgy_results = curve_results(graph, sampled_nodes, betas = betas, probability = probability, executor = executor)
+        brgy_results["adm4_pcode"] = brgy_row["adm4_pcode"]
+        brgy_results["adm4_en"] = brgy_row["adm4_en"]
+        results.append(brgy_results)
+
+    return pd.concat(results, ignore_index = True)[["relative_distance", "relative_discomfort_weighted", "relative_discomfort", "beta", "adm4_pcode", "adm4_en"]]
+
+def iter_brgy_curve_results(edges, nodes, brgy_geo, betas = BRGY_BETAS, n_sample = N_SAMPLE_BRGY, probability = None, random_state = 42, executor = None):
+    """Curves per barangay like brgy_curve_results, yielded one barangay at a time (as DataFrames) as soon as each is done.
+
+executor: optional ProcessPoolExecutor. If given, the barangays are computed concurrently, and yielded in the order they finish.
+"""
+    tasks = []
+    for _, brgy_row in brgy_geo.iterrows():
+        brgy_edges, brgy_nodes, sampled_nodes = brgy_curve_inputs(edges, nodes, brgy_row, n_sample = n_sample, random_state = random_state)
+        tasks.append((brgy_edges, brgy_nodes, sampled_nodes, list(betas), probability, brgy_row["adm4_pcode"], brgy_row["adm4_en"]))
+
+    if executor is None:
+        for task in tasks:
+            yield brgy_curve_task(task)
+
+    else:
+        futures = [executor.submit(brgy_curve_task, task) for task in tasks]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # if the caller stops early, do not leave the remaining barangays running
+            for future in futures:
+                future.cancel()
+
+def curve_cache_key(score_key, betas):
+    """Key of the cached curves for the discomfort scores with cache key `score_key` (see score_cache.score_cache_key) and a list of Betas."""
+    payload = json.dumps({"score_key": score_key, "betas": [float(beta) for beta in betas]}, sort_keys = True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def cached_curve_path(key, name, cache_folder = CURVE_CACHE_FOLDER):
+    """name: "city", or the adm4_pcode of a barangay."""
+    return os.path.join(cache_folder, key, f"{name}.csv")
+
+def load_cached_curve(key, name, cache_folder = CURVE_CACHE_FOLDER):
+    """Cached curve results, or None if they have not been computed yet."""
+    try:
+        return pd.read_csv(cached_curve_path(key, name, cache_folder))
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+
+def store_curve(key, name, results, cache_folder = CURVE_CACHE_FOLDER):
+    """Write curve results to the cache."""
+    path = cached_curve_path(key, name, cache_folder)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    results.to_csv(tmp_path, index = False)
+    # atomic, so other sessions never read a half-written file
+    os.replace(tmp_path, path)
+
+if __name__ == "__main__":
+    from concurrent.futures import ProcessPoolExecutor
+
+    import geopandas as gpd
+
+    from path_store import load_sampled_nodes
+
+    out_folder = sys.argv[1] if len(sys.argv) > 1 else FOLDER
+    brgy_geo = gpd.read_feather(FOLDER + "brgy_geo_for_city.feather")
+
+    if len(sys.argv) > 3:
+        city_betas = brgy_betas = np.linspace(0, float(sys.argv[2]), int(sys.argv[3])).round(6).tolist()
+    else:
+        city_betas, brgy_betas = BETAS, BRGY_BETAS
+
+    with ProcessPoolExecutor() as executor:
+        for mode, name in (("b", "bike"), ("w", "walk")):
+            edges = gpd.read_feather(FOLDER + f"G{mode}_edges.feather")
+            nodes = gpd.read_feather(FOLDER + f"G{mode}_nodes.feather")
+
+            t0 = time.perf_counter()
+            city_results = curve_results(build_csr_graph(edges, nodes), load_sampled_nodes(mode), betas = city_betas, executor = executor)
+            city_results.to_csv(out_folder + f"city_curve_analysis/city_{name}_results_uniform.csv", index = False)
+
+            brgy_results = brgy_curve_results(edges, nodes, brgy_geo, betas = brgy_betas, executor = executor)
+            brgy_results.to_csv(out_folder + f"brgy_curve_analysis/brgy_{name}_results_uniform.csv", index = False)
+
+            print(f"{name}: city and {brgy_results['adm4_pcode'].nunique()} barangay curves in {time.perf_counter() - t0:.1f} s")
@@ -0,0 +1,233 @@
+import sys
+import time
+from contextlib import nullcontext
+
+import pandas as pd
+import numpy as np
+from scipy.stats import norm
+
+from routing_engine import build_csr_graph, node_positions, objective_weights, dijkstra
+from shared_arrays import share_graph, attached_graph
+from curve_analysis import BETAS, BRGY_BETAS, tree_costs, mask_exclude_nodes, barangay_nodes
+
+# Curves estimated from randomly drawn OD pairs (Monte Carlo), with confidence intervals.
+# Instead of every pair of a fixed node sample (as in curve_analysis), origins and destinations are drawn from the demand
+# probabilities of the nodes. One search per origin and Beta routes it to several drawn destinations at once.
+# The expected values are kept as running sums, updated after every batch of origins, and the sampling stops as soon as the
+# confidence intervals of the relative distance and the relative discomfort are narrow enough for every Beta.
+# Run `python curve_sampling.py [output_folder] [precision]` from the repository root to estimate the city and barangay curves.
+# The demand probabilities (demand_bike.csv and demand_walk.csv from notebook 05, with osmid and probability columns)
+# are read from discomfort_and_curve_data/ if present; otherwise every candidate node is equally likely.
+
+FOLDER = "discomfort_and_curve_data/"
+
+DEMAND_FILES = {
+    "b": FOLDER + "demand_bike.csv",
+    "w": FOLDER + "demand_walk.csv",
+}
+
+# the running sums kept per Beta; origins are the sampling units, and the pairs of an origin are summed together
+SUM_NAMES = ["origins", "n", "nn", "distance", "distance_sq", "distance_n", "discomfort", "discomfort_sq", "discomfort_n"]
+
+def load_demand_probability(mode):
+    """Probability of each node (osmid) being an origin or destination, or None if there is no demand file for this mode."""
+    try:
+        return pd.read_csv(DEMAND_FILES[mode]).set_index("osmid")["probability"]
+    except FileNotFoundError:
+        return None
+
+def node_probability(candidates, probability = None):
+    """Probability of each candidate node (osmids) being an origin or destination, normalized over the candidates
+like get_sample_node_probability_series in notebook 08. Uniform if probability is None.
+All zero if there are no candidates or none of them has a positive probability.
+"""
+    if probability is None:
+        p = np.ones(len(candidates))
+    else:
+        p = probability.reindex(candidates).fillna(0).to_numpy(dtype = float)
+
+    total = p.sum()
+    return pd.Series(p / total if total > 0 else np.zeros(len(candidates)), index = candidates)
+
+def origin_samples(graph, source, targets, betas):
+    """Relative distance and relative discomfort of the lowest-objective routes from one origin to drawn destinations, for every Beta.
+
+source and targets are node positions. Returns two arrays of shape (len(betas), len(targets)), NaN for the pairs that
+are not used in the expected values (see curve_analysis.expected_values): no route, a route of zero length or the same location.
+"""
+    xy = graph["xy"]
+    straight_line = np.hypot(xy[targets, 0] - xy[source, 0], xy[targets, 1] - xy[source, 1])
+
+    relative_distances = np.full((len(betas), len(targets)), np.nan)
+    relative_discomforts = np.full((len(betas), len(targets)), np.nan)
+
+    for b, beta in enumerate(betas):
+        dist, pred = dijkstra(graph, objective_weights(graph, beta), source)
+        lengths = tree_costs(graph, pred, graph["length"])[targets]
+        discomforts = tree_costs(graph, pred, graph["discomfort"])[targets]
+
+        used = np.isfinite(dist[targets]) & (straight_line > 0) & (lengths > 0)
+        relative_distances[b, used] = lengths[used] / straight_line[used]
+        relative_discomforts[b, used] = discomforts[used] / lengths[used]
+
+    return relative_distances, relative_discomforts
+
+def origin_samples_on_shared_graph(task):
+    """Worker: origin_samples on a graph in shared memory."""
+    spec, source, targets, betas = task
+
+    with attached_graph(spec) as graph:
+        return origin_samples(graph, source, targets, betas)
+
+def update_sums(sums, relative_distances, relative_discomforts):
+    """Add the samples of one origin (arrays from origin_samples) to the running sums."""
+    n = np.isfinite(relative_distances).sum(axis = 1)
+    distance = np.nansum(relative_distances, axis = 1)
+    discomfort = np.nansum(relative_discomforts, axis = 1)
+
+    sums["origins"] += 1
+    sums["n"] += n
+    sums["nn"] += n * n
+    sums["distance"] += distance
+    sums["distance_sq"] += distance * distance
+    sums["distance_n"] += distance * n
+    sums["discomfort"] += discomfort
+    sums["discomfort_sq"] += discomfort * discomfort
+    sums["discomfort_n"] += discomfort * n
+
+def ratio_estimates(sums, name, z):
+    """Estimate (mean over all used pairs) and confidence interval half-width of `name` ("distance" or "discomfort") for every Beta.
+
+The pairs of one origin are correlated, so the variance is that of a ratio estimator with the origins as clusters.
+"""
+    m = sums["origins"]
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        estimate = sums[name] / sums["n"]
+        # sum over the origins of (sum of the values - estimate * number of pairs)^2
+        residual_sq = sums[f"{name}_sq"] - 2 * estimate * sums[f"{name}_n"] + estimate ** 2 * sums["nn"]
+        variance = np.maximum(residual_sq, 0) / (m * (m - 1) * (sums["n"] / m) ** 2) if m > 1 else np.full(len(estimate), np.inf)
+
+    # no interval without an estimate (no usable pairs)
+    return estimate, np.where(np.isnan(estimate), np.nan, z * np.sqrt(variance))
+
+def sampled_curve_results(graph, candidates, betas = BETAS, probability = None, precision = 0.01, confidence = 0.95,
+                          destinations_per_origin = 20, origins_per_batch = 10, min_origins = 20, max_origins = 1000,
+                          random_state = 42, executor = None):
+    """One row of estimated expected values per Beta, in the format of city_*_results.csv, with confidence intervals.
+
+candidates: nodes (osmids) that can be drawn as origins or destinations. probability: see node_probability.
+
+Origins are drawn in batches of `origins_per_batch`, each with `destinations_per_origin` destinations. Sampling stops once
+the confidence interval half-widths of relative distance and relative discomfort are at most `precision` times the estimates
+for every Beta (after at least `min_origins` origins), or after `max_origins` origins. It also stops after `min_origins`
+origins if none of the drawn pairs could be used (e.g. no connected pairs), and nothing is drawn if no candidate has a
+positive probability; the estimates are then NaN with n_pairs 0.
+
+executor: optional ProcessPoolExecutor. If given, the origins of a batch are routed concurrently on one copy of the graph in shared memory.
+
+Returns a DataFrame with beta, relative_distance, relative_discomfort_weighted, relative_discomfort, the half-widths
+relative_distance_ci and relative_discomfort_ci, n_origins and n_pairs (the pairs used).
+"""
+    betas = sorted(float(beta) for beta in betas)
+    z = norm.ppf(0.5 + confidence / 2)
+
+    p = node_probability(list(candidates), probability)
+    positions = node_positions(graph, p.index.to_numpy())
+    rng = np.random.default_rng(random_state)
+
+    sums = {name: np.zeros(len(betas)) for name in SUM_NAMES}
+    sums["origins"] = 0
+
+    # the graph is only shared with worker processes if there are any
+    with (share_graph(graph) if executor is not None else nullcontext()) as spec:
+        # no candidate can be drawn
+        if p.sum() == 0:
+            max_origins = 0
+
+        while sums["origins"] < max_origins:
+            batch_size = min(origins_per_batch, max_origins - sums["origins"])
+            sources = rng.choice(positions, size = batch_size, p = p.to_numpy())
+            targets = rng.choice(positions, size = (batch_size, destinations_per_origin), p = p.to_numpy())
+
+            if executor is None:
+                batch = (origin_samples(graph, source, origin_targets, betas) for source, origin_targets in zip(sources, targets))
+            else:
+                batch = executor.map(origin_samples_on_shared_graph, [(spec, source, origin_targets, betas) for source, origin_targets in zip(sources, targets)])
+
+            for relative_distances, relative_discomforts in batch:
+                update_sums(sums, relative_distances, relative_discomforts)
+
+            if sums["origins"] >= min_origins:
+                if np.all(sums["n"] == 0):
+                    break
+
+                relative_distance, relative_distance_ci = ratio_estimates(sums, "distance", z)
+                relative_discomfort, relative_discomfort_ci = ratio_estimates(sums, "discomfort", z)
+                if np.all(relative_distance_ci <= precision * relative_distance) and np.all(relative_discomfort_ci <= precision * relative_discomfort):
+                    break
+
+    relative_distance, relative_distance_ci = ratio_estimates(sums, "distance", z)
+    relative_discomfort, relative_discomfort_ci = ratio_estimates(sums, "discomfort", z)
+
+    return pd.DataFrame({
+        "beta": betas,
+        "relative_distance": relative_distance,
+        "relative_discomfort_weighted": np.asarray(betas) * relative_discomfort, # note this only matters for how the optimization worked but doesnt matter at all for interpretation
+        "relative_discomfort": relative_discomfort,
+        "relative_distance_ci": relative_distance_ci,
+        "relative_discomfort_ci": relative_discomfort_ci,
+        "n_origins": sums["origins"],
+        "n_pairs": sums["n"].astype(int),
+    })
+
+def sampled_brgy_curve_results(edges, nodes, brgy_geo, betas = BRGY_BETAS, probability = None, executor = None, **kwargs):
+    """Estimated curves per barangay, in the format of brgy_*_results.csv with the columns of sampled_curve_results.
+Routes stay on the network truncated to each barangay, and origins and destinations are drawn from its nodes.
+Barangays where no pair could be used have NaN estimates and n_pairs 0.
+
+brgy_geo: barangay polygons (EPSG:4326) with adm4_pcode and adm4_en. Other keyword arguments go to sampled_curve_results.
+"""
+    results = []
+
+    for _, brgy_row in brgy_geo.iterrows():
+        brgy_nodes = barangay_nodes(edges, nodes, brgy_row["geometry"])
+        graph = build_csr_graph(edges, brgy_nodes)
+
+        candidates = brgy_nodes.index[~mask_exclude_nodes(brgy_nodes)]
+
+        brgy_results = sampled_curve_results(graph, candidates, betas = betas, probability = probability, executor = executor, **kwargs)
+        brgy_results["adm4_pcode"] = brgy_row["adm4_pcode"]
+        brgy_results["adm4_en"] = brgy_row["adm4_en"]
+        results.append(brgy_results)
+
+    return pd.concat(results, ignore_index = True)
+
+if __name__ == "__main__":
+    from concurrent.futures import ProcessPoolExecutor
+
+    import geopandas as gpd
+
+    out_folder = sys.argv[1] if len(sys.argv) > 1 else FOLDER
+    precision = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    brgy_geo = gpd.read_feather(FOLDER + "brgy_geo_for_city.feather")
+
+    with ProcessPoolExecutor() as executor:
+        for mode, name in (("b", "bike"), ("w", "walk")):
+            edges = gpd.read_feather(FOLDER + f"G{mode}_edges.feather")
+            nodes = gpd.read_feather(FOLDER + f"G{mode}_nodes.feather")
+            probability = load_demand_probability(mode)
+
+            t0 = time.perf_counter()
+            candidates = nodes.index[~mask_exclude_nodes(nodes)]
+            city_results = sampled_curve_results(build_csr_graph(edges, nodes), candidates, probability = probability, precision = precision, executor = executor)
+            city_results.to_csv(out_folder + f"city_curve_analysis/city_{name}_results_sampled.csv", index = False)
+
+            brgy_results = sampled_brgy_curve_results(edges, nodes, brgy_geo, probability = probability, precision = precision, executor = executor)
+            brgy_results.to_csv(out_folder + f"brgy_curve_analysis/brgy_{name}_results_sampled.csv", index = False)
+
+            print(f"{name}: {city_results['n_origins'].iloc[0]} city origins, {brgy_results.groupby('adm4_pcode')['n_origins'].first().sum()} barangay origins in {time.perf_counter() - t0:.1f} s")
+
+            no_pairs = brgy_results.groupby("adm4_en")["n_pairs"].max()
+            if (no_pairs == 0).any():
+                print(f"{name}: no usable pairs in {', '.join(no_pairs.index[no_pairs == 0])}")
@@ -0,0 +1,524 @@
+import pandas as pd
+import numpy as np
+
+from discomfort_score_metadata import LEVEL_SCORES
+
+# Columnar versions of the discomfort scoring rules.
+# Every function here works on whole edge tables at once instead of one row at a time.
+
+BIKE_MAIN_COMPONENT_REFERENCE = {
+    # the ff are based on the Feature groupings document
+    "DISMOUNT": ("DISMOUNT", ),
+    "convenience": ("bicycle", "ALLEY", "segregated", "PARKING_SUBTAGS", "foot", "FROM_IMAGES_road_condition"),
+    "attractiveness": ("FROM_IMAGES_greenery_ratio", ),
+    "traffic_safety": ("CYCLEWAY_CLASS", "CYCLEWAY_LANE_TYPE", "FROM_IMAGES_cycling_lane_coverage", "width", "maxspeed"),
+    "security": ("lit", "FROM_IMAGES_has_bicycle"),
+
+    # the ff are additional main components added in order to be able to use all of the subcomponents
+    "accident_risk": ("EDSA_accident_component", ),
+    "traffic_volume": ("highway", "motor_vehicle"),
+    "safety_of_sidewalks_and_crossings": ("sidewalk", "TAG_crossing"),
+}
+
+WALK_MAIN_COMPONENT_REFERENCE = {
+    # the ff are based on the Feature groupings document
+    "convenience": ("ALLEY", "foot", "segregated", "PARKING_SUBTAGS",
+                    "FROM_IMAGES_obstruction_density", "FROM_IMAGES_road_condition",),
+    "traffic_volume": ("highway", "motor_vehicle"),
+    "traffic_speed": ("width", "maxspeed", "FROM_IMAGES_has_traffic_light"),
+    "attractiveness": ("FROM_IMAGES_greenery_ratio", ),
+
+    # the ff are additional main components added in order to be able to use all of the subcomponents
+    "accident_risk": ("EDSA_accident_component", ),
+    "safety_of_sidewalks": ("sidewalk", "FROM_IMAGES_sidewalk_ratio", "lit"),
+    "safety_of_crossings": ("TAG_crossing", "FROM_IMAGES_has_crosswalk")
+}
+
+BIKE_SUBCOMPONENTS = (
+    "bicycle", "CYCLEWAY_CLASS", "CYCLEWAY_LANE_TYPE", "foot", "highway", "ALLEY", "width", "lit", "maxspeed",
+    "segregated", "sidewalk", "PARKING_SUBTAGS", "TAG_crossing", "EDSA_accident_component", "motor_vehicle",
+    "FROM_IMAGES_cycling_lane_coverage", "FROM_IMAGES_greenery_ratio", "FROM_IMAGES_has_bicycle", "FROM_IMAGES_road_condition",
+)
+
+WALK_SUBCOMPONENTS = (
+    "foot", "highway", "ALLEY", "width", "lit", "maxspeed", "segregated", "sidewalk", "PARKING_SUBTAGS",
+    "TAG_crossing", "EDSA_accident_component", "motor_vehicle",
+    "FROM_IMAGES_sidewalk_ratio", "FROM_IMAGES_greenery_ratio", "FROM_IMAGES_road_condition",
+    "FROM_IMAGES_has_traffic_light", "FROM_IMAGES_has_crosswalk", "FROM_IMAGES_obstruction_density",
+)
+
+DISMOUNT_PENALTY = 10
+
+def align_preproc(edges, preproc):
+    """Reorder a preproc_Gb/preproc_Gw table so that its rows line up with the rows of `edges`.
+
+This replaces the per-edge `preproc.loc[s.name]` lookups with a single join.
+Tables loaded with edge_store.load_aligned_preproc are already in the right order and are returned as they are."""
+    if preproc.index.equals(edges.index):
+        return preproc
+    return preproc.reindex(edges.index)
+
+def compile_level_table(levels):
+    """Turn a {level: score} dict into (levels Index, scores array). The scores array has a trailing 0 for unknown levels."""
+    return pd.Index(list(levels.keys()), dtype = object), np.append(np.array(list(levels.values()), dtype = float), 0)
+
+# (subcomponent, group) -> compiled table, built once from the level scores in discomfort_score_metadata
+RULE_TABLES = {
+    (name, group): compile_level_table(levels)
+    for name, groups in LEVEL_SCORES.items()
+    for group, levels in groups.items()
+}
+
+def level_score(name, group, level):
+    return LEVEL_SCORES[name][group][level]
+
+def lookup(values, table):
+    """Score each value with a compiled table. Values that are missing from the table score 0.
+
+Each distinct value is matched against the table once; the scores are then gathered by integer code.
+"""
+    levels, scores = table
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    # missing values have code -1, which picks the trailing -1 here and then the trailing 0 in scores
+    table_positions = np.append(levels.get_indexer(uniques), -1)
+    return scores[table_positions[codes]]
+
+def from_images(edges, col, factor = 1):
+    """Image-derived features are in the range 0-1; subtract 1 so they are non-positive. Missing values score 0."""
+    return ((edges[col] - 1) * factor).fillna(0).to_numpy(dtype = float)
+
+def is_alley(edges):
+    return ((edges["footway"] == "alley") | (edges["service"] == "alley")).to_numpy()
+
+def biking_subcomponents(edges, preproc_Gb):
+    """Compute the unweighted subcomponents of biking discomfort for every edge.
+
+edges: DataFrame of edges, indexed by (u, v, key).
+
+preproc_Gb: DataFrame from preproc_Gb.csv, indexed by (u, v, key). It does not need to be in the same order as `edges`.
+
+Returns a DataFrame with one column per subcomponent (the SU_ values, without prefix), and a boolean array that is True for dismount edges.
+"""
+
+    p = align_preproc(edges, preproc_Gb)
+
+    is_dismount = (p["bicycle_status"] == "dismount").to_numpy()
+
+    # lookup tables for the DISMOUNT branch
+    foot_dismount = lookup(edges["foot"], RULE_TABLES["foot", "DISMOUNT"])
+    highway_dismount = lookup(edges["highway"], RULE_TABLES["highway", "DISMOUNT"])
+    parking_dismount = (
+        lookup(p["parking_left_description"], RULE_TABLES["PARKING_SUBTAGS", "DISMOUNT"])
+        + lookup(p["parking_right_description"], RULE_TABLES["PARKING_SUBTAGS", "DISMOUNT"])
+    )
+    sidewalk_dismount = -(p["has_left_sidewalk_status"].to_numpy(dtype = float) + p["has_right_sidewalk_status"].to_numpy(dtype = float))
+
+    # lookup tables for the NON-DISMOUNT branch, can ride bike
+    # note that "no" here is not the actual value "no" but the default value for the bicycle info variable
+    bicycle_cycle = np.where((p["bicycle_status"] == "no").to_numpy(), 0, lookup(p["bicycle_status"], RULE_TABLES["bicycle", "CYCLE"]))
+    # check actual value of bicycle
+    bicycle_cycle = np.where((edges["bicycle"] == "no").to_numpy(), level_score("bicycle", "CYCLE", "no"), bicycle_cycle)
+
+    cycleway_class_cycle = lookup(p["cycleway_left_class"], RULE_TABLES["CYCLEWAY_CLASS", "CYCLE"]) + lookup(p["cycleway_right_class"], RULE_TABLES["CYCLEWAY_CLASS", "CYCLE"])
+
+    cycleway_lane_type_cycle = lookup(p["cycleway_left_lane_type"], RULE_TABLES["CYCLEWAY_LANE_TYPE", "CYCLE"]) + lookup(p["cycleway_right_lane_type"], RULE_TABLES["CYCLEWAY_LANE_TYPE", "CYCLE"])
+
+    foot_cycle = lookup(edges["foot"], RULE_TABLES["foot", "CYCLE"])
+    highway_cycle = lookup(edges["highway"], RULE_TABLES["highway", "CYCLE"])
+    parking_cycle = (
+        lookup(p["parking_left_description"], RULE_TABLES["PARKING_SUBTAGS", "CYCLE"])
+        + lookup(p["parking_right_description"], RULE_TABLES["PARKING_SUBTAGS", "CYCLE"])
+    )
+
+    alley = is_alley(edges)
+
+    # FROM IMAGE DATA
+    greenery_ratio = from_images(edges, "FROM_IMAGES_greenery_ratio")
+    # as in the per-row rules, FROM_IMAGES_has_bicycle overwrites the greenery ratio on cycleable edges when it is available,
+    # and the has_bicycle subcomponent itself stays 0.
+    has_bicycle_available = edges["FROM_IMAGES_has_bicycle"].notna().to_numpy()
+    greenery_ratio_cycle = np.where(has_bicycle_available, from_images(edges, "FROM_IMAGES_has_bicycle"), greenery_ratio)
+
+    zeros = np.zeros(len(edges))
+
+    subcomponents_unweighted = pd.DataFrame({
+        "bicycle": np.where(is_dismount, 0, bicycle_cycle),
+        "CYCLEWAY_CLASS": np.where(is_dismount, 0, cycleway_class_cycle),
+        "CYCLEWAY_LANE_TYPE": np.where(is_dismount, 0, cycleway_lane_type_cycle),
+        "foot": np.where(is_dismount, foot_dismount, foot_cycle),
+        "highway": np.where(is_dismount, highway_dismount, highway_cycle),
+        "ALLEY": np.where(alley, np.where(is_dismount, level_score("ALLEY", "DISMOUNT", "alley"), level_score("ALLEY", "CYCLE", "alley")), 0),
+        "width": p["width_comp"].to_numpy(dtype = float),
+        "lit": p["lit_comp"].to_numpy(dtype = float),
+        "maxspeed": p["maxspeed_comp"].to_numpy(dtype = float),
+        "segregated": p["segregated_comp"].to_numpy(dtype = float),
+        "sidewalk": np.where(is_dismount, sidewalk_dismount, 0),
+        "PARKING_SUBTAGS": np.where(is_dismount, parking_dismount, parking_cycle),
+        "TAG_crossing": p["crossing_tag_comp"].to_numpy(dtype = float),
+        "EDSA_accident_component": p["edsa_accident_comp"].to_numpy(dtype = float),
+        "motor_vehicle": p["motor_vehicle_comp"].to_numpy(dtype = float),
+
+        # FROM IMAGE DATA
+        "FROM_IMAGES_cycling_lane_coverage": np.where(is_dismount, 0, from_images(edges, "FROM_IMAGES_cycling_lane_coverage")),
+        "FROM_IMAGES_greenery_ratio": np.where(is_dismount, greenery_ratio, greenery_ratio_cycle),
+        "FROM_IMAGES_has_bicycle": zeros,
+        "FROM_IMAGES_road_condition": np.where(is_dismount, 0, from_images(edges, "FROM_IMAGES_road_condition")),
+    }, index = edges.index, columns = BIKE_SUBCOMPONENTS).astype(float)
+
+    return subcomponents_unweighted, is_dismount
+
+def walking_subcomponents(edges, preproc_Gw):
+    """Compute the unweighted subcomponents of walking discomfort for every edge.
+
+edges: DataFrame of edges, indexed by (u, v, key).
+
+preproc_Gw: DataFrame from preproc_Gw.csv, indexed by (u, v, key). It does not need to be in the same order as `edges`.
+
+Returns a DataFrame with one column per subcomponent (the SU_ values, without prefix).
+"""
+
+    p = align_preproc(edges, preproc_Gw)
+
+    subcomponents_unweighted = pd.DataFrame({
+        "foot": lookup(edges["foot"], RULE_TABLES["foot", "WALK"]),
+        "highway": lookup(edges["highway"], RULE_TABLES["highway", "WALK"]),
+        "ALLEY": np.where(is_alley(edges), level_score("ALLEY", "WALK", "alley"), 0),
+        "width": p["width_comp"].to_numpy(dtype = float),
+        "lit": p["lit_comp"].to_numpy(dtype = float),
+        "maxspeed": p["maxspeed_comp"].to_numpy(dtype = float),
+        "segregated": p["segregated_comp"].to_numpy(dtype = float),
+        "sidewalk": -(p["has_left_sidewalk_status"].to_numpy(dtype = float) + p["has_right_sidewalk_status"].to_numpy(dtype = float)),
+        "PARKING_SUBTAGS": lookup(p["parking_left_description"], RULE_TABLES["PARKING_SUBTAGS", "WALK"]) + lookup(p["parking_right_description"], RULE_TABLES["PARKING_SUBTAGS", "WALK"]),
+        "TAG_crossing": p["crossing_tag_comp"].to_numpy(dtype = float),
+        "EDSA_accident_component": p["edsa_accident_comp"].to_numpy(dtype = float),
+        "motor_vehicle": p["motor_vehicle_comp"].to_numpy(dtype = float),
+
+        # FROM IMAGE DATA
+        "FROM_IMAGES_sidewalk_ratio": from_images(edges, "FROM_IMAGES_sidewalk_ratio"),
+        "FROM_IMAGES_greenery_ratio": from_images(edges, "FROM_IMAGES_greenery_ratio"),
+        "FROM_IMAGES_road_condition": from_images(edges, "FROM_IMAGES_road_condition"),
+        "FROM_IMAGES_has_traffic_light": from_images(edges, "FROM_IMAGES_has_traffic_light", factor = 0.5),
+        "FROM_IMAGES_has_crosswalk": from_images(edges, "FROM_IMAGES_has_crosswalk"),
+        "FROM_IMAGES_obstruction_density": from_images(edges, "FROM_IMAGES_obstruction_density"),
+    }, index = edges.index, columns = WALK_SUBCOMPONENTS).astype(float)
+
+    return subcomponents_unweighted
+
+def scores_from_subcomponents(subcomponents_unweighted, subcomponent_weights, weights_main_components, main_component_reference, extra_weighted_subcomponents = None, details = False):
+    """Combine unweighted subcomponents into the final discomfort scores.
+
+subcomponent_weights: dict mapping subcomponent names to weights, or DataFrame with one weight per edge and subcomponent.
+
+extra_weighted_subcomponents: dict of already-weighted per-edge arrays that are added as subcomponents (e.g. DISMOUNT).
+
+Returns a DataFrame with score_weighted_by_main and score_weighted_by_sub, plus the SW_/SU_/MW_/MU_ columns if details is True.
+"""
+
+    if isinstance(subcomponent_weights, pd.DataFrame):
+        subcomponents_weighted = subcomponents_unweighted * subcomponent_weights[subcomponents_unweighted.columns].to_numpy()
+    else:
+        subcomponents_weighted = subcomponents_unweighted * np.array([subcomponent_weights[name] for name in subcomponents_unweighted.columns])
+
+    if extra_weighted_subcomponents is not None:
+        for name, values in extra_weighted_subcomponents.items():
+            subcomponents_weighted[name] = values
+
+    # take the sum of the WEIGHTED versions of the subcomponents, in order to get the UNweighted main component.
+    main_components_unweighted = pd.DataFrame({
+        key: subcomponents_weighted[list(l)].sum(axis = 1)
+        for key, l
+        in main_component_reference.items()
+    }, index = subcomponents_unweighted.index)
+
+    main_components_weighted = main_components_unweighted * np.array([weights_main_components[name] for name in main_components_unweighted.columns])
+
+    output = pd.DataFrame({
+        "score_weighted_by_main": main_components_weighted.sum(axis = 1),
+        "score_weighted_by_sub": subcomponents_weighted.sum(axis = 1),
+    }, index = subcomponents_unweighted.index)
+
+    if details:
+        output = pd.concat([
+            output,
+            subcomponents_weighted.add_prefix("SW_"),
+            subcomponents_unweighted.add_prefix("SU_"),
+            main_components_weighted.add_prefix("MW_"),
+            main_components_unweighted.add_prefix("MU_"),
+        ], axis = 1)
+
+    return output
+
+def biking_discomfort_columns(edges, weights_CYCLE, weights_DISMOUNT, weights_main_components, preproc_Gb, details = False):
+    """Compute biking discomfort for all rows of a dataframe of edges at once.
+
+weights_CYCLE, weights_DISMOUNT: dict. Subcomponent weights for cycleable and dismount edges. Missing subcomponents get a weight of 1.
+
+Gives the same values as applying the per-row biking_discomfort, choosing the DISMOUNT weights for dismount edges.
+"""
+
+    subcomponents_unweighted, is_dismount = biking_subcomponents(edges, preproc_Gb)
+
+    subcomponent_weights = pd.DataFrame({
+        name: np.where(is_dismount, weights_DISMOUNT.get(name, 1), weights_CYCLE.get(name, 1))
+        for name in BIKE_SUBCOMPONENTS
+    }, index = edges.index)
+
+    return scores_from_subcomponents(
+        subcomponents_unweighted,
+        subcomponent_weights,
+        weights_main_components,
+        BIKE_MAIN_COMPONENT_REFERENCE,
+        extra_weighted_subcomponents = {"DISMOUNT": np.where(is_dismount, DISMOUNT_PENALTY, 0).astype(float)},
+        details = details
+    )
+
+def walking_discomfort_columns(edges, weights, weights_main_components, preproc_Gw, details = False):
+    """Compute walking discomfort for all rows of a dataframe of edges at once.
+
+Gives the same values as applying the per-row walking_discomfort.
+"""
+
+    subcomponents_unweighted = walking_subcomponents(edges, preproc_Gw)
+
+    return scores_from_subcomponents(
+        subcomponents_unweighted,
+        weights,
+        weights_main_components,
+        WALK_MAIN_COMPONENT_REFERENCE,
+        details = details
+    )
+
+# SUBCOMPONENT BASIS
+# Every subcomponent is a fixed per-edge value multiplied by a weight, and every main component is a sum of those.
+# So once the unweighted subcomponents are known, a change of weights only needs a matrix-vector product.
+
+def main_component_coefficients(subcomponent_names, weights_main_components, main_component_reference):
+    """For each subcomponent, the total weight it receives through the main components that contain it."""
+    return np.array([
+        sum([weights_main_components[key] for key, l in main_component_reference.items() if name in l])
+        for name in subcomponent_names
+    ])
+
+def build_bike_basis(edges, preproc_Gb):
+    """Compute the unweighted subcomponent matrix of biking discomfort once, with cycle and dismount rows kept separate.
+
+Returns a dict that can be passed to rescore_bike_from_basis.
+"""
+    subcomponents_unweighted, is_dismount = biking_subcomponents(edges, preproc_Gb)
+    matrix = subcomponents_unweighted.to_numpy()
+
+    return {
+        "index": edges.index,
+        "columns": BIKE_SUBCOMPONENTS,
+        "is_dismount": is_dismount,
+        "CYCLE": matrix[~is_dismount],
+        "DISMOUNT": matrix[is_dismount],
+    }
+
+def build_walk_basis(edges, preproc_Gw):
+    """Compute the unweighted subcomponent matrix of walking discomfort once.
+
+Returns a dict that can be passed to rescore_walk_from_basis.
+"""
+    subcomponents_unweighted = walking_subcomponents(edges, preproc_Gw)
+
+    return {
+        "index": edges.index,
+        "columns": WALK_SUBCOMPONENTS,
+        "WALK": subcomponents_unweighted.to_numpy(),
+    }
+
+def rescore_bike_from_basis(basis, weights_CYCLE, weights_DISMOUNT, weights_main_components, rows = None):
+    """Biking discomfort scores for new weights, from a basis made by build_bike_basis.
+
+rows: optional slice or array of row positions, to score only those edges (e.g. one chunk at a time).
+
+Returns a DataFrame with score_weighted_by_main and score_weighted_by_sub, in the same row order as the edges used to build the basis.
+"""
+    columns = basis["columns"]
+    coefs = main_component_coefficients(columns, weights_main_components, BIKE_MAIN_COMPONENT_REFERENCE)
+
+    w_cycle = np.array([weights_CYCLE.get(name, 1) for name in columns])
+    w_dismount = np.array([weights_DISMOUNT.get(name, 1) for name in columns])
+
+    if rows is None:
+        is_dismount = basis["is_dismount"]
+        index = basis["index"]
+        cycle_matrix, dismount_matrix = basis["CYCLE"], basis["DISMOUNT"]
+    else:
+        positions = np.arange(len(basis["is_dismount"]))[rows]
+        is_dismount = basis["is_dismount"][positions]
+        index = basis["index"][positions]
+        # positions of the rows within the CYCLE and DISMOUNT matrices
+        cycle_matrix = basis["CYCLE"][(np.cumsum(~basis["is_dismount"]) - 1)[positions[~is_dismount]]]
+        dismount_matrix = basis["DISMOUNT"][(np.cumsum(basis["is_dismount"]) - 1)[positions[is_dismount]]]
+
+    score_weighted_by_main = np.empty(len(is_dismount))
+    score_weighted_by_sub = np.empty(len(is_dismount))
+
+    score_weighted_by_main[~is_dismount] = cycle_matrix @ (w_cycle * coefs)
+    score_weighted_by_sub[~is_dismount] = cycle_matrix @ w_cycle
+
+    score_weighted_by_main[is_dismount] = dismount_matrix @ (w_dismount * coefs) + DISMOUNT_PENALTY * weights_main_components["DISMOUNT"]
+    score_weighted_by_sub[is_dismount] = dismount_matrix @ w_dismount + DISMOUNT_PENALTY
+
+    return pd.DataFrame({
+        "score_weighted_by_main": score_weighted_by_main,
+        "score_weighted_by_sub": score_weighted_by_sub,
+    }, index = index)
+
+def rescore_walk_from_basis(basis, weights, weights_main_components, rows = None):
+    """Walking discomfort scores for new weights, from a basis made by build_walk_basis. See rescore_bike_from_basis for rows."""
+    columns = basis["columns"]
+    coefs = main_component_coefficients(columns, weights_main_components, WALK_MAIN_COMPONENT_REFERENCE)
+    w = np.array([weights[name] for name in columns])
+
+    if rows is None:
+        matrix, index = basis["WALK"], basis["index"]
+    else:
+        positions = np.arange(len(basis["index"]))[rows]
+        matrix, index = basis["WALK"][positions], basis["index"][positions]
+
+    return pd.DataFrame({
+        "score_weighted_by_main": matrix @ (w * coefs),
+        "score_weighted_by_sub": matrix @ w,
+    }, index = index)
+
+# BATCH SCORING OF WEIGHT PROFILES
+# A weight profile is a dict with the same weight dicts that are kept in session state:
+#   bike: {"weights_sub_bike_CYCLE": ..., "weights_sub_bike_DISMOUNT": ..., "weights_main_bike": ...}
+#   walk: {"weights_sub_walk": ..., "weights_main_walk": ...}
+
+def batch_rescore_bike_from_basis(basis, profiles, score = "score_weighted_by_main"):
+    """Biking discomfort for many weight profiles at once.
+
+profiles: dict mapping a profile name to a weight profile.
+
+score: "score_weighted_by_main" or "score_weighted_by_sub".
+
+Returns a DataFrame with one row per edge and one column per profile.
+"""
+    columns = basis["columns"]
+    is_dismount = basis["is_dismount"]
+    names = list(profiles.keys())
+
+    # one column of effective weights per profile
+    W_cycle = np.empty((len(columns), len(names)))
+    W_dismount = np.empty((len(columns), len(names)))
+    dismount_offset = np.empty(len(names))
+
+    for j, name in enumerate(names):
+        profile = profiles[name]
+        weights_main_components = profile["weights_main_bike"]
+
+        if score == "score_weighted_by_main":
+            coefs = main_component_coefficients(columns, weights_main_components, BIKE_MAIN_COMPONENT_REFERENCE)
+            dismount_offset[j] = DISMOUNT_PENALTY * weights_main_components["DISMOUNT"]
+        else:
+            coefs = np.ones(len(columns))
+            dismount_offset[j] = DISMOUNT_PENALTY
+
+        W_cycle[:, j] = np.array([profile["weights_sub_bike_CYCLE"].get(c, 1) for c in columns]) * coefs
+        W_dismount[:, j] = np.array([profile["weights_sub_bike_DISMOUNT"].get(c, 1) for c in columns]) * coefs
+
+    result = np.empty((len(is_dismount), len(names)))
+    result[~is_dismount] = basis["CYCLE"] @ W_cycle
+    result[is_dismount] = basis["DISMOUNT"] @ W_dismount + dismount_offset
+
+    return pd.DataFrame(result, index = basis["index"], columns = names)
+
+def batch_rescore_walk_from_basis(basis, profiles, score = "score_weighted_by_main"):
+    """Walking discomfort for many weight profiles at once. See batch_rescore_bike_from_basis."""
+    columns = basis["columns"]
+    names = list(profiles.keys())
+
+    W = np.empty((len(columns), len(names)))
+
+    for j, name in enumerate(names):
+        profile = profiles[name]
+        if score == "score_weighted_by_main":
+            coefs = main_component_coefficients(columns, profile["weights_main_walk"], WALK_MAIN_COMPONENT_REFERENCE)
+        else:
+            coefs = np.ones(len(columns))
+
+        W[:, j] = np.array([profile["weights_sub_walk"][c] for c in columns]) * coefs
+
+    return pd.DataFrame(basis["WALK"] @ W, index = basis["index"], columns = names)
+
+def summarize_profile_scores(score_matrix, weights = None):
+    """Summary statistics of each column of a score matrix from batch_rescore_*_from_basis.
+
+weights: optional per-edge weights (e.g. edge length) for the weighted mean.
+
+Returns a DataFrame with one row per profile.
+"""
+    values = score_matrix.to_numpy()
+
+    summary = pd.DataFrame({
+        "mean": values.mean(axis = 0) if weights is None else np.average(values, axis = 0, weights = np.asarray(weights)),
+        "std": values.std(axis = 0),
+        "min": values.min(axis = 0),
+        "p10": np.percentile(values, 10, axis = 0),
+        "median": np.median(values, axis = 0),
+        "p90": np.percentile(values, 90, axis = 0),
+        "max": values.max(axis = 0),
+    }, index = score_matrix.columns)
+    summary.index.name = "profile"
+
+    return summary
+
+# LAZY EXPLANATIONS
+# The bulk scoring path only produces the two scores. The full SW_/SU_/MW_/MU_ breakdown is computed
+# from the basis for the few edges that a user actually selects.
+
+def explain_bike_from_basis(basis, positions, weights_CYCLE, weights_DISMOUNT, weights_main_components):
+    """Full breakdown of biking discomfort for a few edges.
+
+positions: row positions of the edges (in the order of the edges used to build the basis).
+
+Returns the same columns as biking_discomfort_columns(..., details = True), for the selected edges only.
+"""
+    positions = np.asarray(positions, dtype = int)
+    is_dismount = basis["is_dismount"]
+    selected_dismount = is_dismount[positions]
+
+    # row of each edge within its own (cycle or dismount) block of the basis
+    row_in_group = np.where(is_dismount, np.cumsum(is_dismount) - 1, np.cumsum(~is_dismount) - 1)
+
+    su = np.empty((len(positions), len(basis["columns"])))
+    su[selected_dismount] = basis["DISMOUNT"][row_in_group[positions[selected_dismount]]]
+    su[~selected_dismount] = basis["CYCLE"][row_in_group[positions[~selected_dismount]]]
+
+    index = basis["index"][positions]
+    subcomponents_unweighted = pd.DataFrame(su, index = index, columns = basis["columns"])
+
+    subcomponent_weights = pd.DataFrame({
+        name: np.where(selected_dismount, weights_DISMOUNT.get(name, 1), weights_CYCLE.get(name, 1))
+        for name in basis["columns"]
+    }, index = index)
+
+    return scores_from_subcomponents(
+        subcomponents_unweighted,
+        subcomponent_weights,
+        weights_main_components,
+        BIKE_MAIN_COMPONENT_REFERENCE,
+        extra_weighted_subcomponents = {"DISMOUNT": np.where(selected_dismount, DISMOUNT_PENALTY, 0).astype(float)},
+        details = True
+    )
+
+def explain_walk_from_basis(basis, positions, weights, weights_main_components):
+    """Full breakdown of walking discomfort for a few edges. See explain_bike_from_basis."""
+    positions = np.asarray(positions, dtype = int)
+
+    subcomponents_unweighted = pd.DataFrame(basis["WALK"][positions], index = basis["index"][positions], columns = basis["columns"])
+
+    return scores_from_subcomponents(
+        subcomponents_unweighted,
+        weights,
+        weights_main_components,
+        WALK_MAIN_COMPONENT_REFERENCE,
+        details = True
+    )
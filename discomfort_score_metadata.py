@@ -1,5 +1,66 @@
 import streamlit as st
 
+# Scores of the categorical levels of subcomponents, per group of rules (CYCLE, DISMOUNT, WALK).
+# Levels are the values as they appear in the edge tags and in the preproc tables.
+# The scoring engine compiles these into lookup arrays, and the levels shown in the app are derived from them.
+LEVEL_SCORES = {
+    "bicycle": {
+        # "no" is the bicycle = no tag itself; a bicycle_status of "no" only means there is no information on access.
+        "CYCLE": {"yes": -3, "permissive": -2, "destination": -1, "no": 3},
+    },
+    "CYCLEWAY_CLASS": {
+        "CYCLE": {"class 1": -4, "class 2": -2, "class 3": -1, "unknown_but_one_of_the_two_must_exist": -1},
+    },
+    "CYCLEWAY_LANE_TYPE": {
+        "CYCLE": {"lane": -1, "shared_lane": 1, "unknown_but_one_of_the_two_must_exist": -1},
+    },
+    "foot": {
+        "CYCLE": {"yes": 1, "designated": 2},
+        "DISMOUNT": {"yes": -2, "designated": -1, "use_sidepath": 2},
+        "WALK": {"yes": -2, "designated": -1, "use_sidepath": 2},
+    },
+    "highway": {
+        "CYCLE": {"living_street": -4, "pedestrian": -3, "footway": -2, "path": -1, "residential": -0.5},
+        "DISMOUNT": {"footway": -4, "pedestrian": -3, "living_street": -2, "path": -1, "residential": -0.5},
+        "WALK": {"footway": -4, "pedestrian": -3, "living_street": -2, "path": -1, "residential": -0.5, "steps": 1},
+    },
+    "ALLEY": {
+        "CYCLE": {"not alley": 0, "alley": 1},
+        "DISMOUNT": {"alley": -1, "not alley": 0},
+        "WALK": {"alley": -1, "not alley": 0},
+    },
+    "PARKING_SUBTAGS": {
+        "CYCLE": {"no": -1, "half_on_kerb": 0.5, "lane": 1},
+        "DISMOUNT": {"no": -0.5, "half_on_kerb": 1, "lane": 0.5},
+        "WALK": {"no": -0.5, "half_on_kerb": 1, "lane": 0.5},
+    },
+}
+
+# How levels are shown in the app, where they differ from the data. Levels mapped to None are not shown.
+LEVEL_DISPLAY_NAMES = {
+    "CYCLEWAY_CLASS": {"unknown_but_one_of_the_two_must_exist": None},
+    "CYCLEWAY_LANE_TYPE": {"lane": "exclusive", "shared_lane": "shared", "unknown_but_one_of_the_two_must_exist": None},
+    "highway": {"living_street": "living street"},
+    "PARKING_SUBTAGS": {"no": "none", "half_on_kerb": "half-on-curb", "lane": "on street"},
+}
+
+# subcomponents scored separately for the left and right sides of the road
+TWO_SIDED_SUBCOMPONENTS = ("CYCLEWAY_CLASS", "CYCLEWAY_LANE_TYPE", "PARKING_SUBTAGS")
+
+def display_levels(name, group):
+    """Levels of a subcomponent as shown in the app, with their scores."""
+    levels = {}
+    for level, score in LEVEL_SCORES[name][group].items():
+        display_name = LEVEL_DISPLAY_NAMES.get(name, {}).get(level, level)
+        if display_name is None:
+            continue
+        if name in TWO_SIDED_SUBCOMPONENTS:
+            levels[f"left: {display_name}"] = score
+            levels[f"right: {display_name}"] = score
+        else:
+            levels[display_name] = score
+    return levels
+
 @st.cache_data(ttl = None, max_entries = 1)
 def load_discomfort_score_component_info():
     default_weights_subcomponents_bike_CYCLE = {
@@ -92,99 +153,43 @@ def load_discomfort_score_component_info():
         "bicycle": {
             "display_name": "Bicycle Access",
             "description": "Cyclist level of access. `destination` means that bicycles have legal right-of-way, but only if their destination is in that street or the immediate area; it is not for cyclist 'through traffic.' Note that even roads labeled `no` may, at times, be used by bikers especially if there is lax implementation of cyclist prohibition in the area.",
-            "levels_CYCLE": {
-                "yes": -3,
-                "permissive": -2,
-                "destination": -1,
-                "no": 3,
-            },
+            "levels_CYCLE": display_levels("bicycle", "CYCLE"),
             "INCLUDE_IN": {"CYCLE"},
         },
         "CYCLEWAY_CLASS": {
             "display_name": "Bike Lane Class",
             "description": "Philippine bike lane class.",
-            "levels_CYCLE": {
-                "left: class 1": -4,
-                "right: class 1": -4,
-                "left: class 2": -2,
-                "right: class 2": -2,
-                "left: class 3": -1,
-                "right: class 3": -1,
-            },
+            "levels_CYCLE": display_levels("CYCLEWAY_CLASS", "CYCLE"),
             "INCLUDE_IN": {"CYCLE"},
         },
         "CYCLEWAY_LANE_TYPE": {
             "display_name": "Shared Bike Lane",
             "description": "Whether the bike lane is shared with motorists or not. `exclusive` means it is only for cyclists.",
-            "levels_CYCLE": {
-                "left: exclusive": -1,
-                "right: exclusive": -1,
-                "left: shared": 1,
-                "right: shared": 1,
-            },
+            "levels_CYCLE": display_levels("CYCLEWAY_LANE_TYPE", "CYCLE"),
             "INCLUDE_IN": {"CYCLE"},
         },
         "foot": {
             "display_name": "Foot Path Type",
             "description": "Whether foot traffic is explicitly permitted (`yes`) or this street section is designated mainly for pedestrians (`designated`). In the **pedestrian network**, some roads are marked `use_sidepath`, which means there are times when pedestrians can walk on the road, but they are advised to use a different path on the side.",
-            "levels_CYCLE": {
-                "yes": 1,
-                "designated": 2,
-            },
-            "levels_DISMOUNT": {
-                "yes": -2,
-                "designated": -1,
-                "use_sidepath": 2,
-            },
-            "levels_WALK": {
-                "yes": -2,
-                "designated": -1,
-                "use_sidepath": 2,
-            },
+            "levels_CYCLE": display_levels("foot", "CYCLE"),
+            "levels_DISMOUNT": display_levels("foot", "DISMOUNT"),
+            "levels_WALK": display_levels("foot", "WALK"),
             "INCLUDE_IN": {"WALK", "CYCLE", "DISMOUNT"},
         },
         "highway": {
             "display_name": "Street Type",
             "description": "The type of street, if it is intended for pedestrians and/or cyclists. In the pedestrian network, paths marked `steps` indicate that one must use stairs, such as stairs at a footbridge.",
-            "levels_CYCLE": {
-                "living street": -4,
-                "pedestrian": -3,
-                "footway": -2,
-                "path": -1,
-                "residential": -0.5,
-            },
-            "levels_DISMOUNT": {
-                "footway": -4,
-                "pedestrian": -3,
-                "living street": -2,
-                "path": -1,
-                "residential": -0.5,
-            },
-            "levels_WALK": {
-                "footway": -4,
-                "pedestrian": -3,
-                "living street": -2,
-                "path": -1,
-                "residential": -0.5,
-                "steps": 1,
-            },
+            "levels_CYCLE": display_levels("highway", "CYCLE"),
+            "levels_DISMOUNT": display_levels("highway", "DISMOUNT"),
+            "levels_WALK": display_levels("highway", "WALK"),
             "INCLUDE_IN": {"WALK", "CYCLE", "DISMOUNT"},
         },
         "ALLEY": {
             "display_name": "Alley",
             "description": "Whether or not a street is an alley.",
-            "levels_CYCLE": {
-                "not alley": 0,
-                "alley": 1,
-            },
-            "levels_DISMOUNT": {
-                "alley": -1,
-                "not alley": 0,
-            },
-            "levels_WALK": {
-                "alley": -1,
-                "not alley": 0,
-            },
+            "levels_CYCLE": display_levels("ALLEY", "CYCLE"),
+            "levels_DISMOUNT": display_levels("ALLEY", "DISMOUNT"),
+            "levels_WALK": display_levels("ALLEY", "WALK"),
             "INCLUDE_IN": {"WALK", "CYCLE", "DISMOUNT"},
         },
         "width": {
@@ -233,30 +238,9 @@ def load_discomfort_score_component_info():
         "PARKING_SUBTAGS": {
             "display_name": "Parking Presence beside Road",
             "description": "Whether a road section has parking on or adjacent to it.",
-            "levels_CYCLE": {
-                "left: none": -1,
-                "right: none": -1,
-                "left: half-on-curb": 0.5,
-                "right: half-on-curb": 0.5,
-                "left: on street": 1,
-                "right: on street": 1,
-            },
-            "levels_DISMOUNT": {
-                "left: none": -0.5,
-                "right: none": -0.5,
-                "left: half-on-curb": 1,
-                "right: half-on-curb": 1,
-                "left: on street": 0.5,
-                "right: on street": 0.5,
-            },
-            "levels_WALK": {
-                "left: none": -0.5,
-                "right: none": -0.5,
-                "left: half-on-curb": 1,
-                "right: half-on-curb": 1,
-                "left: on street": 0.5,
-                "right: on street": 0.5,
-            },
+            "levels_CYCLE": display_levels("PARKING_SUBTAGS", "CYCLE"),
+            "levels_DISMOUNT": display_levels("PARKING_SUBTAGS", "DISMOUNT"),
+            "levels_WALK": display_levels("PARKING_SUBTAGS", "WALK"),
             "INCLUDE_IN": {"WALK", "CYCLE", "DISMOUNT"},
             "extra_explanation": "(Both sides of the road count toward the score.)"
         },
@@ -440,4 +424,44 @@ def load_discomfort_score_component_info():
         },
     }
 
-    return default_weights_subcomponents_bike_CYCLE, default_weights_subcomponents_bike_DISMOUNT, default_weights_main_components_bike, default_weights_subcomponents_walk, default_weights_main_components_walk, subcomponent_name_to_display_info, bike_main_component_name_to_display_info, walk_main_component_name_to_display_info
\ No newline at end of file
+    return default_weights_subcomponents_bike_CYCLE, default_weights_subcomponents_bike_DISMOUNT, default_weights_main_components_bike, default_weights_subcomponents_walk, default_weights_main_components_walk, subcomponent_name_to_display_info, bike_main_component_name_to_display_info, walk_main_component_name_to_display_info
+
+def emphasize_weights(weights, names, factor):
+    """Copy of a weights dict where the weights of `names` are multiplied by `factor`. Names not in the dict are ignored."""
+    return {key: (value * factor if key in names else value) for key, value in weights.items()}
+
+@st.cache_data(ttl = None, max_entries = 1)
+def load_weight_profile_presets():
+    """Named weight profiles for comparing scenarios, built from the default weights.
+
+Returns a dict with keys "bike" and "walk". Each maps a profile name to a dict of weight dicts, keyed like the weights in session state.
+"""
+    default_weights_subcomponents_bike_CYCLE, default_weights_subcomponents_bike_DISMOUNT, default_weights_main_components_bike, default_weights_subcomponents_walk, default_weights_main_components_walk = load_discomfort_score_component_info()[:5]
+
+    factor = 3
+
+    # profile name: (subcomponents to emphasize, main components to emphasize)
+    emphasis = {
+        "Default": ((), ()),
+        "Lighting-heavy": (("lit", ), ()),
+        "Bike-lane-heavy": (("CYCLEWAY_CLASS", "CYCLEWAY_LANE_TYPE", "FROM_IMAGES_cycling_lane_coverage"), ()),
+        "Sidewalk-heavy": (("sidewalk", "FROM_IMAGES_sidewalk_ratio"), ()),
+        "Greenery-heavy": (("FROM_IMAGES_greenery_ratio", ), ()),
+        "Crossing-heavy": (("TAG_crossing", "FROM_IMAGES_has_crosswalk", "FROM_IMAGES_has_traffic_light"), ()),
+        "Traffic-heavy": ((), ("traffic_safety", "traffic_volume", "traffic_speed", "accident_risk")),
+    }
+
+    presets = {"bike": {}, "walk": {}}
+
+    for profile_name, (sub_names, main_names) in emphasis.items():
+        presets["bike"][profile_name] = {
+            "weights_sub_bike_CYCLE": emphasize_weights(default_weights_subcomponents_bike_CYCLE, sub_names, factor),
+            "weights_sub_bike_DISMOUNT": emphasize_weights(default_weights_subcomponents_bike_DISMOUNT, sub_names, factor),
+            "weights_main_bike": emphasize_weights(default_weights_main_components_bike, main_names, factor),
+        }
+        presets["walk"][profile_name] = {
+            "weights_sub_walk": emphasize_weights(default_weights_subcomponents_walk, sub_names, factor),
+            "weights_main_walk": emphasize_weights(default_weights_main_components_walk, main_names, factor),
+        }
+
+    return presets
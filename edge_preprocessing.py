@@ -0,0 +1,339 @@
+import sys
+
+import pandas as pd
+import numpy as np
+import geopandas as gpd
+
+# Preprocessing of OSM tags into the statuses and components used by the discomfort scores
+# (the preproc_Gb.csv and preproc_Gw.csv tables). This is the rule set of preprocess_edge_info in
+# data_cleaning_and_computation_copies/04-revised_metric_computation.ipynb, evaluated column-wise:
+# every rule becomes a boolean mask over all edges, applied in the same order as the original checks.
+# To rebuild the tables, run `python edge_preprocessing.py` from the repository root, or
+# `python edge_preprocessing.py <edges file> <output csv>` for another area (geojson, gpkg or feather edges with u, v, key columns).
+
+FOLDER = "discomfort_and_curve_data/"
+
+PREPROC_COLUMNS = [ # same order as the original output
+    "sidewalk_description",
+    "has_left_sidewalk_status",
+    "has_right_sidewalk_status",
+    "is_crossing_status",
+    "bicycle_status",
+    "cycleway_lane_type",
+    "cycleway_description",
+    "cycleway_left_lane_type",
+    "cycleway_right_lane_type",
+    "cycleway_class",
+    "cycleway_left_class",
+    "cycleway_right_class",
+
+    "parking_left_description",
+    "parking_right_description",
+
+    "width_comp",
+    "lit_comp",
+    "maxspeed_comp",
+    "segregated_comp",
+    "crossing_tag_comp",
+    "edsa_accident_comp",
+    "motor_vehicle_comp",
+]
+
+def tag(edges, col):
+    """Values of a tag column as an object array. Tags that do not appear in this extract are all missing."""
+    if col in edges.columns:
+        return edges[col].to_numpy(dtype = object)
+    return np.full(len(edges), np.nan, dtype = object)
+
+def isin(values, options):
+    """Elementwise `value in options`. Missing values and non-string values (e.g. lists of tags) never match."""
+    return pd.Series(values, dtype = object).isin(options).to_numpy()
+
+def edsa_accident_component(edsa_accidents):
+    """Discrete level of the number of EDSA accidents on an edge: 0 for at most 5, 1 for at most 20, 2 above that."""
+    counts = edsa_accidents.fillna(0).to_numpy()
+    return np.where(counts <= 5, 0, np.where(counts <= 20, 1, 2))
+
+def cycleway_statuses(edges):
+    """Bike lane statuses, and the bicycle access implied by having a bike lane."""
+    n = len(edges)
+
+    cycleway = tag(edges, "cycleway")
+    cycleway_lane_tag = tag(edges, "TAG_cycleway:lane")
+    cycleway_both = tag(edges, "TAG_cycleway:both")
+    cycleway_left = tag(edges, "TAG_cycleway:left")
+    cycleway_right = tag(edges, "TAG_cycleway:right")
+
+    bicycle_status = np.full(n, "no", dtype = object)
+    cycleway_left_lane_type = np.full(n, "no", dtype = object)
+    cycleway_right_lane_type = np.full(n, "no", dtype = object)
+    cycleway_class = np.full(n, "no", dtype = object)
+    cycleway_left_class = np.full(n, "no", dtype = object)
+    cycleway_right_class = np.full(n, "no", dtype = object)
+
+    # initial checks
+
+    has_cycleway_tag = isin(cycleway, ["lane", "shared_lane"])
+    cycleway_lane_type = np.where(has_cycleway_tag, cycleway, "no").astype(object)
+    cycleway_description = np.where(has_cycleway_tag, "yes", "no").astype(object)
+
+    for values, lane_class in ((["exclusive"], "class 2"), (["advisory", "pictogram"], "class 3")):
+        m = isin(cycleway_lane_tag, values)
+        cycleway_lane_type[m & (cycleway_lane_type == "no")] = "lane"
+        cycleway_description[m & (cycleway_description == "no")] = "yes"
+        cycleway_class[m] = lane_class
+
+    m = isin(cycleway_both, ["lane", "shared_lane", "track"])
+    cycleway_lane_type[m] = cycleway_both[m]
+    cycleway_description[m] = "both"
+    cycleway_left_lane_type[m] = cycleway_both[m]
+    cycleway_right_lane_type[m] = cycleway_both[m]
+    track = m & isin(cycleway_both, ["track"])
+    cycleway_left_class[track] = "class 1"
+    cycleway_right_class[track] = "class 1"
+    painted = m & isin(cycleway_both, ["lane", "shared_lane"]) & (cycleway_class != "no")
+    cycleway_left_class[painted] = cycleway_class[painted]
+    cycleway_right_class[painted] = cycleway_class[painted]
+
+    for side_tag, side_lane_type, side_class in ((cycleway_left, cycleway_left_lane_type, cycleway_left_class), (cycleway_right, cycleway_right_lane_type, cycleway_right_class)):
+        side_lane_type[isin(side_tag, ["opposite_lane"])] = "no"
+        m = isin(side_tag, ["lane", "shared_lane", "track"])
+        side_lane_type[m] = side_tag[m]
+        cycleway_description[m] = "yes"
+        side_class[m & isin(side_tag, ["track"])] = "class 1"
+        painted = m & isin(side_tag, ["lane", "shared_lane"]) & (cycleway_class != "no")
+        side_class[painted] = cycleway_class[painted]
+
+    # combine the two sides: lane types
+
+    has_left = cycleway_left_lane_type != "no"
+    has_right = cycleway_right_lane_type != "no"
+    m = has_left & has_right
+    cycleway_lane_type[m] = np.where(cycleway_left_lane_type[m] == cycleway_right_lane_type[m], cycleway_left_lane_type[m], "different")
+    cycleway_description[m] = "both"
+    m = has_left & ~has_right
+    cycleway_lane_type[m] = cycleway_left_lane_type[m]
+    cycleway_description[m] = "left"
+    m = ~has_left & has_right
+    cycleway_lane_type[m] = cycleway_right_lane_type[m]
+    cycleway_description[m] = "right"
+
+    m = cycleway_description != "no"
+    cycleway_lane_type[m & (cycleway_lane_type == "no")] = "lane"
+    bicycle_status[m & (bicycle_status == "no")] = "yes"
+
+    # combine the two sides: classes
+
+    has_left = cycleway_left_class != "no"
+    has_right = cycleway_right_class != "no"
+    m = has_left & has_right
+    cycleway_class[m] = np.where(cycleway_left_class[m] == cycleway_right_class[m], cycleway_left_class[m], "different")
+    cycleway_description[m] = "both"
+    m = has_left & ~has_right
+    cycleway_class[m] = cycleway_left_class[m]
+    cycleway_description[m] = "left"
+    m = ~has_left & has_right
+    cycleway_class[m] = cycleway_right_class[m]
+    cycleway_description[m] = "right"
+    # also
+    m = has_left | has_right
+    bicycle_status[m & (bicycle_status == "no")] = "yes"
+    cycleway_description[m & (cycleway_description == "no")] = "yes"
+
+    # last for cycle stuff
+
+    no_class = cycleway_left_class == "no"
+    m = no_class & (cycleway_description == "left")
+    cycleway_class[m] = "class 3"
+    cycleway_left_class[m] = "class 3"
+    cycleway_right_class[m] = "no"
+    cycleway_left_class[no_class & (cycleway_description == "both")] = "class 3"
+
+    no_class = cycleway_right_class == "no"
+    m = no_class & (cycleway_description == "right")
+    cycleway_class[m] = "class 3"
+    cycleway_left_class[m] = "no"
+    cycleway_right_class[m] = "class 3"
+    cycleway_right_class[no_class & (cycleway_description == "both")] = "class 3"
+
+    cycleway_class[(cycleway_left_class == "class 3") & (cycleway_right_class == "class 3")] = "class 3"
+
+    cycleway_class[(cycleway_description == "yes") & (cycleway_class == "no")] = "class 3"
+
+    m = cycleway_description != "no"
+    unknown = m & (cycleway_left_lane_type == "no") & (cycleway_right_lane_type == "no")
+    cycleway_left_lane_type[unknown] = "unknown_but_one_of_the_two_must_exist"
+    cycleway_right_lane_type[unknown] = "unknown_but_one_of_the_two_must_exist"
+    unknown = m & (cycleway_left_class == "no") & (cycleway_right_class == "no")
+    cycleway_left_class[unknown] = "unknown_but_one_of_the_two_must_exist"
+    cycleway_right_class[unknown] = "unknown_but_one_of_the_two_must_exist"
+
+    return {
+        "bicycle_status": bicycle_status,
+        "cycleway_lane_type": cycleway_lane_type,
+        "cycleway_description": cycleway_description,
+        "cycleway_left_lane_type": cycleway_left_lane_type,
+        "cycleway_right_lane_type": cycleway_right_lane_type,
+        "cycleway_class": cycleway_class,
+        "cycleway_left_class": cycleway_left_class,
+        "cycleway_right_class": cycleway_right_class,
+    }
+
+def sidewalk_and_bicycle_statuses(edges, bicycle_status, cycleway_description):
+    """Sidewalk and crossing statuses, and the final bicycle access. `bicycle_status` is updated in place."""
+    n = len(edges)
+
+    sidewalk = tag(edges, "sidewalk")
+    sidewalk_right = tag(edges, "TAG_sidewalk:right")
+    sidewalk_left = tag(edges, "TAG_sidewalk:left")
+    footway = tag(edges, "footway")
+    bicycle = tag(edges, "bicycle")
+    foot = tag(edges, "foot")
+    highway = tag(edges, "highway")
+
+    sidewalk_description = np.full(n, "no_sidewalk", dtype = object)
+    has_left_sidewalk_status = np.zeros(n, dtype = bool)
+    has_right_sidewalk_status = np.zeros(n, dtype = bool)
+
+    # sidewalk = no keeps the defaults
+    sidewalk_description[isin(sidewalk, ["yes"])] = "is_sidewalk"
+    sidewalk_description[isin(sidewalk, ["both", "left", "right"])] = "has_sidewalk"
+    has_left_sidewalk_status |= isin(sidewalk, ["both", "left"])
+    has_right_sidewalk_status |= isin(sidewalk, ["both", "right"])
+
+    for side_tag, side_status in ((sidewalk_right, has_right_sidewalk_status), (sidewalk_left, has_left_sidewalk_status)):
+        m = isin(side_tag, ["yes"])
+        sidewalk_description[m] = "has_sidewalk"
+        side_status[m] = True
+        # could be it has a sidewalk on the other side, or not
+        side_status[isin(side_tag, ["separate"])] = False
+
+    sidewalk_description[isin(footway, ["sidewalk"])] = "is_sidewalk"
+    is_crossing_status = isin(footway, ["crossing"])
+    # assume
+    bicycle_status[isin(footway, ["link", "alley"])] = "permissive"
+
+    # last checks
+
+    sidewalk_description[has_left_sidewalk_status | has_right_sidewalk_status] = "has_sidewalk"
+
+    bicycle_status[sidewalk_description == "is_sidewalk"] = "dismount"
+    bicycle_status[is_crossing_status] = "dismount"
+
+    # force the known bicycle status to be used if it is available
+    m = isin(bicycle, ["yes", "permissive", "destination", "dismount", "no"])
+    bicycle_status[m] = bicycle[m]
+
+    # hard assumptions
+
+    bicycle_no = isin(bicycle, ["no"])
+    bicycle_status[(cycleway_description == "no") & bicycle_no & (sidewalk_description == "has_sidewalk")] = "dismount"
+    bicycle_status[isin(foot, ["yes", "designated"]) & bicycle_no] = "dismount"
+    bicycle_status[isin(highway, ["residential"]) & bicycle_no] = "permissive"
+
+    return {
+        "sidewalk_description": sidewalk_description,
+        "has_left_sidewalk_status": has_left_sidewalk_status,
+        "has_right_sidewalk_status": has_right_sidewalk_status,
+        "is_crossing_status": is_crossing_status,
+    }
+
+def parking_statuses(edges):
+    n = len(edges)
+
+    parking_left_description = np.full(n, "unknown", dtype = object)
+    parking_right_description = np.full(n, "unknown", dtype = object)
+
+    # half_on_kerb as in parking that's half on the curb, half on the road; lane as in parking lane on the road itself
+    parking_types = ["half_on_kerb", "lane", "no"]
+    for col, sides in (("TAG_parking:both", (parking_left_description, parking_right_description)), ("TAG_parking:left", (parking_left_description,)), ("TAG_parking:right", (parking_right_description,))):
+        values = tag(edges, col)
+        m = isin(values, parking_types)
+        for side in sides:
+            side[m] = values[m]
+
+    # parallel parking lanes on the street
+    # note, these are considered "lane" since there isn't much of a difference.
+    for col, sides in (("TAG_parking:lane:both:parallel", (parking_left_description, parking_right_description)), ("TAG_parking:lane:left:parallel", (parking_left_description,)), ("TAG_parking:lane:right:parallel", (parking_right_description,))):
+        m = isin(tag(edges, col), ["on_street"])
+        for side in sides:
+            side[m] = "lane"
+
+    return {
+        "parking_left_description": parking_left_description,
+        "parking_right_description": parking_right_description,
+    }
+
+def common_components(edges):
+    """Components shared by the dismount and non-dismount rules."""
+    n = len(edges)
+
+    # we consider the default discomfort level to occur when width of road is 3 meters.
+    # smaller width means lower discomfort.
+    width = pd.Series(tag(edges, "width")).astype(float).to_numpy()
+    width_comp = np.where(np.isnan(width), 0, width - 3)
+
+    # street lights
+    lit = tag(edges, "lit")
+    lit_comp = np.where(isin(lit, ["yes"]), -1, 0)
+
+    # we consider default discomfort level to occur when maxspeed is 30. The corresponding component is 0.
+    maxspeed = pd.Series(tag(edges, "maxspeed")).astype(float).to_numpy()
+    maxspeed_comp = np.where(maxspeed < 30, -1, np.where(maxspeed > 30, 1, 0))
+
+    segregated_comp = np.where(isin(tag(edges, "segregated"), ["no"]), 1, 0)
+
+    crossing_tag_comp = np.where(isin(tag(edges, "TAG_crossing"), ["unmarked", "informal"]), 1, 0)
+
+    # all should be non-null in this column
+    edsa_accident_comp = edges["EDSA_accident_component"].to_numpy()
+
+    # whether motor vehicles are allowed; motorcar is also considered here
+    motor_vehicle_comp = np.where(
+        isin(tag(edges, "motorcar"), ["no"]), -1,
+        np.where(isin(tag(edges, "motor_vehicle"), ["no"]), -2, 0)
+    )
+
+    return {
+        "width_comp": width_comp,
+        "lit_comp": lit_comp,
+        "maxspeed_comp": maxspeed_comp,
+        "segregated_comp": segregated_comp,
+        "crossing_tag_comp": crossing_tag_comp,
+        "edsa_accident_comp": edsa_accident_comp,
+        "motor_vehicle_comp": motor_vehicle_comp,
+    }
+
+def preprocess_edges(edges):
+    """Preprocessed statuses and components of every edge, indexed like `edges`.
+
+edges: edges with OSM tag columns (including the TAG_ columns) and EDSA_accident_component.
+Tag columns that do not appear in an extract are treated as missing everywhere.
+
+Gives the same output as `edges.apply(preprocess_edge_info, axis = 1)`.
+"""
+    cycle = cycleway_statuses(edges)
+    sidewalk = sidewalk_and_bicycle_statuses(edges, cycle["bicycle_status"], cycle["cycleway_description"])
+
+    columns = {**cycle, **sidewalk, **parking_statuses(edges), **common_components(edges)}
+
+    return pd.DataFrame({col: columns[col] for col in PREPROC_COLUMNS}, index = edges.index)
+
+def preprocess_edges_file(edges_path, output_path):
+    """Pipeline stage: read an edges file, preprocess it and write the table as CSV, sorted by (u, v, key)."""
+    edges = gpd.read_feather(edges_path) if edges_path.endswith(".feather") else gpd.read_file(edges_path)
+
+    if "u" in edges.columns:
+        edges = edges.set_index(["u", "v", "key"], drop = True)
+
+    if "EDSA_accident_component" not in edges.columns:
+        edges["EDSA_accident_component"] = edsa_accident_component(edges["EDSA_accidents"] if "EDSA_accidents" in edges.columns else pd.Series(np.nan, index = edges.index))
+
+    preprocess_edges(edges).sort_index().to_csv(output_path, index = True)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        preprocess_edges_file(sys.argv[1], sys.argv[2])
+    else:
+        for mode in ("b", "w"):
+            preprocess_edges_file(FOLDER + f"G{mode}_edges.feather", FOLDER + f"preproc_G{mode}.csv")
@@ -0,0 +1,60 @@
+import pandas as pd
+import numpy as np
+import geopandas as gpd
+
+# Preprocessed edge attributes (the columns of preproc_Gb.csv / preproc_Gw.csv), stored as feather files
+# in the same row order as Gb_edges.feather / Gw_edges.feather. Rows are matched by position, so no (u, v, key) lookups are needed.
+# To rebuild after the edges or the preprocessing change, run `python edge_preprocessing.py` and then `python edge_store.py` from the repository root.
+
+FOLDER = "discomfort_and_curve_data/"
+
+INDEX_COLUMNS = ["u", "v", "key"]
+
+def aligned_preproc_path(mode, folder = FOLDER):
+    """mode: "b" for the cycling network, "w" for the walking network."""
+    return folder + f"preproc_G{mode}.feather"
+
+def build_aligned_preproc(edges, preproc):
+    """Put `preproc` in the row order of `edges`, and store string statuses as categoricals (dictionary-encoded in feather).
+
+The u, v and key columns are kept so that the row order can be checked when loading.
+"""
+    aligned = preproc.reindex(edges.index)
+
+    if aligned.isna().all(axis = 1).any():
+        raise ValueError("Some edges have no preprocessed attributes. Rebuild the preproc table for these edges first.")
+
+    for col in aligned.columns:
+        if aligned[col].dtype == object:
+            aligned[col] = aligned[col].astype("category")
+
+    return aligned.reset_index(drop = False)
+
+def write_aligned_preproc(folder = FOLDER):
+    for mode in ("b", "w"):
+        edges = gpd.read_feather(folder + f"G{mode}_edges.feather")
+        preproc = pd.read_csv(folder + f"preproc_G{mode}.csv").set_index(INDEX_COLUMNS, drop = True)
+
+        build_aligned_preproc(edges, preproc).to_feather(aligned_preproc_path(mode, folder))
+
+def load_aligned_preproc(mode, edges = None, folder = FOLDER):
+    """Load the preprocessed attributes of one network, in the row order of its edges feather.
+
+If `edges` is given, the row order is checked against it (a vectorized comparison, not a lookup).
+
+Returns a DataFrame indexed by (u, v, key), like the table read from the CSV.
+"""
+    preproc = pd.read_feather(aligned_preproc_path(mode, folder))
+
+    if edges is not None:
+        same_order = (len(preproc) == len(edges)) and all([
+            np.array_equal(preproc[col].to_numpy(), edges.index.get_level_values(col).to_numpy())
+            for col in INDEX_COLUMNS
+        ])
+        if not same_order:
+            raise ValueError(f"{aligned_preproc_path(mode, folder)} is not aligned with the edges. Rebuild it with `python edge_store.py`.")
+
+    return preproc.set_index(INDEX_COLUMNS, drop = True)
+
+if __name__ == "__main__":
+    write_aligned_preproc()
@@ -4,6 +4,9 @@ import geopandas as gpd
 import pandas as pd
 import plotly.express as px
 
+from discomfort_score_metadata import load_weight_profile_presets
+from shared_functions import compare_weight_profiles, SESSION_WEIGHT_KEYS
+
 # Variables
 ss = st.session_state
 description = 'Lorem ipsum dolor sit amet.'
@@ -266,6 +269,36 @@ def display_trend(df, title, emoji):
         st.plotly_chart(fig)
         st.caption(f'NOTE: The {title.lower()} trend is fictitious and is only for demonstrating the project\'s potential.')
 
+# Weight Profiles
+def display_weight_profiles(df, title, emoji):
+    st.caption('WEIGHT PROFILES')
+
+    mode = 'bike' if title == 'Bikeability' else 'walk'
+    profiles = dict(load_weight_profile_presets()[mode])
+
+    # include the weights set on the Modify Weights page, if any
+    session_keys = SESSION_WEIGHT_KEYS[mode]
+    if all([key in ss for key in session_keys]):
+        profiles['Current Weights'] = {key: ss[key] for key in session_keys}
+
+    selected_profiles = st.multiselect('Select weight profiles to compare', list(profiles.keys()), default=list(profiles.keys()), key=f'{title}_weight_profiles')
+    if len(selected_profiles) == 0:
+        st.warning('Select at least one weight profile.')
+        return
+
+    score_matrix, summary = compare_weight_profiles(mode, {k: profiles[k] for k in selected_profiles})
+
+    with st.container(border=True):
+        fig = px.bar(summary.reset_index(), x='profile', y='mean',
+            height=300,
+            title='Average Discomfort Score by Weight Profile',
+            labels={'profile':'Weight Profile', 'mean':'Average Discomfort'},
+        )
+        fig.update_layout(margin=dict(l=30, r=30, t=50, b=20))
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(summary.round(2), use_container_width=True)
+        st.caption('NOTE: Discomfort scores are computed for every street section under each profile. Higher discomfort is worse.')
+
 # Create tabs
 bike_tab, walk_tab = st.tabs(['🚲 Bikeability', '🚶 Walkability'])
 with bike_tab:
@@ -279,6 +312,9 @@ with bike_tab:
     st.write('\n')
 
     display_road_metrics(bike, 'Bikeability', '🚲')
+    st.write('\n')
+
+    display_weight_profiles(bike, 'Bikeability', '🚲')
 
 
 with walk_tab:
@@ -291,4 +327,7 @@ with walk_tab:
     display_components(walk, 'Walkability', '🚶')
     st.write('\n')
 
-    display_road_metrics(walk, 'Walkability', '🚶')
\ No newline at end of file
+    display_road_metrics(walk, 'Walkability', '🚶')
+    st.write('\n')
+
+    display_weight_profiles(walk, 'Walkability', '🚶')
\ No newline at end of file
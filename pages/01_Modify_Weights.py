@@ -144,6 +144,12 @@ def generate_terms_of_formula(d, ss_weights_key):
 
 def update_weights_dict_from_key(sskey_weights_TEMP, component_name, data_key):
     ss[sskey_weights_TEMP][component_name] = ss[data_key]
+
+    # only the weights change here; scores are recomputed where they are needed (Recompute Discomfort, Bikeability Curves),
+    # so drop the scores of the previous weights instead of rescoring on every edit
+    scores_key = "Gb_edges_discomfort" if "bike" in sskey_weights_TEMP else "Gw_edges_discomfort"
+    ss.pop(scores_key, None)
+
     return None
 
 # Main
@@ -6,8 +6,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import altair as alt
 import geopandas as gpd
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-from shared_functions import tradeoff_rate, tradeoff_rates_from_results, display_explanation_expander, display_single_area_analysis
+from shared_functions import tradeoff_rate, tradeoff_rates_from_results, collapse_identical_betas, brgy_metrics_from_results, display_explanation_expander, display_single_area_analysis
+from shared_functions import SESSION_WEIGHT_KEYS, session_score_cache_key, default_score_cache_key, rescore_discomfort_from_weights, default_discomfort_scores
+from routing_engine import build_csr_graph
+from curve_analysis import BETAS, BRGY_BETAS, edges_with_discomfort, curve_results, iter_brgy_curve_results, curve_cache_key, load_cached_curve, store_curve
+from path_store import load_sampled_nodes
 
 #--------------------------------------------
 
@@ -45,6 +51,141 @@ def load_curve_data():
 
     return brgy_bike_results, brgy_walk_results, brgy_bike_metrics, brgy_walk_metrics, city_bike_results, city_walk_results, city_bike_metrics, city_walk_metrics
 
+@st.cache_data(ttl = None, max_entries = 1)
+def load_curve_networks():
+    # only what the curves need: edge lengths, and node coordinates and tags (to exclude nodes from sampling)
+    folder = "discomfort_and_curve_data/"
+
+    networks = {}
+    for mode in ("bike", "walk"):
+        edges = gpd.read_feather(folder + f"G{mode[0]}_edges.feather")
+        nodes = gpd.read_feather(folder + f"G{mode[0]}_nodes.feather")
+        networks[mode] = (pd.DataFrame(edges[["length"]]), pd.DataFrame(nodes.drop(columns = "geometry")))
+
+    brgy_geo = gpd.read_feather(folder + "brgy_geo_for_city.feather")[["adm4_pcode", "adm4_en", "geometry"]]
+
+    return networks, brgy_geo
+
+@st.cache_resource
+def get_curve_executor():
+    # one pool of worker processes shared by all sessions; spawned rather than forked, since the server is multithreaded
+    return ProcessPoolExecutor(mp_context = multiprocessing.get_context("spawn"))
+
+def make_progress_chart(brgy_results):
+    return alt.Chart(brgy_results).mark_line(point = True).encode(
+        x = alt.X("relative_distance:Q", title = "Relative Distance (Circuity)", scale = alt.Scale(zero = False)),
+        y = alt.Y("relative_discomfort:Q", title = "Relative Discomfort", scale = alt.Scale(zero = False)),
+        color = alt.Color("adm4_en:N", title = "Barangay", legend = None, scale = alt.Scale(scheme = "category20")),
+        tooltip = [alt.Tooltip("adm4_en:N", title = "Barangay"), alt.Tooltip("beta:O", title = "Beta")],
+    ).properties(
+        width = 650,
+        height = 350,
+    )
+
+def load_cached_curves(brgy_geo, score_key):
+    """Curves in the curve cache for the discomfort scores of one score cache key: (city_results or None, dict of adm4_pcode to brgy_results)."""
+    city_results = load_cached_curve(curve_cache_key(score_key, BETAS), "city")
+
+    done = {}
+    brgy_key = curve_cache_key(score_key, BRGY_BETAS)
+    for adm4_pcode in brgy_geo["adm4_pcode"]:
+        cached = load_cached_curve(brgy_key, adm4_pcode)
+        if cached is not None:
+            done[adm4_pcode] = cached
+
+    return city_results, done
+
+def curves_for_weights(mode, weight_sets):
+    """City and barangay curves for several sets of discomfort weights (mode: "bike" or "walk"), all computed the same way
+(curve_analysis with uniform OD probabilities and its own barangay node sample), so that they can be compared.
+
+weight_sets: dict of label to (score cache key, function returning the discomfort scores of the weights).
+
+Curves already computed for the same weights, in this or any other session, are read from the curve cache.
+Missing curves are only computed when the user asks for it: the barangays are processed by the shared worker pool,
+and each one is cached and added to a progress chart as soon as it finishes.
+
+Returns a dict of label to (city_results, brgy_results), or None if some curves are missing and the user has not started the computation.
+"""
+    networks, brgy_geo = load_curve_networks()
+    edges, nodes = networks[mode]
+
+    cached = {label: load_cached_curves(brgy_geo, score_key) for label, (score_key, get_scores) in weight_sets.items()}
+
+    num_areas = len(weight_sets) * (len(brgy_geo) + 1)
+    num_done = sum(len(done) + (city_results is not None) for city_results, done in cached.values())
+
+    if num_done < num_areas:
+
+        st.info(f"The curves for your weights and for the default weights they are compared with have not all been computed yet ({num_done} of {num_areas} areas done). Once computed, they are saved for everyone who uses the same weights.")
+
+        if not st.button("Compute curves for my weights", type = "primary"):
+            return None
+
+        progressbar = st.progress(num_done / num_areas, text = "Rescoring discomfort...")
+        empty_PLOT = st.empty()
+
+        executor = get_curve_executor()
+
+        for label, (score_key, get_scores) in weight_sets.items():
+            city_results, done = cached[label]
+
+            if (city_results is not None) and (len(done) == len(brgy_geo)):
+                continue
+
+            progressbar.progress(num_done / num_areas, text = f"Rescoring discomfort ({label})...")
+            brgy_edges = edges_with_discomfort(edges, get_scores())
+
+            if city_results is None:
+                progressbar.progress(num_done / num_areas, text = f"Computing the city-wide curve ({label})...")
+                city_results = curve_results(build_csr_graph(brgy_edges, nodes), load_sampled_nodes(mode[0]), betas = BETAS, executor = executor)
+                store_curve(curve_cache_key(score_key, BETAS), "city", city_results)
+                num_done += 1
+
+            remaining = brgy_geo.loc[~brgy_geo["adm4_pcode"].isin(list(done))]
+
+            for brgy_results in iter_brgy_curve_results(brgy_edges, nodes, remaining, betas = BRGY_BETAS, executor = executor):
+                adm4_pcode, adm4_en = brgy_results["adm4_pcode"].iloc[0], brgy_results["adm4_en"].iloc[0]
+                store_curve(curve_cache_key(score_key, BRGY_BETAS), adm4_pcode, brgy_results)
+                done[adm4_pcode] = brgy_results
+                num_done += 1
+
+                progressbar.progress(num_done / num_areas, text = f"Computed {adm4_en} ({label}, {num_done} of {num_areas} areas)")
+                empty_PLOT.altair_chart(make_progress_chart(pd.concat(done.values(), ignore_index = True)))
+
+            cached[label] = (city_results, done)
+
+        progressbar.empty()
+        empty_PLOT.empty()
+
+    # same order as brgy_*_results.csv
+    return {
+        label: (city_results, pd.concat([done[adm4_pcode] for adm4_pcode in brgy_geo["adm4_pcode"]], ignore_index = True))
+        for label, (city_results, done) in cached.items()
+    }
+
+def display_comparison_with_default_weights(city_metrics, default_city_metrics):
+    """City-wide averages for the user's weights, with the change from the default weights."""
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.metric(
+            "Average circuity",
+            round(city_metrics["relative_distance"], 3),
+            delta = round(city_metrics["relative_distance"] - default_city_metrics["relative_distance"], 4),
+            delta_color = "inverse"
+        )
+
+    with col2:
+        st.metric(
+            "Average relative discomfort",
+            round(city_metrics["relative_discomfort"], 3),
+            delta = round(city_metrics["relative_discomfort"] - default_city_metrics["relative_discomfort"], 4),
+            delta_color = "inverse"
+        )
+
+    return None
+
 def display_best_and_worst_by_average(brgy_metrics_filtered, brgy_results_filtered, metric, metric_str, lowest_is_best = True, note_relative_position_on_graph = True, topbottom = True, custom_captions = None):
 
     m_sorted = brgy_metrics_filtered.sort_values(metric, ascending = lowest_is_best)
@@ -137,6 +278,41 @@ if __name__ == "__main__":
         city_results = city_walk_results
         city_metrics = city_walk_metrics
 
+    weights_option = st.radio(
+        "Discomfort weights",
+        options = ["Default weights", "My weights"],
+        horizontal = True,
+        help = "My weights are the weights set on the Modify Weights page.",
+    )
+
+    if weights_option == "My weights":
+        network = "bike" if (mode_option == "Bikeability") else "walk"
+
+        weights_were_set = all([key in ss for key in SESSION_WEIGHT_KEYS[network]])
+
+        if (not weights_were_set) or (session_score_cache_key(network) == default_score_cache_key(network)):
+            st.info("Your weights are the default weights, so these are the precomputed curves. Change the weights on the Modify Weights page to see their effect on the curves.")
+
+        else:
+            # the precomputed curves used demand-weighted OD pairs and another barangay sample, so the default weights are
+            # recomputed the same way as the user's weights to compare them
+            recomputed = curves_for_weights(network, {
+                "default weights": (default_score_cache_key(network), lambda: default_discomfort_scores(network)),
+                "your weights": (session_score_cache_key(network), lambda: rescore_discomfort_from_weights(network)),
+            })
+
+            if recomputed is None:
+                st.stop()
+
+            city_results, brgy_results = recomputed["your weights"]
+            city_metrics = city_results.drop("beta", axis = 1).mean(axis = 0)
+            brgy_metrics = brgy_metrics_from_results(brgy_results)
+
+            default_city_results = recomputed["default weights"][0]
+            display_comparison_with_default_weights(city_metrics, default_city_results.drop("beta", axis = 1).mean(axis = 0))
+
+            st.caption("The curves below use your weights. Average MTORs are computed from these curves. Unlike the precomputed curves, they treat all origin-destination pairs as equally likely and use a different sample of nodes per barangay, so the changes above are measured against the default weights computed the same way, not against the Default weights view.")
+
     city_tab, brgy_tab = st.tabs(["City-wide", "Barangay-wide"])
 
     with city_tab:
@@ -223,11 +399,8 @@ if __name__ == "__main__":
 
                 df = brgy_results_filtered
 
-                # if both relative discomfort and relative distance had a very small change, drop duplicates.
-                df["relative_discomfort_ROUNDED"] = df["relative_discomfort"].round(3)
-                df["relative_distance_ROUNDED"] = df["relative_distance"].round(3)
-
-                df = df.sort_values("beta", ascending = True).drop_duplicates(["adm4_pcode", "relative_discomfort_ROUNDED", "relative_distance_ROUNDED"], keep = "first")
+                # if both relative discomfort and relative distance had a very small change, keep only the lowest of those Betas
+                df = collapse_identical_betas(df, by = "adm4_pcode")
 
                 domx = [df["relative_distance"].min() - 0.1, df["relative_distance"].max() + 0.05]
                 domy = [df["relative_discomfort"].min() - 0.01, df["relative_discomfort"].max() + 0.01]
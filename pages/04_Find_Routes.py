@@ -6,13 +6,19 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import altair as alt
 import geopandas as gpd
-import pickle
 import leafmap.foliumap as leafmap
 import folium
 # from streamlit_folium import st_folium
 ### no need to import streamlit_folium, but note it's a dependency
 
 from shared_functions import tradeoff_rate, tradeoff_rates_from_results, display_explanation_expander, display_single_area_analysis
+from routing_engine import (
+    PROJECTED_CRS, build_csr_graph, node_positions, objective_weights, shortest_path, straight_line_distance,
+    pareto_routes, beta_breakpoints, path_edge_rows, nearest_nodes, bounded_search, reachable_within, reachable_area,
+    edge_coordinates, route_polylines
+)
+from contraction_hierarchy import load_index, ch_shortest_path
+from path_store import load_path_store, stored_path
 
 
 #--------------------------------------------
@@ -31,74 +37,6 @@ st.set_page_config(page_title=page_title, page_icon=page_icon, layout="centered"
 
 # Preparations
 
-def calculate_path_cost(path_nodes, cost_attribute):
-    path_cost = 0
-    pairs = set([(path_nodes[i], path_nodes[i+1]) for i in range(0, len(path_nodes) - 1)])
-
-    edge_index_frame = edges.index.to_frame()
-    edge_mask = edge_index_frame[["u", "v"]].apply(lambda r: (r['u'], r['v']), axis = 1).isin(pairs)
-
-    filtered_edges = edges.loc[edge_mask]
-
-    path_cost = filtered_edges[cost_attribute].sum()
-
-    return path_cost
-
-def metrics_from_single_optimal_path(path_nodes, beta, sld_function, record_relative_values = True):
-
-    o, d = path_nodes[0], path_nodes[-1]
-            
-    dist_travelled_raw = calculate_path_cost(path_nodes, "length")
-    distance_term = dist_travelled_raw
-    discomfort_term_unweighted =  calculate_path_cost(path_nodes, "DISCOMFORT_WEIGHTED_BY_BETA")
-
-    # IMPORTANT: yes, unweighted terms should come from the calculation that uses "DISCOMFORT_WEIGHTED_BY_BETA". This is because the provided graph is assumed to provide values weighted by beta=1.
-    discomfort_term_weighted = discomfort_term_unweighted * beta # note this only matters for how the optimization worked but doesnt matter at all for interpretation
-
-    if record_relative_values:
-
-        euclidean_distance = sld_function(o, d)
-        
-        discomfort_term_unweighted = discomfort_term_unweighted / dist_travelled_raw
-        discomfort_term_weighted = discomfort_term_weighted / dist_travelled_raw
-        distance_term = distance_term / euclidean_distance
-
-    ev_distance = distance_term
-    ev_discomfort_weighted = discomfort_term_weighted # note this only matters for how the optimization worked but doesnt matter at all for interpretation
-    ev_discomfort_unweighted = discomfort_term_unweighted
-
-    return ev_distance, ev_discomfort_weighted, ev_discomfort_unweighted # unweighted comes last in output! it matters
-
-@st.cache_data(ttl = None, max_entries = 1)
-def load_routes_data():
-    folder = "discomfort_and_curve_data/routes_data2/"
-
-    with open(folder + 'sampled_nodes_for_curve_bike.pkl', 'rb') as f:
-        b_list_nodes_sampled = pickle.load(f)
-
-    with open(folder + 'sampled_nodes_for_curve_walk.pkl', 'rb') as f:
-        w_list_nodes_sampled = pickle.load(f)
-
-    bike_routes_dict = {}
-    walk_routes_dict = {}
-
-    for beta in (0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0):
-
-        beta = float(beta)
-
-        filename_bike = folder + f"bike_lowest_objective_paths-beta_{beta}.pkl"
-        filename_walk = folder + f"walk_lowest_objective_paths-beta_{beta}.pkl"
-
-        with open(filename_bike, "rb") as f:
-            b_path_dict = pickle.load(f)
-        with open(filename_walk, "rb") as f:
-            w_path_dict = pickle.load(f)
-
-        bike_routes_dict[beta] = b_path_dict
-        walk_routes_dict[beta] = w_path_dict
-
-    return b_list_nodes_sampled, w_list_nodes_sampled, bike_routes_dict, walk_routes_dict
-
 @st.cache_data(ttl = None, max_entries = 1)
 def load_nodes_and_edges():
     folder = "discomfort_and_curve_data/"
@@ -110,6 +48,32 @@ def load_nodes_and_edges():
 
     return Gb_nodes, Gw_nodes, Gb_edges, Gw_edges
 
+@st.cache_data(ttl = None, max_entries = 1)
+def load_routing_graphs():
+    # routes are computed live on these graphs, so any node can be an origin or destination
+    Gb_nodes, Gw_nodes, Gb_edges, Gw_edges = load_nodes_and_edges()
+
+    return build_csr_graph(Gb_edges, Gb_nodes), build_csr_graph(Gw_edges, Gw_nodes)
+
+# cache_resource, not cache_data: the indexes are memory-mapped and should not be copied
+@st.cache_resource(ttl = None, max_entries = 1)
+def load_contraction_hierarchies(betas):
+    # optional indexes built with `python contraction_hierarchy.py`; None where an index is missing or out of date
+    return {(mode, beta): load_index(letter, beta) for mode, letter in (("Cycling", "b"), ("Walking", "w")) for beta in betas}
+
+# loaded lazily, one Beta at a time, and memory-mapped like the contraction hierarchies
+@st.cache_resource(ttl = None, max_entries = 14)
+def load_stored_paths(mode, beta):
+    # optional paths from the sampled origins, built with `python path_store.py`; None if missing or out of date
+    return load_path_store("b" if (mode == "Cycling") else "w", beta)
+
+@st.cache_data(ttl = None, max_entries = 1)
+def load_edge_coordinates():
+    # flat coordinate arrays of the edge geometries, so route lines are built by slicing instead of unioning geometries
+    Gb_nodes, Gw_nodes, Gb_edges, Gw_edges = load_nodes_and_edges()
+
+    return edge_coordinates(Gb_edges, Gb_nodes), edge_coordinates(Gw_edges, Gw_nodes)
+
 @st.cache_data(ttl = None, max_entries = 1)
 def load_brgy_geo():
     folder = "discomfort_and_curve_data/"
@@ -118,39 +82,25 @@ def load_brgy_geo():
 
     return brgy_geo_for_city, city_geo
 
-@st.cache_data(ttl = None, max_entries = 10)
-def load_straight_line_distances():
-    distance_matrix_b_SAMPLED_NODES_ONLY = pd.read_csv("discomfort_and_curve_data/straight_line_distances/distance_matrix_b_SAMPLED_NODES_ONLY.csv", index_col = "osmid")
-    distance_matrix_w_SAMPLED_NODES_ONLY = pd.read_csv("discomfort_and_curve_data/straight_line_distances/distance_matrix_w_SAMPLED_NODES_ONLY.csv", index_col = "osmid")
-
-    return distance_matrix_b_SAMPLED_NODES_ONLY, distance_matrix_w_SAMPLED_NODES_ONLY
-
 @st.cache_data(ttl = None, max_entries = 2)
 def compute_path_specific_results_for_curve(node_o, node_d, mode):
-    rows = []
-
+    # one bi-criteria search gives every route that is optimal for some Beta, so the curve is exact rather than sampled
     progressbar = st.progress(int(0), "Computing curve...")
 
-    for i, beta in enumerate(beta_options):
-        part = i + 1
-        progressbar.progress(100 * part // (4 // 3 * len(beta_options)))
-
-        ev_distance, ev_discomfort_weighted, ev_discomfort_unweighted = metrics_from_single_optimal_path(
-            path_nodes = routes_dict[beta][f"{node_o}, {node_d}"],
-            beta = beta,
-            sld_function = SLD_meters_b_lookup if (mode == "Cycling") else SLD_meters_w_lookup
-        )
+    frontier = pareto_routes(routing_graph, node_o, node_d)
+    optimal_routes = beta_breakpoints(frontier, beta_max = max(beta_options))
 
-        new_row = {
-            "beta": beta,
-            "relative_distance": ev_distance,
-            "relative_discomfort": ev_discomfort_unweighted # unweighted is the important one
-            # these are the only necessary columns
-        }
+    progressbar.progress(50)
 
-        rows.append(new_row)
+    sld_function = SLD_meters_b_lookup if (mode == "Cycling") else SLD_meters_w_lookup
+    euclidean_distance = sld_function(node_o, node_d)
 
-    path_specific_results = pd.DataFrame(rows)
+    path_specific_results = pd.DataFrame({
+        "beta": optimal_routes["beta_from"].round(3).to_numpy(), # the lowest Beta for which the route is optimal
+        "relative_distance": (optimal_routes["length"] / euclidean_distance).to_numpy(),
+        "relative_discomfort": (optimal_routes["discomfort"] / optimal_routes["length"]).to_numpy() # unweighted is the important one
+        # these are the only necessary columns
+    }).drop_duplicates("beta", keep = "last")
 
     progressbar.empty()
 
@@ -161,12 +111,15 @@ def compute_path_specific_results_for_curve(node_o, node_d, mode):
 if __name__ == "__main__":
 
     # SESSION STATE
-    if any([(key not in ss) for key in ["b_list_nodes_sampled", "w_list_nodes_sampled", "bike_routes_dict", "walk_routes_dict"]]):
-        b_list_nodes_sampled, w_list_nodes_sampled, bike_routes_dict, walk_routes_dict = load_routes_data()
-        ss["b_list_nodes_sampled"] = b_list_nodes_sampled
-        ss["w_list_nodes_sampled"] = w_list_nodes_sampled
-        ss["bike_routes_dict"] = bike_routes_dict
-        ss["walk_routes_dict"] = walk_routes_dict
+    if any([(key not in ss) for key in ["bike_routing_graph", "walk_routing_graph"]]):
+        bike_routing_graph, walk_routing_graph = load_routing_graphs()
+        ss["bike_routing_graph"] = bike_routing_graph
+        ss["walk_routing_graph"] = walk_routing_graph
+
+    if any([(key not in ss) for key in ["bike_edge_coords", "walk_edge_coords"]]):
+        bike_edge_coords, walk_edge_coords = load_edge_coordinates()
+        ss["bike_edge_coords"] = bike_edge_coords
+        ss["walk_edge_coords"] = walk_edge_coords
 
     if any([(key not in ss) for key in ["Gb_edges", "Gb_nodes", "Gw_edges", "Gw_nodes"]]):
         (Gb_nodes, Gw_nodes,
@@ -189,19 +142,15 @@ if __name__ == "__main__":
     if "analyses_were_just_updated" not in ss:
         ss["analyses_were_just_updated"] = False
 
-    if any([(key not in ss) for key in ["distance_matrix_b_SAMPLED_NODES_ONLY", "distance_matrix_w_SAMPLED_NODES_ONLY"]]):
-        a, b = load_straight_line_distances()
-        ss["distance_matrix_b_SAMPLED_NODES_ONLY"] = a
-        ss["distance_matrix_w_SAMPLED_NODES_ONLY"] = b
-
+    # straight-line distances from projected node coordinates, available for any pair of nodes
     def SLD_meters_b_lookup(node1_osmid, node2_osmid):
-        return ss["distance_matrix_b_SAMPLED_NODES_ONLY"].at[node1_osmid, str(node2_osmid)] # columns are also osmids but represented as strings
+        return straight_line_distance(ss["bike_routing_graph"], node1_osmid, node2_osmid)
 
     def SLD_meters_w_lookup(node1_osmid, node2_osmid):
-        return ss["distance_matrix_w_SAMPLED_NODES_ONLY"].at[node1_osmid, str(node2_osmid)] # columns are also osmids but represented as strings
+        return straight_line_distance(ss["walk_routing_graph"], node1_osmid, node2_osmid)
 
     # DATA
-    b_list_nodes_sampled, w_list_nodes_sampled, bike_routes_dict, walk_routes_dict = ss["b_list_nodes_sampled"], ss["w_list_nodes_sampled"], ss["bike_routes_dict"], ss["walk_routes_dict"]
+    bike_routing_graph, walk_routing_graph = ss["bike_routing_graph"], ss["walk_routing_graph"]
 
     Gb_edges, Gw_edges = ss["Gb_edges"], ss["Gw_edges"]
     Gb_nodes, Gw_nodes = ss["Gb_nodes"], ss["Gw_nodes"]
@@ -211,6 +160,21 @@ if __name__ == "__main__":
 
     beta_options = [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0]
 
+    contraction_hierarchies = load_contraction_hierarchies(tuple(beta_options))
+
+    def find_route(node_o, node_d, beta, mode):
+        # use a stored path or the contraction hierarchy for this Beta if one was built, otherwise search the routing graph directly
+        store = load_stored_paths(mode, beta)
+        if store is not None:
+            path_nodes = stored_path(store, node_o, node_d)
+            if path_nodes is not None:
+                return path_nodes, path_edge_rows(routing_graph, path_nodes)
+
+        index = contraction_hierarchies.get((mode, beta))
+        if index is not None:
+            return ch_shortest_path(index, node_o, node_d)
+        return shortest_path(routing_graph, node_o, node_d, beta)
+
     final_adjustment = False
 
     # START
@@ -231,8 +195,7 @@ if __name__ == "__main__":
     def get_data_for_selected_mode(mode):
 
         if mode == "Cycling":
-            list_nodes_sampled = b_list_nodes_sampled
-            routes_dict = bike_routes_dict
+            routing_graph = bike_routing_graph
             edges = Gb_edges
             nodes = Gb_nodes
             topic = "Bikeability"
@@ -240,20 +203,19 @@ if __name__ == "__main__":
             destination_default_osmid = 5644815363
 
         elif mode == "Walking":
-            list_nodes_sampled = w_list_nodes_sampled
-            routes_dict = walk_routes_dict
+            routing_graph = walk_routing_graph
             edges = Gw_edges
             nodes = Gw_nodes
             topic = "Walkability"
             origin_default_osmid = 242433701
             destination_default_osmid = 6773492701
             
-        # Filter to selectable nodes (nodes that had been sampled from the complete set of nodes)
-        nodes_selectable = nodes.loc[list_nodes_sampled].copy(deep = True)
+        # routes are computed live, so every node of the network can be selected
+        nodes_selectable = nodes
 
-        return list_nodes_sampled, routes_dict, edges, nodes, nodes_selectable, topic, origin_default_osmid, destination_default_osmid
+        return routing_graph, edges, nodes, nodes_selectable, topic, origin_default_osmid, destination_default_osmid
     
-    list_nodes_sampled, routes_dict, edges, nodes, nodes_selectable, topic, origin_default_osmid, destination_default_osmid = get_data_for_selected_mode(mode_option)
+    routing_graph, edges, nodes, nodes_selectable, topic, origin_default_osmid, destination_default_osmid = get_data_for_selected_mode(mode_option)
 
     # Choose origin and destination
 
@@ -392,21 +354,22 @@ if __name__ == "__main__":
 
             if (pt is not None):
 
-                with st.spinner("Finding a place close to where you clicked..."):
-
-                    point_df = gpd.GeoDataFrame([{"x": pt["lng"], "y": pt["lat"]}])
-                    point_df["geometry"] = gpd.points_from_xy(point_df["x"], point_df["y"])
-                    point_df = point_df.set_crs("EPSG:4326")
+                # snap to the nearest node in meters, using the KD-tree of the routing graph
+                nearest_osmids, _ = nearest_nodes(routing_graph, pt["lng"], pt["lat"])
 
-                    nearest_node = point_df.sjoin_nearest(nodes_selectable, how = "left")[["osmid", "x_left", "y_left", "geometry"]].rename({"osmid": "Node ID", "x_left": "Longitude", "y_left": "Latitude"}, axis = 1).iloc[0]
+                nearest_node = {
+                    "Node ID": int(nearest_osmids[0]),
+                    "Latitude": pt["lat"],
+                    "Longitude": pt["lng"]
+                }
 
-                    if (nearest_node["Node ID"] != ss[nearest_node_key]["Node ID"]):
+                if (nearest_node["Node ID"] != ss[nearest_node_key]["Node ID"]):
 
-                        ss[nearest_node_key] = nearest_node
-                        
-                        ss["selected_nodes_were_just_updated"] = True
-                        print("RERUN FRAGMENT")
-                        st.rerun(scope = "fragment")
+                    ss[nearest_node_key] = nearest_node
+                    
+                    ss["selected_nodes_were_just_updated"] = True
+                    print("RERUN FRAGMENT")
+                    st.rerun(scope = "fragment")
 
             with col2:
                 with st.container(border = True):
@@ -486,21 +449,23 @@ if __name__ == "__main__":
             empty_container = st.empty()
 
 
-    # cache the masks
+    # cache the routes
     @st.cache_data(ttl = None, max_entries=2)
-    def get_edge_masks(node_o, node_d, mode):
+    def get_route_edge_rows(node_o, node_d, mode):
         result = {}
         for beta in beta_options:
-            path_nodes = routes_dict[beta][f"{node_o}, {node_d}"]
-            pairs = set([(path_nodes[i], path_nodes[i+1]) for i in range(0, len(path_nodes) - 1)])
-
-            edge_index_frame = edges.index.to_frame()
-            edge_mask = edge_index_frame[["u", "v"]].apply(lambda r: (r['u'], r['v']), axis = 1).isin(pairs)
-
-            result[beta] = edge_mask
+            path_nodes, route_edge_rows = find_route(node_o, node_d, beta, mode)
+            result[beta] = route_edge_rows
 
         return result
 
+    # the routes are needed for the map anyway, and finding them also tells whether the points are connected
+    try:
+        beta_to_edge_rows = get_route_edge_rows(node_o, node_d, mode = mode_option)
+    except ValueError:
+        st.warning("There is no route between these two points. Choose a different origin or destination.")
+        st.stop()
+
     # Map with routes
 
     st.divider()
@@ -509,7 +474,7 @@ if __name__ == "__main__":
         ss["show_routes_default"] = False
 
     @st.fragment
-    def show_routes_map(node_o, node_d, mode_option):
+    def show_routes_map(node_o, node_d, mode_option, beta_to_edge_rows):
 
         def on_toggle_show_routes(data_key):
             ss["show_routes_default"] = ss[data_key]
@@ -542,51 +507,58 @@ if __name__ == "__main__":
 
             # show routes for betas
 
-            style_selected_betas = lambda x: {
+            style_selected_betas = {
                 "color": "blue",
                 "weight": 13,
                 "opacity": 0.5,
             }
 
-            style_grayed_betas = lambda x: {
+            style_grayed_betas = {
                 "color": "white",
                 "weight": 10,
                 "opacity": 0.3,
             }
 
-            beta_to_edge_mask = get_edge_masks(node_o, node_d, mode = mode_option)
-            
+            edge_coords = ss["bike_edge_coords"] if (mode_option == "Cycling") else ss["walk_edge_coords"]
+
             progressbar = st.progress(int(0), "Finding Routes...")
 
-            for i, beta in enumerate(beta_options):
-                part = i + 1
-                progressbar.progress(100 * part // (4 // 3 * len(beta_options)))
+            # group the edges by the set of Betas whose routes use them, so that every edge is sent once: in the gray outline,
+            # and in the blue layer of its group (labelled with those Betas)
+            row_to_betas = {}
+            for beta in beta_options:
+                for row in beta_to_edge_rows[beta].tolist():
+                    row_to_betas.setdefault(row, []).append(beta)
 
-                show_selected_beta_routes = (beta == 0.0)
+            groups = sorted(set(tuple(betas) for betas in row_to_betas.values()), key = lambda betas: (-len(betas), betas))
 
-                edge_mask = beta_to_edge_mask[beta]
+            gray_layer = folium.FeatureGroup(name = "gray (NO TOGGLE)", control = False).add_to(m)
+            group_layers = []
 
-                row = {"beta": beta, "geometry": edges.loc[edge_mask].union_all()}
+            for part, betas in enumerate(groups, start = 1):
+                progressbar.progress(100 * part // (4 // 3 * len(groups)))
 
-                gdf = gpd.GeoDataFrame([row], crs = "EPSG:4326")
+                # drawn along the route of the group's first Beta, which passes through all of the group's edges
+                route = beta_to_edge_rows[betas[0]]
+                in_group = np.array([tuple(row_to_betas[row]) == betas for row in route.tolist()], dtype = bool)
+                lines = route_polylines(edge_coords, route, keep = in_group)
 
-                m.add_gdf(
-                    gdf,
-                    layer_name = f"gray Beta={beta} (NO TOGGLE)",
-                    style_function = style_grayed_betas,
-                    control = False
-                )
+                if len(betas) == len(beta_options):
+                    layer_name = "Path (all Betas)"
+                else:
+                    layer_name = f"Path (Beta={', '.join(str(beta) for beta in betas)})"
 
-                selected_layer_name = f"Path (Beta={beta})"
+                show_selected_beta_routes = (0.0 in betas)
 
-                m.add_gdf(
-                    gdf,
-                    layer_name = selected_layer_name,
-                    style_function = style_selected_betas,
-                    control = True,
-                    show = show_selected_beta_routes
-                )
-                
+                group_layer = folium.FeatureGroup(name = layer_name, control = True, show = show_selected_beta_routes)
+                if lines:
+                    folium.PolyLine(lines, **style_grayed_betas).add_to(gray_layer)
+                    folium.PolyLine(lines, **style_selected_betas).add_to(group_layer)
+                group_layers.append(group_layer)
+
+            # blue layers go on top of the gray outline
+            for group_layer in group_layers:
+                group_layer.add_to(m)
 
             # end loop
 
@@ -626,7 +598,7 @@ if __name__ == "__main__":
 
         return None
     
-    show_routes_map(node_o, node_d, mode_option)
+    show_routes_map(node_o, node_d, mode_option, beta_to_edge_rows)
 
     st.divider()
 
@@ -661,7 +633,8 @@ if __name__ == "__main__":
                 None, # not needed
                 path_specific_results,
                 place_name = "Your Selected Origin and Destination",
-                mode = topic
+                mode = topic,
+                beta_note = f"Each point is a different route. Its Beta is the lowest Beta (from 0 to {max(beta_options)}) for which the route is optimal; it stays optimal until the Beta of the next point."
             )
 
             progressbar.progress(100)
@@ -671,6 +644,144 @@ if __name__ == "__main__":
 
     show_curve_plot(node_o, node_d, mode_option)
 
+    # Reachable area from the origin
+
+    st.divider()
+
+    if "show_reachable_area_default" not in ss:
+        ss["show_reachable_area_default"] = False
+
+    # comfortable travel speed used to turn the time budget into a comfort-weighted distance (meters per minute)
+    travel_speeds = {"Cycling": 250, "Walking": 80}
+
+    @st.fragment
+    def show_reachable_area(node_o, mode_option):
+
+        def on_toggle_show_reachable_area(data_key):
+            ss["show_reachable_area_default"] = ss[data_key]
+
+        this_key = f"{mode_option}_TOGGLE_SHOW_REACHABLE_AREA"
+        show_area = st.toggle(
+            "Show Reachable Area from Origin",
+            key = this_key,
+            value = ss["show_reachable_area_default"],
+            on_change = on_toggle_show_reachable_area,
+            args = (this_key,)
+        )
+
+        if show_area:
+
+            col1, col2 = st.columns([1, 2])
+
+            with col1:
+                beta = st.selectbox(
+                    "Beta (Discomfort Sensitivity)",
+                    options = beta_options,
+                    index = beta_options.index(1.0),
+                    key = f"{mode_option}_REACHABLE_AREA_BETA"
+                )
+
+            with col2:
+                minutes = st.slider(
+                    "Time budget (minutes)",
+                    min_value = 1,
+                    max_value = 30,
+                    value = 15,
+                    key = f"{mode_option}_REACHABLE_AREA_MINUTES"
+                )
+
+            speed = travel_speeds[mode_option]
+            budget = minutes * speed
+
+            st.caption(f"Each street counts as its length plus Beta times its discomfort, travelled at {speed * 60 / 1000:.1f} km/h. Uncomfortable streets therefore take longer, and more so for higher Beta.")
+
+            # the search is kept and extended when the budget grows, so dragging the slider does not start over
+            state_key = f"{mode_option}_REACHABLE_AREA_SEARCH"
+            search_id = (node_o, beta)
+            if (state_key not in ss) or (ss[state_key]["id"] != search_id):
+                ss[state_key] = {"id": search_id, "state": None}
+
+            weights = objective_weights(routing_graph, beta)
+            source = node_positions(routing_graph, [node_o])[0]
+
+            ss[state_key]["state"] = bounded_search(routing_graph, weights, source, budget, state = ss[state_key]["state"])
+            reached_positions, reached_entries = reachable_within(routing_graph, weights, ss[state_key]["state"], budget)
+
+            reached_edge_rows = routing_graph["edge_rows"][reached_entries]
+
+            # two-way streets have one edge per direction, so count each pair of nodes once
+            tails, heads = routing_graph["tails"][reached_entries], routing_graph["heads"][reached_entries]
+            _, first_of_pair = np.unique(np.minimum(tails, heads).astype(np.int64) * len(routing_graph["node_ids"]) + np.maximum(tails, heads), return_index = True)
+            street_km = edges["length"].to_numpy()[reached_edge_rows[first_of_pair]].sum() / 1000
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Reachable places (nodes)", f"{len(reached_positions):,}")
+            col2.metric("Reachable streets", f"{street_km:.1f} km")
+            
+            mapcenter = (14.581912, 121.037947)
+            m3 = leafmap.Map(center = mapcenter)
+
+            m3.add_gdf(
+                city_geo,
+                layer_name = "Mandaluyong",
+                style_function = lambda x: {
+                    "color": "black",
+                    "opacity": 0.5,
+                    "fillOpacity": 0.0,
+                    "fillColor": "none",
+                },
+                control = False # this disables toggle
+            )
+
+            if len(reached_positions) >= 3:
+                area = reachable_area(routing_graph, reached_positions)
+                col3.metric("Reachable area", f"{gpd.GeoSeries([area], crs = 'EPSG:4326').to_crs(PROJECTED_CRS).area.iloc[0] / 1e6:.2f} sq. km")
+
+                m3.add_gdf(
+                    gpd.GeoDataFrame({"geometry": [area]}, crs = "EPSG:4326"),
+                    layer_name = "Reachable Area",
+                    style_function = lambda x: {
+                        "color": "blue",
+                        "weight": 1,
+                        "fillColor": "blue",
+                        "fillOpacity": 0.1,
+                    },
+                    control = True
+                )
+
+            if len(reached_edge_rows) > 0:
+                m3.add_gdf(
+                    gpd.GeoDataFrame({"geometry": [edges.geometry.iloc[reached_edge_rows].union_all()]}, crs = "EPSG:4326"),
+                    layer_name = "Reachable Streets",
+                    style_function = lambda x: {
+                        "color": "blue",
+                        "weight": 3,
+                        "opacity": 0.6,
+                    },
+                    control = True
+                )
+
+            m3.add_marker(
+                location = tuple(nodes_selectable.loc[node_o, ["y", "x"]]),
+                tooltip = "Origin",
+                icon = folium.Icon(
+                    prefix = "fa",
+                    icon = "circle-play",
+                    color = "green"
+                )
+            )
+
+            m3.fit_bounds(
+                [[14.565835, 121.014223],
+                [14.604602, 121.064785]],
+            )
+
+            m3.to_streamlit(height = 400, bidirectional=False)
+
+        return None
+
+    show_reachable_area(node_o, mode_option)
+
     if final_adjustment:
         with empty_container:
             st.success("Analyses successfully updated using new origin and destination.")
\ No newline at end of file
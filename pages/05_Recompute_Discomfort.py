@@ -4,11 +4,14 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
+from matplotlib.collections import LineCollection
 import seaborn as sns
 import altair as alt
 import geopandas as gpd
+import shapely
 
 from discomfort_score_metadata import load_discomfort_score_component_info
+from shared_functions import load_discomfort_basis, rescore_rows_from_weights, cached_session_scores, iter_rescore_discomfort_from_weights, explain_edge_scores
 
 #--------------------------------------------
 
@@ -26,415 +29,8 @@ st.set_page_config(page_title=page_title, page_icon=page_icon, layout="centered"
 
 # Preparations
 
-# BIKING DISCOMFORT
-
-def biking_discomfort(s, weights, weights_main_components, preproc_Gb, details = False):
-    """Compute biking discomfort for a row from a dataframe of edges.
-    
-s: Series. The row.
-
-weights: dict. Keys should be same as column names of dataframe.
-"""
-
-    # get variables from other function
-    sidewalk_description, has_left_sidewalk_status, has_right_sidewalk_status, is_crossing_status, bicycle_status, cycleway_lane_type, cycleway_description, cycleway_left_lane_type, cycleway_right_lane_type, cycleway_class, cycleway_left_class, cycleway_right_class, parking_left_description, parking_right_description, width_comp, lit_comp, maxspeed_comp, segregated_comp, crossing_tag_comp, edsa_accident_comp, motor_vehicle_comp = preproc_Gb.loc[s.name].values
-
-    #----------
-    # DISMOUNT
-
-    # sidewalk_description: is_sidewalk, has_sidewalk
-    # note to self: being-a-bike-lane should always be scored negatively
-
-    if bicycle_status == "dismount":
-
-        foot_comp = {
-            "yes": -2,
-            "designated": -1,
-            "use_sidepath": 2,
-        }.get(s["foot"], 0)
-
-        # alley_comp replaces footway_comp, service_comp for Gb
-        is_alley_status = (s["footway"] == "alley") or (s["service"] == "alley")
-        alley_comp = -1 if is_alley_status else 0
-
-        highway_comp = {
-            "footway": -4,
-            "pedestrian": -3,
-            "living_street": -2,
-            "path": -1,
-            "residential": -0.5,
-        }.get(s["highway"], 0)
-
-        # sidewalk
-        sidewalk_comp = 0
-        if has_left_sidewalk_status:
-            sidewalk_comp -= 1
-        if has_right_sidewalk_status:
-            sidewalk_comp -= 1
-
-        parking_subtags_comp = 0
-        parking_subtags_comp += {
-            "no": -0.5,
-            "half_on_kerb": 1,
-            "lane": 0.5
-        }.get(parking_left_description, 0)
-        parking_subtags_comp += {
-            "no": -0.5,
-            "half_on_kerb": 1,
-            "lane": 0.5
-        }.get(parking_right_description, 0)
-
-        # FROM IMAGE DATA
-        greenery_ratio_comp = 0
-        if pd.notnull(s["FROM_IMAGES_greenery_ratio"]):
-            greenery_ratio_comp = s["FROM_IMAGES_greenery_ratio"] - 1
-
-        # other that weren't considered for dismount
-        bicycle_comp = 0
-        cycleway_class_comp = 0
-        cycleway_lane_type_comp = 0
-        cycling_lane_coverage_comp = 0
-        has_bicycle_comp = 0
-        road_condition_comp = 0
-
-    # -------
-    # NON-DISMOUNT, can ride bike
-
-    # elif bicycle_status in ("yes", "permissive", "destination", "no"):
-    else:
-
-        bicycle_comp = {
-            "yes": -3,
-            "permissive": -2,
-            "destination": -1,
-            # note that "no" here is not the actual value "no" but the default value for the bicycle info variable
-        }.get(bicycle_status, 0)
-        # check actual value of bicycle
-        if s["bicycle"] == "no":
-            bicycle_comp = 3
-
-        cycleway_class_comp = 0
-        cycleway_class_comp += {
-            "class 3": -1,
-            "class 2": -2,
-            "class 1": -4,
-            "unknown_but_one_of_the_two_must_exist": -1
-        }.get(cycleway_left_class, 0)
-        cycleway_class_comp += {
-            "class 3": -1,
-            "class 2": -2,
-            "class 1": -4,
-            "unknown_but_one_of_the_two_must_exist": -1
-        }.get(cycleway_right_class, 0)
-
-        cycleway_lane_type_comp = 0
-        cycleway_lane_type_comp += {
-            "lane": -1,
-            "shared_lane": 1,
-            "unknown_but_one_of_the_two_must_exist": -1
-        }.get(cycleway_left_lane_type, 0)
-        cycleway_lane_type_comp += {
-            "lane": -1,
-            "shared_lane": 1,
-            "unknown_but_one_of_the_two_must_exist": -1
-        }.get(cycleway_right_lane_type, 0)
-
-        foot_comp = {
-            "yes": 1,
-            "designated": 2,
-        }.get(s["foot"], 0)
-
-        # alley_comp replaces footway_comp, service_comp for Gb
-        is_alley_status = (s["footway"] == "alley") or (s["service"] == "alley")
-        alley_comp = 1 if is_alley_status else 0
-
-        highway_comp = {
-            "footway": -2,
-            "pedestrian": -3,
-            "living_street": -4,
-            "path": -1,
-            "residential": -0.5,
-        }.get(s["highway"], 0)
-
-        parking_subtags_comp = 0
-        parking_subtags_comp += {
-            "no": -1,
-            "half_on_kerb": 0.5,
-            "lane": 1
-        }.get(parking_left_description, 0)
-        parking_subtags_comp += {
-            "no": -1,
-            "half_on_kerb": 0.5,
-            "lane": 1
-        }.get(parking_right_description, 0)
-
-        # FROM IMAGE DATA
-        cycling_lane_coverage_comp = 0
-        if pd.notnull(s["FROM_IMAGES_cycling_lane_coverage"]):
-            cycling_lane_coverage_comp = s["FROM_IMAGES_cycling_lane_coverage"] - 1 # Subtract 1 because range is 0-1. Should be negative.
-        
-        greenery_ratio_comp = 0
-        if pd.notnull(s["FROM_IMAGES_greenery_ratio"]):
-            greenery_ratio_comp = s["FROM_IMAGES_greenery_ratio"] - 1
-
-        has_bicycle_comp = 0
-        if pd.notnull(s["FROM_IMAGES_has_bicycle"]):
-            greenery_ratio_comp = s["FROM_IMAGES_has_bicycle"] - 1
-
-        road_condition_comp = 0
-        if pd.notnull(s["FROM_IMAGES_road_condition"]):
-            road_condition_comp = (s["FROM_IMAGES_road_condition"] - 1)
-
-        # other that weren't considered for non-dismount
-        sidewalk_comp = 0
-
-    #---
-    # final part
-
-    dismount_comp = 10 if bicycle_status == "dismount" else 0
-
-    subcomponent_dict_UNWEIGHTED = {
-        "bicycle": bicycle_comp,
-        "CYCLEWAY_CLASS": cycleway_class_comp,
-        "CYCLEWAY_LANE_TYPE": cycleway_lane_type_comp,
-        "foot": foot_comp,
-        "highway": highway_comp,
-        "ALLEY": alley_comp,
-        "width": width_comp,
-        "lit": lit_comp,
-        "maxspeed": maxspeed_comp,
-        "segregated": segregated_comp,
-        "sidewalk": sidewalk_comp,
-        "PARKING_SUBTAGS": parking_subtags_comp,
-        "TAG_crossing": crossing_tag_comp,
-        "EDSA_accident_component": edsa_accident_comp,
-        "motor_vehicle": motor_vehicle_comp,
-
-        # FROM IMAGE DATA
-        "FROM_IMAGES_cycling_lane_coverage": cycling_lane_coverage_comp,
-        "FROM_IMAGES_greenery_ratio": greenery_ratio_comp,
-        "FROM_IMAGES_has_bicycle": has_bicycle_comp,
-        "FROM_IMAGES_road_condition": road_condition_comp,
-    }
-
-    subcomponent_dict_WEIGHTED = {subcomponent_name: (value * weights.get(subcomponent_name, 1))
-                                  for subcomponent_name, value in subcomponent_dict_UNWEIGHTED.items()}
-    subcomponent_dict_WEIGHTED["DISMOUNT"] = dismount_comp
-
-    main_component_dict_UNWEIGHTED_reference = {
-        # the ff are based on the Feature groupings document
-        "DISMOUNT": ("DISMOUNT", ),
-        "convenience": ("bicycle", "ALLEY", "segregated", "PARKING_SUBTAGS", "foot", "FROM_IMAGES_road_condition"),
-        "attractiveness": ("FROM_IMAGES_greenery_ratio", ),
-        "traffic_safety": ("CYCLEWAY_CLASS", "CYCLEWAY_LANE_TYPE", "FROM_IMAGES_cycling_lane_coverage", "width", "maxspeed"),
-        "security": ("lit", "FROM_IMAGES_has_bicycle"),
-
-        # the ff are additional main components added in order to be able to use all of the subcomponents
-        "accident_risk": ("EDSA_accident_component", ),
-        "traffic_volume": ("highway", "motor_vehicle"),
-        "safety_of_sidewalks_and_crossings": ("sidewalk", "TAG_crossing"),
-    }
-
-    main_component_dict_UNWEIGHTED = {
-        key: sum([subcomponent_dict_WEIGHTED[subcomp] for subcomp in l]) # take the sum of the WEIGHTED versions of the subcomponents, in order to get the UNweighted main component.
-        for key, l
-        in main_component_dict_UNWEIGHTED_reference.items()
-    }
-
-    main_component_dict_WEIGHTED = {main_component_name: value * weights_main_components[main_component_name] for main_component_name, value in main_component_dict_UNWEIGHTED.items()}
-
-    score1 = sum(main_component_dict_WEIGHTED.values())
-    score2 = sum(subcomponent_dict_WEIGHTED.values())
-
-    # breakdown_dict = {
-    #     "subcomponent_dict_WEIGHTED": subcomponent_dict_WEIGHTED,
-    #     "subcomponent_dict_UNWEIGHTED": subcomponent_dict_UNWEIGHTED,
-    #     "main_component_dict_WEIGHTED": main_component_dict_WEIGHTED,
-    #     "main_component_dict_UNWEIGHTED": main_component_dict_UNWEIGHTED
-    # }
-
-    output_dict = {
-        "score_weighted_by_main": score1,
-        "score_weighted_by_sub": score2,
-        # "breakdown_dict": breakdown_dict
-    }
-
-    if details:
-        output_dict.update({f"SW_{key}": value for key, value in subcomponent_dict_WEIGHTED.items()})
-        output_dict.update({f"SU_{key}": value for key, value in subcomponent_dict_UNWEIGHTED.items()})
-        output_dict.update({f"MW_{key}": value for key, value in main_component_dict_WEIGHTED.items()})
-        output_dict.update({f"MU_{key}": value for key, value in main_component_dict_UNWEIGHTED.items()})
-
-    output = pd.Series(output_dict)
-
-    return output
-
-# WALKING DISCOMFORT
-
-def walking_discomfort(s, weights, weights_main_components, preproc_Gw, details = False):
-    """Compute walking discomfort for a row from a dataframe of edges.
-    
-s: Series. The row.
-
-weights: dict. Keys should be same as column names of dataframe.
-"""
-
-    # get variables from other function
-    sidewalk_description, has_left_sidewalk_status, has_right_sidewalk_status, is_crossing_status, bicycle_status, cycleway_lane_type, cycleway_description, cycleway_left_lane_type, cycleway_right_lane_type, cycleway_class, cycleway_left_class, cycleway_right_class, parking_left_description, parking_right_description, width_comp, lit_comp, maxspeed_comp, segregated_comp, crossing_tag_comp, edsa_accident_comp, motor_vehicle_comp = preproc_Gw.loc[s.name].values
-
-    foot_comp = {
-        "yes": -2,
-        "designated": -1,
-        "use_sidepath": 2,
-    }.get(s["foot"], 0)
-
-    # alley_comp replaces footway_comp, service_comp for Gb
-    is_alley_status = (s["footway"] == "alley") or (s["service"] == "alley")
-    alley_comp = -1 if is_alley_status else 0
-
-    highway_comp = {
-        "footway": -4,
-        "pedestrian": -3,
-        "living_street": -2,
-        "path": -1,
-        "residential": -0.5,
-        "steps": 1,
-    }.get(s["highway"], 0)
-
-    # sidewalk
-    sidewalk_comp = 0
-    if has_left_sidewalk_status:
-        sidewalk_comp -= 1
-    if has_right_sidewalk_status:
-        sidewalk_comp -= 1
-
-    parking_subtags_comp = 0
-    parking_subtags_comp += {
-        "no": -0.5,
-        "half_on_kerb": 1,
-        "lane": 0.5
-    }.get(parking_left_description, 0)
-    parking_subtags_comp += {
-        "no": -0.5,
-        "half_on_kerb": 1,
-        "lane": 0.5
-    }.get(parking_right_description, 0)
-
-    # FROM IMAGE DATA
-
-    sidewalk_ratio_comp = 0
-    if pd.notnull(s["FROM_IMAGES_sidewalk_ratio"]):
-        sidewalk_ratio_comp = s["FROM_IMAGES_sidewalk_ratio"] - 1
-    
-    greenery_ratio_comp = 0
-    if pd.notnull(s["FROM_IMAGES_greenery_ratio"]):
-        greenery_ratio_comp = s["FROM_IMAGES_greenery_ratio"] - 1
-
-    # has_traffic_sign_comp = 0
-    # if pd.notnull(s["FROM_IMAGES_has_traffic_sign"]):
-    #     has_traffic_sign_comp = (s["FROM_IMAGES_has_traffic_sign"] - 1) * 0.5
-
-    road_condition_comp = 0
-    if pd.notnull(s["FROM_IMAGES_road_condition"]):
-        road_condition_comp = (s["FROM_IMAGES_road_condition"] - 1)
-
-    has_traffic_light_comp = 0
-    if pd.notnull(s["FROM_IMAGES_has_traffic_light"]):
-        has_traffic_light_comp = (s["FROM_IMAGES_has_traffic_light"] - 1) * 0.5
-
-    has_crosswalk_comp = 0
-    if pd.notnull(s["FROM_IMAGES_has_crosswalk"]):
-        has_crosswalk_comp = (s["FROM_IMAGES_has_crosswalk"] - 1)
-
-    obstruction_density_comp = 0
-    if pd.notnull(s["FROM_IMAGES_obstruction_density"]):
-        obstruction_density_comp = (s["FROM_IMAGES_obstruction_density"] - 1)
-
-
-    subcomponent_dict_UNWEIGHTED = {
-        "foot": foot_comp,
-        "highway": highway_comp,
-        "ALLEY": alley_comp,
-        "width": width_comp,
-        "lit": lit_comp,
-        "maxspeed": maxspeed_comp,
-        "segregated": segregated_comp,
-        "sidewalk": sidewalk_comp,
-        "PARKING_SUBTAGS": parking_subtags_comp,
-        "TAG_crossing": crossing_tag_comp,
-        "EDSA_accident_component": edsa_accident_comp,
-        "motor_vehicle": motor_vehicle_comp,
-
-        # FROM IMAGE DATA
-        "FROM_IMAGES_sidewalk_ratio": sidewalk_ratio_comp,
-        "FROM_IMAGES_greenery_ratio": greenery_ratio_comp,
-        # "FROM_IMAGES_has_traffic_sign": has_traffic_sign_comp,
-        "FROM_IMAGES_road_condition": road_condition_comp,
-        "FROM_IMAGES_has_traffic_light": has_traffic_light_comp,
-        "FROM_IMAGES_has_crosswalk": has_crosswalk_comp,
-        "FROM_IMAGES_obstruction_density": obstruction_density_comp,
-    }
-
-    subcomponent_dict_WEIGHTED = {subcomponent_name: value * weights[subcomponent_name] for subcomponent_name, value in subcomponent_dict_UNWEIGHTED.items()}
-
-    main_component_dict_UNWEIGHTED_reference = {
-        # the ff are based on the Feature groupings document
-        "convenience": ("ALLEY", "foot", "segregated", "PARKING_SUBTAGS",
-                        "FROM_IMAGES_obstruction_density", "FROM_IMAGES_road_condition",),
-        "traffic_volume": ("highway", "motor_vehicle"),
-        "traffic_speed": ("width", "maxspeed", "FROM_IMAGES_has_traffic_light"),
-        "attractiveness": ("FROM_IMAGES_greenery_ratio", ),
-
-        # the ff are additional main components added in order to be able to use all of the subcomponents
-        "accident_risk": ("EDSA_accident_component", ),
-        "safety_of_sidewalks": ("sidewalk", "FROM_IMAGES_sidewalk_ratio", "lit"),
-        "safety_of_crossings": ("TAG_crossing", "FROM_IMAGES_has_crosswalk")
-    }
-
-    main_component_dict_UNWEIGHTED = {
-        key: sum([subcomponent_dict_WEIGHTED[subcomp] for subcomp in l]) # take the sum of the WEIGHTED versions of the subcomponents, in order to get the UNweighted main component.
-        for key, l
-        in main_component_dict_UNWEIGHTED_reference.items()
-    }
-
-    main_component_dict_WEIGHTED = {main_component_name: value * weights_main_components[main_component_name] for main_component_name, value in main_component_dict_UNWEIGHTED.items()}
-
-    score1 = sum(main_component_dict_WEIGHTED.values())
-    score2 = sum(subcomponent_dict_WEIGHTED.values())
-
-    # breakdown_dict = {
-    #     "subcomponent_dict_WEIGHTED": subcomponent_dict_WEIGHTED,
-    #     "subcomponent_dict_UNWEIGHTED": subcomponent_dict_UNWEIGHTED,
-    #     "main_component_dict_WEIGHTED": main_component_dict_WEIGHTED,
-    #     "main_component_dict_UNWEIGHTED": main_component_dict_UNWEIGHTED
-    # }
-
-    output_dict = {
-        "score_weighted_by_main": score1,
-        "score_weighted_by_sub": score2,
-        # "breakdown_dict": breakdown_dict
-    }
-
-    if details:
-
-        output_dict.update({f"SW_{key}": value for key, value in subcomponent_dict_WEIGHTED.items()})
-        output_dict.update({f"SU_{key}": value for key, value in subcomponent_dict_UNWEIGHTED.items()})
-        output_dict.update({f"MW_{key}": value for key, value in main_component_dict_WEIGHTED.items()})
-        output_dict.update({f"MU_{key}": value for key, value in main_component_dict_UNWEIGHTED.items()})
-
-    output = pd.Series(output_dict)
-
-    return output
-
 # Load data
 
-@st.cache_data(ttl = None, max_entries = 1)
-def load_preproc():
-    preproc_Gb = pd.read_csv("discomfort_and_curve_data/preproc_Gb.csv").set_index(["u", "v", "key"], drop = True)
-    preproc_Gw = pd.read_csv("discomfort_and_curve_data/preproc_Gw.csv").set_index(["u", "v", "key"], drop = True)
-
-    return preproc_Gb, preproc_Gw
-
 @st.cache_data(ttl = None, max_entries = 1)
 def load_nodes_and_edges():
     folder = "discomfort_and_curve_data/"
@@ -457,6 +53,43 @@ def get_norm(discomfort_score_entries):
     
     return vmin, vmax, norm
 
+def get_edge_segments(edges):
+    """List of (n, 2) coordinate arrays, one per edge, in the same order as `edges`."""
+    coords, edge_positions = shapely.get_coordinates(edges.geometry.values, return_index = True)
+    counts = np.bincount(edge_positions, minlength = len(edges))
+    return np.split(coords, np.cumsum(counts)[:-1])
+
+def make_progressive_canvas():
+    """Empty map figure whose pixel buffer is kept between chunks, so that each chunk is drawn only once."""
+    fig, ax = plt.subplots(figsize = (3, 2.5), dpi = 200)
+    ax.set_xlim(0.015+1.21e2, 0.065+1.21e2)
+    ax.set_ylim(14.565, 14.602)
+    ax.set_aspect(1)
+    plt.axis(False)
+
+    # render the empty background once; chunks are then drawn on top of it
+    fig.canvas.draw()
+
+    return fig, ax
+
+def draw_chunk_on_canvas(fig, ax, segments, values, cmap, norm):
+    """Draw only the given edges onto the existing canvas and return a copy of the resulting image."""
+    collection = LineCollection(segments, linewidths = 0.5, cmap = cmap, norm = norm)
+    collection.set_array(values)
+
+    ax.add_collection(collection, autolim = False)
+    ax.draw_artist(collection)
+    # the pixels stay in the canvas buffer; removing the artist keeps later draws from repeating it
+    collection.remove()
+
+    return np.array(fig.canvas.buffer_rgba())
+
+def edge_label(edges, edge_id, score):
+    name = edges.at[edge_id, "name"]
+    if not isinstance(name, str):
+        name = "Unnamed street"
+    return f"{name} ({edge_id[0]} to {edge_id[1]}): {score:.2f}"
+
 
 #----------------------------------------------
 
@@ -486,10 +119,9 @@ if __name__ == "__main__":
         ss["w_maincomp_info"] = walk_main_component_name_to_display_info
 
     # additional
-    if ("preproc_Gb" not in ss) or ("preproc_Gw" not in ss):
-        preproc_Gb, preproc_Gw = load_preproc()
-        ss["preproc_Gb"] = preproc_Gb
-        ss["preproc_Gw"] = preproc_Gw
+    # unweighted subcomponents per edge; weight changes are applied to these as a matrix product
+    if ("bike_discomfort_basis" not in ss) or ("walk_discomfort_basis" not in ss):
+        ss["bike_discomfort_basis"], ss["walk_discomfort_basis"] = load_discomfort_basis()
 
     if any([key not in ss for key in ["Gb_edges", "Gb_nodes", "Gw_edges", "Gw_nodes"]]):
         Gb_edges, Gb_nodes, Gw_edges, Gw_nodes = load_nodes_and_edges()
@@ -521,10 +153,7 @@ if __name__ == "__main__":
 
         empty_PLOT = st.empty()
 
-        fig, ax = plt.subplots(figsize = (3, 2.5))
-        ax.set_xlim(0.015+1.21e2, 0.065+1.21e2)
-        ax.set_ylim(14.565, 14.602)
-        plt.axis(False)
+        fig, ax = make_progressive_canvas()
 
         chosen_cmap = sns.diverging_palette(
             10, 145, center = "light",
@@ -533,117 +162,111 @@ if __name__ == "__main__":
             as_cmap = True
         )
 
-        if cycling_button:
-
-            discomfort_score_entries = []
-            counter = 0
-            for index, s in ss["Gb_edges"].iterrows():
-
-                is_dismount = (ss["preproc_Gb"].loc[s.name]["bicycle_status"] == "dismount")
-
-                if (counter % 2000) == 2:
-                    rounded_perc = int(round(counter / ss["Gb_edges"].shape[0] * 100, 0))
-                    progressbar.progress(rounded_perc, text = f"Working on {which} discomfort... {rounded_perc}%")
-
-                    vmin, vmax, norm = get_norm(discomfort_score_entries)
-
-                    with empty_PLOT:
-                            
-                        subset = ss["Gb_edges"].iloc[:counter]
-                        subset.plot(
-                            -1 * pd.Series(discomfort_score_entries[:counter], index = subset.index),
-                            aspect = 1,
-                            ax = ax,
-                            linewidth = 0.5,
-                            cmap = chosen_cmap,
-                            norm = norm,
-                            vmin = vmin,
-                            vmax = vmax
-                        )
-                        st.pyplot(fig, use_container_width=False)
-
-                score = biking_discomfort(
-                    s,
-                    weights = ss["weights_sub_bike_DISMOUNT"] if is_dismount else ss["weights_sub_bike_CYCLE"],
-                    weights_main_components = ss["weights_main_bike"],
-                    preproc_Gb = ss["preproc_Gb"]
-                )["score_weighted_by_main"]
-            
-                discomfort_score_entries.append(score)
-
-                counter += 1
-
-            # complete the progress bar
-            progressbar.progress(100, text = f"Working on {which} discomfort... 100%")
-            with empty_PLOT:
-                vmin, vmax, norm = get_norm(discomfort_score_entries)
-
-                subset = ss["Gb_edges"]
-                subset.plot(
-                    -1 * pd.Series(discomfort_score_entries, index = subset.index),
-                    aspect = 1, ax = ax, linewidth = 0.5, cmap = chosen_cmap, norm = norm, vmin = vmin, vmax = vmax)
-                st.pyplot(fig, use_container_width=False)
-
-            # store results
-            
-            result = pd.Series(discomfort_score_entries, index = ss["Gb_edges"].index)
-            ss["Gb_edges_discomfort"] = result
-
-            ### TEST ONLY
-            # st.write(ss["Gb_edges_discomfort"].mean())
-            
-        elif walking_button:
-
-            discomfort_score_entries = []
-            counter = 0
-            for index, s in ss["Gw_edges"].iterrows():
-                
-                if (counter % 2000) == 2:
-                    rounded_perc = int(round(counter / ss["Gb_edges"].shape[0] * 100, 0))
-                    progressbar.progress(rounded_perc, text = f"Working on {which} discomfort... {rounded_perc}%")
-
-                    vmin, vmax, norm = get_norm(discomfort_score_entries)
-
-                    # empty_element.empty()
-                    with empty_PLOT:
-                        subset = ss["Gw_edges"].iloc[:counter]
-                        subset.plot(
-                            -1 * pd.Series(discomfort_score_entries[:counter], index = subset.index),
-                            aspect = 1, ax = ax, linewidth = 0.5, cmap = chosen_cmap, norm = norm, vmin = vmin, vmax = vmax
-                            )
-                        st.pyplot(fig, use_container_width=False)
-
-                score = walking_discomfort(
-                    s,
-                    weights = ss["weights_sub_walk"],
-                    weights_main_components = ss["weights_main_walk"],
-                    preproc_Gw = ss["preproc_Gw"]
-                )["score_weighted_by_main"]
-            
-                discomfort_score_entries.append(score)
-
-                counter += 1
-
-            # complete the progress bar
-            progressbar.progress(100, text = f"Working on {which} discomfort... 100%")
+        mode, edges_key = ("bike", "Gb_edges") if cycling_button else ("walk", "Gw_edges")
+
+        cached_scores = cached_session_scores(mode)
+
+        if cached_scores is not None:
+            # all scores are already known, so the final colour normalisation is used from the start
+            vmin, vmax, norm = get_norm(cached_scores["score_weighted_by_main"].to_numpy())
+        else:
+            # provisional colour normalisation from every 10th edge, for the chunks drawn before all scores are known
+            vmin, vmax, norm = get_norm(rescore_rows_from_weights(mode, slice(None, None, 10))["score_weighted_by_main"].to_numpy())
+
+        edges = ss[edges_key]
+        segments = get_edge_segments(edges)
+        num_edges = len(segments)
+        num_done = 0
+
+        # score the edges in chunks, and draw each chunk as soon as it is scored
+        for chunk in iter_rescore_discomfort_from_weights(mode, chunk_size = 2000, scores = cached_scores):
+            positions = edges.index.get_indexer(chunk.index)
+            found = positions >= 0
+
+            image = draw_chunk_on_canvas(
+                fig, ax,
+                [segments[i] for i in positions[found]],
+                -1 * chunk["score_weighted_by_main"].to_numpy()[found],
+                chosen_cmap, norm
+            )
+
+            num_done += len(chunk)
+            rounded_perc = int(round(min(num_done / num_edges, 1) * 100, 0))
+            progressbar.progress(rounded_perc, text = f"Working on {which} discomfort... {rounded_perc}%")
 
             with empty_PLOT:
+                st.image(image, width = 300)
+
+        plt.close(fig)
 
-                vmin, vmax, norm = get_norm(discomfort_score_entries)
+        if cached_scores is None:
+            # final colour normalisation from all scores, applied once to the whole map
+            discomfort_score_entries = ss[f"G{mode[0]}_edges_discomfort"].reindex(edges.index).to_numpy()
+            vmin, vmax, norm = get_norm(discomfort_score_entries)
 
-                subset = ss["Gw_edges"]
-                subset.plot(
-                    -1 * pd.Series(discomfort_score_entries, index = subset.index),
-                    aspect = 1, ax = ax, linewidth = 0.5, cmap = chosen_cmap, norm = norm, vmin = vmin, vmax = vmax)
-                st.pyplot(fig, use_container_width=False)
+            fig, ax = make_progressive_canvas()
+            image = draw_chunk_on_canvas(fig, ax, segments, -1 * discomfort_score_entries, chosen_cmap, norm)
+            plt.close(fig)
 
-            # store results
-            result = pd.Series(discomfort_score_entries, index = ss["Gw_edges"].index)
-            ss["Gw_edges_discomfort"] = result
+            with empty_PLOT:
+                st.image(image, width = 300)
 
-            # ### TEST ONLY
-            # st.write(ss["Gw_edges_discomfort"].mean())
+        # results are stored in ss["Gb_edges_discomfort"] or ss["Gw_edges_discomfort"] once the last chunk is done
 
         # final info pop-up
         with empty_MESSAGE:
-            st.info("Finished computations. You can inspect this map in more detail via the Map page.")
\ No newline at end of file
+            st.info("Finished computations. You can inspect this map in more detail via the Map page.")
+
+    # EXPLAIN A STREET SECTION
+    # the breakdown is only computed for the selected street section, not stored for every edge
+
+    available_modes = [mode for mode, key in (("Cycling", "Gb_edges_discomfort"), ("Walking", "Gw_edges_discomfort")) if key in ss]
+
+    if len(available_modes) > 0:
+
+        st.markdown("## Explain a Street Section")
+        st.markdown("See which components make up the recomputed discomfort score of one street section.")
+
+        explain_which = st.radio("Network", options = available_modes, horizontal = True)
+
+        if explain_which == "Cycling":
+            mode, edges_key, scores_key, maincomp_info = "bike", "Gb_edges", "Gb_edges_discomfort", ss["b_maincomp_info"]
+        else:
+            mode, edges_key, scores_key, maincomp_info = "walk", "Gw_edges", "Gw_edges_discomfort", ss["w_maincomp_info"]
+
+        edges = ss[edges_key]
+        most_uncomfortable = ss[scores_key].reindex(edges.index).nlargest(100)
+
+        selected_edge = st.selectbox(
+            "Street section (most uncomfortable first)",
+            options = most_uncomfortable.index.tolist(),
+            format_func = lambda edge_id: edge_label(edges, edge_id, most_uncomfortable[edge_id])
+        )
+
+        explanation = explain_edge_scores(mode, [selected_edge]).iloc[0]
+
+        main_df = pd.DataFrame([
+            {
+                "Component": maincomp_info.get(name, {}).get("display_name", name),
+                "Weighted Discomfort": explanation[f"MW_{name}"],
+            }
+            for name in [col[len("MW_"):] for col in explanation.index if col.startswith("MW_")]
+        ])
+
+        chart = alt.Chart(main_df).mark_bar().encode(
+            x = alt.X("Weighted Discomfort:Q"),
+            y = alt.Y("Component:N", sort = "-x"),
+        )
+        st.altair_chart(chart, use_container_width = True)
+
+        sub_df = pd.DataFrame([
+            {
+                "Subcomponent": ss["subcomp_info"].get(name, {}).get("display_name", name),
+                "Unweighted": explanation[f"SU_{name}"],
+                "Weighted": explanation[f"SW_{name}"],
+            }
+            for name in [col[len("SU_"):] for col in explanation.index if col.startswith("SU_")]
+        ])
+
+        st.dataframe(sub_df.round(2), hide_index = True)
+        st.markdown(f"**Total discomfort score:** {explanation['score_weighted_by_main']:.2f}")
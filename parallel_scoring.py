@@ -0,0 +1,162 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from discomfort_engine import biking_discomfort_columns, walking_discomfort_columns, align_preproc
+from shared_arrays import share_arrays, attach_arrays
+
+# Parallel discomfort scoring for large networks (e.g. all of Metro Manila).
+# The columns needed for scoring are packed once into a single read-only shared memory block.
+# Worker processes attach to it, score one partition of edges each, and the parent merges the partitions in the original order.
+# Run `python parallel_scoring.py` from the repository root to score the networks in discomfort_and_curve_data/.
+
+SCORING_EDGE_COLUMNS = {
+    "bike": ["foot", "highway", "footway", "service", "bicycle",
+             "FROM_IMAGES_cycling_lane_coverage", "FROM_IMAGES_greenery_ratio", "FROM_IMAGES_has_bicycle", "FROM_IMAGES_road_condition"],
+    "walk": ["foot", "highway", "footway", "service",
+             "FROM_IMAGES_sidewalk_ratio", "FROM_IMAGES_greenery_ratio", "FROM_IMAGES_road_condition",
+             "FROM_IMAGES_has_traffic_light", "FROM_IMAGES_has_crosswalk", "FROM_IMAGES_obstruction_density"],
+}
+
+def pack_columns(df):
+    """Turn each column into a plain numpy array. String columns become integer codes plus a small list of categories.
+
+Returns (arrays, categories): dicts keyed by column name.
+"""
+    arrays = {}
+    categories = {}
+
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[col] = values.cat.codes.to_numpy()
+            categories[col] = values.cat.categories
+        elif values.dtype == object:
+            codes, uniques = pd.factorize(values)
+            arrays[col] = codes
+            categories[col] = uniques
+        else:
+            arrays[col] = values.to_numpy()
+
+    return arrays, categories
+
+def unpack_columns(arrays, categories, columns, start, stop):
+    """Rebuild a DataFrame for rows start:stop from packed arrays. The index is the row positions."""
+    data = {}
+    for col in columns:
+        a = arrays[col][start:stop]
+        if col in categories:
+            data[col] = pd.Categorical.from_codes(a, categories = categories[col])
+        else:
+            data[col] = a
+    return pd.DataFrame(data, index = pd.RangeIndex(start, stop))
+
+def score_partition(task):
+    """Worker: score edges start:stop of the shared inputs with one weight profile."""
+    mode, spec, categories, edge_columns, preproc_columns, profile, start, stop = task
+
+    t0 = time.perf_counter()
+    shm, arrays = attach_arrays(spec)
+
+    try:
+        edges = unpack_columns(arrays, categories, edge_columns, start, stop)
+        preproc = unpack_columns(arrays, categories, preproc_columns, start, stop)
+
+        if mode == "bike":
+            scores = biking_discomfort_columns(
+                edges,
+                weights_CYCLE = profile["weights_sub_bike_CYCLE"],
+                weights_DISMOUNT = profile["weights_sub_bike_DISMOUNT"],
+                weights_main_components = profile["weights_main_bike"],
+                preproc_Gb = preproc
+            )
+        elif mode == "walk":
+            scores = walking_discomfort_columns(
+                edges,
+                weights = profile["weights_sub_walk"],
+                weights_main_components = profile["weights_main_walk"],
+                preproc_Gw = preproc
+            )
+
+        result = scores[["score_weighted_by_main", "score_weighted_by_sub"]].to_numpy()
+
+    finally:
+        del arrays
+        shm.close()
+
+    return start, stop, result, os.getpid(), time.perf_counter() - t0
+
+def parallel_discomfort_columns(mode, edges, preproc, profile, n_workers = None, chunk_size = 50000):
+    """Score all edges of a network with a process pool.
+
+mode: "bike" or "walk".
+
+preproc: preproc_Gb or preproc_Gw table for these edges.
+
+profile: dict of weight dicts, keyed like the weights in session state (see load_weight_profile_presets).
+
+Returns (scores, throughput). scores has score_weighted_by_main and score_weighted_by_sub in the same order as `edges`.
+throughput has one row per worker process: partitions, edges, seconds, edges_per_second.
+"""
+    edge_columns = SCORING_EDGE_COLUMNS[mode]
+    preproc_aligned = align_preproc(edges, preproc)
+    preproc_columns = list(preproc_aligned.columns)
+
+    arrays, categories = pack_columns(pd.concat([
+        edges[edge_columns].reset_index(drop = True),
+        preproc_aligned.reset_index(drop = True),
+    ], axis = 1))
+
+    shm, spec = share_arrays(arrays)
+    del arrays
+
+    num_edges = len(edges)
+    result = np.empty((num_edges, 2))
+    rows = []
+
+    try:
+        tasks = [
+            (mode, spec, categories, edge_columns, preproc_columns, profile, start, min(start + chunk_size, num_edges))
+            for start in range(0, num_edges, chunk_size)
+        ]
+
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            for start, stop, partition_result, pid, seconds in executor.map(score_partition, tasks):
+                result[start:stop] = partition_result
+                rows.append({"worker_pid": pid, "edges": stop - start, "seconds": seconds})
+
+    finally:
+        shm.close()
+        shm.unlink()
+
+    scores = pd.DataFrame(result, index = edges.index, columns = ["score_weighted_by_main", "score_weighted_by_sub"])
+
+    throughput = pd.DataFrame(rows).groupby("worker_pid").agg(
+        partitions = ("edges", "size"),
+        edges = ("edges", "sum"),
+        seconds = ("seconds", "sum"),
+    )
+    throughput["edges_per_second"] = throughput["edges"] / throughput["seconds"]
+
+    return scores, throughput
+
+if __name__ == "__main__":
+    import geopandas as gpd
+
+    from discomfort_score_metadata import load_weight_profile_presets
+    from edge_store import load_aligned_preproc
+
+    folder = "discomfort_and_curve_data/"
+    presets = load_weight_profile_presets()
+
+    for mode, letter in (("bike", "b"), ("walk", "w")):
+        edges = gpd.read_feather(folder + f"G{letter}_edges.feather")
+        preproc = load_aligned_preproc(letter, edges = edges, folder = folder)
+
+        scores, throughput = parallel_discomfort_columns(mode, edges, preproc, presets[mode]["Default"], chunk_size = 2000)
+
+        print(f"{mode}: {len(scores)} edges scored")
+        print(throughput)
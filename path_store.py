@@ -0,0 +1,120 @@
+import os
+import json
+import pickle
+
+import numpy as np
+
+from routing_engine import node_positions, objective_weights, dijkstra
+from score_cache import file_hash
+
+# Precomputed lowest-objective paths from the sampled origins used for the curves (see notebook 08).
+# For each network and Beta, the shortest-path tree of every origin is stored as one row of predecessors
+# (int32 positions in the sorted node table, -1 for the origin and unreachable nodes) in a single .npy file.
+# The file is memory-mapped when loaded, so only the rows that are used are read, and paths are rebuilt on demand.
+# Run `python path_store.py` from the repository root to build the stores for the Betas used in Find Routes.
+
+FOLDER = "discomfort_and_curve_data/"
+
+STORE_FOLDER = FOLDER + "path_store/"
+
+SAMPLED_NODES_FILES = {
+    "b": FOLDER + "routes_data2/sampled_nodes_for_curve_bike.pkl",
+    "w": FOLDER + "routes_data2/sampled_nodes_for_curve_walk.pkl",
+}
+
+def load_sampled_nodes(mode):
+    """mode: "b" for the cycling network, "w" for the walking network."""
+    with open(SAMPLED_NODES_FILES[mode], "rb") as f:
+        return pickle.load(f)
+
+def build_predecessors(graph, origins, beta):
+    """Shortest-path trees of `origins` (osmids) for one Beta. Returns an int32 array of shape (len(origins), number of nodes)."""
+    weights = objective_weights(graph, beta)
+
+    predecessors = np.full((len(origins), len(graph["node_ids"])), -1, dtype = np.int32)
+    for k, source in enumerate(node_positions(graph, origins)):
+        _, pred = dijkstra(graph, weights, source)
+        reached = pred >= 0
+        predecessors[k, reached] = graph["tails"][pred[reached]]
+
+    return predecessors
+
+def store_dir(mode, store_folder = STORE_FOLDER):
+    """mode: "b" for the cycling network, "w" for the walking network."""
+    return os.path.join(store_folder, f"G{mode}")
+
+def save_path_store(graph, origins, predecessors, mode, beta, folder = FOLDER, store_folder = STORE_FOLDER):
+    """Write the predecessors for one Beta. Origins, node ids and the hash of the edges are written alongside."""
+    path = store_dir(mode, store_folder)
+    os.makedirs(path, exist_ok = True)
+
+    np.save(os.path.join(path, "node_ids.npy"), graph["node_ids"])
+    np.save(os.path.join(path, "origins.npy"), np.asarray(origins, dtype = np.int64))
+    np.save(os.path.join(path, f"predecessors_beta{beta:g}.npy"), predecessors)
+
+    with open(os.path.join(path, f"meta_beta{beta:g}.json"), "w") as f:
+        json.dump({"beta": beta, "edges_hash": file_hash(folder + f"G{mode}_edges.feather")}, f)
+
+def load_path_store(mode, beta, folder = FOLDER, store_folder = STORE_FOLDER):
+    """Memory-map the stored paths of one Beta.
+
+Returns a dict with node_ids, origins (osmids) and predecessors, or None if there is no store for this Beta
+or if the edges changed since it was built.
+"""
+    path = store_dir(mode, store_folder)
+
+    try:
+        with open(os.path.join(path, f"meta_beta{beta:g}.json")) as f:
+            meta = json.load(f)
+        if meta["edges_hash"] != file_hash(folder + f"G{mode}_edges.feather"):
+            return None
+        return {
+            "node_ids": np.load(os.path.join(path, "node_ids.npy")),
+            "origins": np.load(os.path.join(path, "origins.npy")),
+            "predecessors": np.load(os.path.join(path, f"predecessors_beta{beta:g}.npy"), mmap_mode = "r"),
+        }
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return None
+
+def stored_path(store, node_o, node_d):
+    """The stored path between two nodes (osmids) as a list of osmids.
+
+Returns None if `node_o` is not a stored origin or if `node_d` cannot be reached from it.
+"""
+    origin_rows = np.flatnonzero(store["origins"] == node_o)
+    if len(origin_rows) == 0:
+        return None
+
+    predecessors = store["predecessors"][origin_rows[0]]
+    source, target = node_positions(store, [node_o, node_d])
+
+    positions = [int(target)]
+    while positions[-1] != source:
+        previous = int(predecessors[positions[-1]])
+        if previous < 0:
+            return None
+        positions.append(previous)
+
+    return store["node_ids"][positions[::-1]].tolist()
+
+if __name__ == "__main__":
+    import time
+    import geopandas as gpd
+
+    from routing_engine import build_csr_graph
+
+    # the Betas shown in Find Routes
+    betas = [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0]
+
+    for mode in ("b", "w"):
+        edges = gpd.read_feather(FOLDER + f"G{mode}_edges.feather")
+        nodes = gpd.read_feather(FOLDER + f"G{mode}_nodes.feather")
+        graph = build_csr_graph(edges, nodes)
+        origins = load_sampled_nodes(mode)
+
+        for beta in betas:
+            t0 = time.perf_counter()
+            predecessors = build_predecessors(graph, origins, beta)
+            save_path_store(graph, origins, predecessors, mode, beta)
+
+            print(f"G{mode}, Beta={beta}: {len(origins)} origins, {predecessors.nbytes / 1e6:.1f} MB, built in {time.perf_counter() - t0:.1f} s")
@@ -0,0 +1,491 @@
+import heapq
+
+import pandas as pd
+import numpy as np
+import geopandas as gpd
+import shapely
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+# Shortest paths on the cycling and walking networks, computed in-process for any origin and destination.
+# The network is stored as compact CSR arrays: the outgoing edges of node i are at positions indptr[i]:indptr[i+1]
+# of heads (the node each edge leads to), edge_rows (the row of the edge in the edges table) and the weight arrays.
+# Nodes are referred to by their position in node_ids (sorted osmids) inside the engine, and by osmid outside of it.
+
+# the projected CRS used for straight-line distances (also used for the curves in notebook 08)
+PROJECTED_CRS = "EPSG:25391"
+
+# for projecting clicked points (longitude, latitude) before snapping them to nodes
+TO_PROJECTED = Transformer.from_crs("EPSG:4326", PROJECTED_CRS, always_xy = True)
+
+def build_csr_graph(edges, nodes):
+    """Build the routing graph of one network.
+
+edges: edges indexed by (u, v, key), with length and DISCOMFORT_WEIGHTED_BY_BETA (the discomfort term for beta = 1).
+
+nodes: nodes indexed by osmid, with x and y in EPSG:4326.
+
+Returns a dict of numpy arrays:
+node_ids, xy (projected coordinates in meters), indptr, and tails, heads, edge_rows, length and discomfort (in CSR order).
+reverse_indptr and reverse_entries list the CSR positions of the incoming edges of each node.
+pair_keys (sorted) and pair_entries map each (tail, head) pair, as tail * len(node_ids) + head, to its CSR position.
+heuristic_scale is the largest factor by which straight-line distances can be multiplied and still never exceed edge lengths.
+node_tree is a KD-tree over xy, for snapping points to the nearest nodes.
+"""
+    node_ids = np.sort(nodes.index.to_numpy())
+
+    u = edges.index.get_level_values("u").to_numpy()
+    v = edges.index.get_level_values("v").to_numpy()
+
+    tails = np.searchsorted(node_ids, u)
+    heads = np.searchsorted(node_ids, v)
+
+    # edges whose endpoints are not in the node table cannot be used
+    valid = (tails < len(node_ids)) & (heads < len(node_ids))
+    valid[valid] = (node_ids[tails[valid]] == u[valid]) & (node_ids[heads[valid]] == v[valid])
+
+    edge_rows = np.flatnonzero(valid)
+    order = edge_rows[np.argsort(tails[edge_rows], kind = "stable")]
+
+    indptr = np.zeros(len(node_ids) + 1, dtype = np.int64)
+    indptr[1:] = np.cumsum(np.bincount(tails[order], minlength = len(node_ids)))
+
+    # the same edges grouped by the node they lead to, for searches towards a target
+    reverse_entries = np.argsort(heads[order], kind = "stable")
+    reverse_indptr = np.zeros(len(node_ids) + 1, dtype = np.int64)
+    reverse_indptr[1:] = np.cumsum(np.bincount(heads[order], minlength = len(node_ids)))
+
+    # sorted (u, v) keys, so the edges along a path can be gathered without scanning the edges table
+    pair_keys = tails[order].astype(np.int64) * len(node_ids) + heads[order]
+    pair_entries = np.argsort(pair_keys, kind = "stable")
+
+    nodes_sorted = nodes.loc[node_ids]
+    projected = gpd.points_from_xy(nodes_sorted["x"], nodes_sorted["y"], crs = "EPSG:4326").to_crs(PROJECTED_CRS)
+
+    xy = np.column_stack([projected.x, projected.y])
+
+    # projected distances are slightly off from the geodesic edge lengths, so scale the A* heuristic down until it is admissible
+    length = edges["length"].to_numpy(dtype = float)[order]
+    straight = np.hypot(*(xy[tails[order]] - xy[heads[order]]).T)
+    has_extent = straight > 0
+    heuristic_scale = min(1.0, float((length[has_extent] / straight[has_extent]).min())) if has_extent.any() else 1.0
+
+    return {
+        "node_ids": node_ids,
+        "xy": xy,
+        "heuristic_scale": heuristic_scale,
+        "node_tree": cKDTree(xy),
+        "indptr": indptr,
+        "reverse_indptr": reverse_indptr,
+        "reverse_entries": reverse_entries.astype(np.int32),
+        "pair_keys": pair_keys[pair_entries],
+        "pair_entries": pair_entries.astype(np.int32),
+        "tails": tails[order].astype(np.int32),
+        "heads": heads[order].astype(np.int32),
+        "edge_rows": order.astype(np.int32),
+        "length": length,
+        "discomfort": edges["DISCOMFORT_WEIGHTED_BY_BETA"].to_numpy(dtype = float)[order],
+    }
+
+def node_positions(graph, osmids):
+    """Positions of nodes (given by osmid) in the routing graph. Raises KeyError for unknown nodes."""
+    osmids = np.atleast_1d(np.asarray(osmids))
+    positions = np.searchsorted(graph["node_ids"], osmids)
+    found = (positions < len(graph["node_ids"])) & (graph["node_ids"][np.minimum(positions, len(graph["node_ids"]) - 1)] == osmids)
+    if not found.all():
+        raise KeyError(f"Nodes not in the network: {osmids[~found].tolist()}")
+    return positions
+
+def objective_weights(graph, beta):
+    """Edge weights for a discomfort sensitivity: length + beta * discomfort, as for the OBJECTIVE column."""
+    return graph["length"] + beta * graph["discomfort"]
+
+def dijkstra(graph, weights, source, target = None, reverse = False):
+    """Shortest paths from the node at position `source`. Stops early once `target` (a position) is settled.
+
+weights: one weight per CSR entry, e.g. from objective_weights.
+
+reverse: follow edges backwards, giving the distances from every node to `source`.
+
+Returns (dist, pred): the distance to every node (inf if not reached) and, for every node,
+the CSR position of the edge used to reach it (-1 for the source and for nodes not reached).
+"""
+    if reverse:
+        indptr = graph["reverse_indptr"].tolist()
+        entries = graph["reverse_entries"].tolist()
+        neighbors = graph["tails"].tolist()
+    else:
+        indptr = graph["indptr"].tolist()
+        entries = None
+        neighbors = graph["heads"].tolist()
+    weights = weights.tolist()
+
+    num_nodes = len(indptr) - 1
+    dist = [float("inf")] * num_nodes
+    pred = [-1] * num_nodes
+    settled = [False] * num_nodes
+
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+
+    while heap:
+        d, i = heapq.heappop(heap)
+        if settled[i]:
+            continue
+        settled[i] = True
+        if i == target:
+            break
+        for k in range(indptr[i], indptr[i + 1]):
+            e = entries[k] if reverse else k
+            j = neighbors[e]
+            nd = d + weights[e]
+            if nd < dist[j]:
+                dist[j] = nd
+                pred[j] = e
+                heapq.heappush(heap, (nd, j))
+
+    return np.array(dist), np.array(pred)
+
+def straight_line_heuristic(graph, target):
+    """Lower bound on the length of any path from every node to the node at position `target`."""
+    return graph["heuristic_scale"] * np.hypot(*(graph["xy"] - graph["xy"][target]).T)
+
+def astar(graph, weights, source, target):
+    """Shortest path from `source` to `target` (positions), guided by straight-line distances to the target.
+
+weights must never be lower than the edge lengths (e.g. objective_weights with beta >= 0 and non-negative discomfort),
+so that the heuristic never overestimates.
+
+Returns (dist, pred) like dijkstra, for the nodes settled before the target.
+"""
+    indptr = graph["indptr"].tolist()
+    heads = graph["heads"].tolist()
+    weights = weights.tolist()
+    h = straight_line_heuristic(graph, target).tolist()
+
+    num_nodes = len(indptr) - 1
+    dist = [float("inf")] * num_nodes
+    pred = [-1] * num_nodes
+    settled = [False] * num_nodes
+
+    dist[source] = 0.0
+    heap = [(h[source], source)]
+
+    while heap:
+        _, i = heapq.heappop(heap)
+        if settled[i]:
+            continue
+        settled[i] = True
+        if i == target:
+            break
+        d = dist[i]
+        for e in range(indptr[i], indptr[i + 1]):
+            j = heads[e]
+            nd = d + weights[e]
+            if nd < dist[j]:
+                dist[j] = nd
+                pred[j] = e
+                heapq.heappush(heap, (nd + h[j], j))
+
+    return np.array(dist), np.array(pred)
+
+def bounded_search(graph, weights, source, budget, state = None):
+    """Single-source search that settles every node within `budget` of the node at position `source`.
+
+Pass the returned state back (with the same weights) to continue the search up to a larger budget instead of starting over.
+A smaller budget needs no search at all, see reachable_within.
+
+Returns the state: dist and settled (lists, one item per node), the search heap and the budget searched so far.
+"""
+    if state is None:
+        num_nodes = len(graph["node_ids"])
+        state = {
+            "dist": [float("inf")] * num_nodes,
+            "settled": [False] * num_nodes,
+            "heap": [(0.0, source)],
+            "budget": 0.0,
+        }
+        state["dist"][source] = 0.0
+
+    if budget <= state["budget"]:
+        return state
+
+    indptr = graph["indptr"]
+    heads = graph["heads"]
+    dist, settled, heap = state["dist"], state["settled"], state["heap"]
+
+    while heap and (heap[0][0] <= budget):
+        d, i = heapq.heappop(heap)
+        if settled[i]:
+            continue
+        settled[i] = True
+        start, stop = indptr[i], indptr[i + 1]
+        for j, w in zip(heads[start:stop].tolist(), weights[start:stop].tolist()):
+            nd = d + w
+            if nd < dist[j]:
+                dist[j] = nd
+                heapq.heappush(heap, (nd, j))
+
+    state["budget"] = budget
+
+    return state
+
+def reachable_within(graph, weights, state, budget):
+    """Nodes and edges reachable within `budget`, from a bounded_search state that searched at least that far.
+
+Returns (positions, entries): the positions of the reachable nodes, and the CSR positions of the edges that can be
+travelled in full within the budget.
+"""
+    dist = np.array(state["dist"])
+    node_reached = np.array(state["settled"]) & (dist <= budget)
+    entries = np.flatnonzero(node_reached[graph["tails"]] & (dist[graph["tails"]] + weights <= budget))
+
+    return np.flatnonzero(node_reached), entries
+
+def reachable_area(graph, positions, ratio = 0.2):
+    """Polygon (EPSG:4326) around the nodes at `positions`: a concave hull of their projected coordinates.
+
+ratio: between 0 (tightest hull) and 1 (convex hull).
+"""
+    hull = shapely.concave_hull(shapely.multipoints(graph["xy"][positions]), ratio = ratio)
+    return gpd.GeoSeries([hull], crs = PROJECTED_CRS).to_crs("EPSG:4326").iloc[0]
+
+def path_from_predecessors(graph, pred, source, target):
+    """Walk back from `target` to `source`. Returns (node positions, CSR positions of the edges), or None if there is no path."""
+    if (target != source) and (pred[target] < 0):
+        return None
+
+    tails = graph["tails"]
+
+    entries = []
+    i = target
+    while i != source:
+        e = pred[i]
+        entries.append(e)
+        i = tails[e]
+    entries.reverse()
+
+    entries = np.array(entries, dtype = np.int64)
+    positions = np.concatenate([[source], graph["heads"][entries]]).astype(np.int64)
+
+    return positions, entries
+
+def shortest_path(graph, node_o, node_d, beta):
+    """Lowest-objective path between two nodes (osmids) for a discomfort sensitivity `beta`.
+
+Returns (path_nodes, edge_rows): the osmids along the path, and the row of each path edge in the edges table.
+Raises ValueError if the destination cannot be reached.
+"""
+    source, target = node_positions(graph, [node_o, node_d])
+
+    if (beta >= 0) and (graph["discomfort"].min() >= 0):
+        # every objective weight is at least the edge length, so the straight-line heuristic is admissible
+        dist, pred = astar(graph, objective_weights(graph, beta), source, target)
+    else:
+        dist, pred = dijkstra(graph, objective_weights(graph, beta), source, target = target)
+    path = path_from_predecessors(graph, pred, source, target)
+
+    if path is None:
+        raise ValueError(f"No path from node {node_o} to node {node_d}.")
+
+    positions, entries = path
+
+    return graph["node_ids"][positions].tolist(), graph["edge_rows"][entries]
+
+def path_edge_rows(graph, path_nodes):
+    """Rows in the edges table of the edges along a path, given as a list of osmids.
+
+Where two nodes are joined by several edges, the first one in the edges table is used. Raises KeyError if two consecutive
+nodes are not joined by an edge.
+"""
+    positions = node_positions(graph, path_nodes)
+    keys = positions[:-1].astype(np.int64) * len(graph["node_ids"]) + positions[1:]
+
+    found = np.searchsorted(graph["pair_keys"], keys)
+    found = np.minimum(found, len(graph["pair_keys"]) - 1)
+    missing = graph["pair_keys"][found] != keys
+    if missing.any():
+        k = np.flatnonzero(missing)[0]
+        raise KeyError(f"No edge from node {path_nodes[k]} to node {path_nodes[k + 1]}.")
+
+    return graph["edge_rows"][graph["pair_entries"][found]]
+
+def nearest_nodes(graph, lon, lat, k = 1):
+    """Snap points given in EPSG:4326 (scalars or arrays) to their k nearest nodes.
+
+Returns (osmids, distances): arrays of shape (number of points,) if k = 1, else (number of points, k). Distances are in meters.
+"""
+    x, y = TO_PROJECTED.transform(np.atleast_1d(lon), np.atleast_1d(lat))
+    distances, positions = graph["node_tree"].query(np.column_stack([x, y]), k = k)
+    return graph["node_ids"][positions], distances
+
+def edge_coordinates(edges, nodes):
+    """Coordinates of every edge geometry, flattened once so that route lines can be built by slicing.
+
+edges: edges indexed by (u, v, key). Geometries stored from v to u are reversed, so every edge runs from u to v.
+
+nodes: nodes indexed by osmid, with x and y.
+
+Returns a dict: coords, an array of (latitude, longitude) rows rounded to 6 decimals (about 0.1 m), and offsets,
+so that the points of the edge in row r of `edges` are coords[offsets[r]:offsets[r+1]].
+"""
+    geometry = edges.geometry.to_numpy().copy()
+
+    first_points = shapely.get_coordinates(shapely.get_point(geometry, 0))
+    u_points = nodes.loc[edges.index.get_level_values("u"), ["x", "y"]].to_numpy()
+    starts_at_v = np.abs(first_points - u_points).max(axis = 1) > 1e-9
+    geometry[starts_at_v] = shapely.reverse(geometry[starts_at_v])
+
+    offsets = np.zeros(len(geometry) + 1, dtype = np.int64)
+    offsets[1:] = np.cumsum(shapely.get_num_coordinates(geometry))
+
+    return {"coords": shapely.get_coordinates(geometry)[:, ::-1].round(6), "offsets": offsets}
+
+def route_polylines(edge_coords, edge_rows, keep = None):
+    """Lines along a route, as lists of [latitude, longitude] for folium.
+
+edge_rows: rows of the route's edges in the edges table, in path order.
+
+keep: optional boolean mask over edge_rows. Only these edges are drawn, and each run of consecutive kept edges becomes one line.
+"""
+    coords, offsets = edge_coords["coords"], edge_coords["offsets"]
+    if keep is None:
+        keep = np.ones(len(edge_rows), dtype = bool)
+
+    lines = []
+    run = []
+    for row, kept in zip(np.asarray(edge_rows).tolist(), np.asarray(keep).tolist()):
+        if not kept:
+            if run:
+                lines.append(np.concatenate(run).tolist())
+            run = []
+            continue
+        segment = coords[offsets[row]:offsets[row + 1]]
+        # consecutive edges meet at a node, which only needs to be sent once
+        run.append(segment if not run else segment[1:])
+    if run:
+        lines.append(np.concatenate(run).tolist())
+
+    return lines
+
+def straight_line_distance(graph, node_o, node_d):
+    """Straight-line distance in meters between two nodes (osmids)."""
+    i, j = node_positions(graph, [node_o, node_d])
+    return float(np.hypot(*(graph["xy"][i] - graph["xy"][j])))
+
+def pareto_routes(graph, node_o, node_d):
+    """All Pareto-optimal routes between two nodes (osmids) with respect to (length, discomfort).
+
+This is a bi-objective label-setting search (BOA*). Exact distances to the destination, from one backward search per
+criterion, are used as the heuristic. A label is kept only if its discomfort is lower than that of every label
+already settled at the same node and at the destination.
+
+Returns a DataFrame sorted by increasing length (so decreasing discomfort), with columns
+length, discomfort, path_nodes (osmids) and edge_rows (rows in the edges table).
+"""
+    source, target = node_positions(graph, [node_o, node_d])
+
+    h_length, _ = dijkstra(graph, graph["length"], target, reverse = True)
+    h_discomfort, _ = dijkstra(graph, graph["discomfort"], target, reverse = True)
+
+    if not np.isfinite(h_length[source]):
+        raise ValueError(f"No path from node {node_o} to node {node_d}.")
+
+    h_length = h_length.tolist()
+    h_discomfort = h_discomfort.tolist()
+    indptr = graph["indptr"].tolist()
+    heads = graph["heads"].tolist()
+    length = graph["length"].tolist()
+    discomfort = graph["discomfort"].tolist()
+
+    # labels: (node, previous label, CSR position of the edge from the previous label)
+    label_node = [source]
+    label_previous = [-1]
+    label_entry = [-1]
+
+    min_discomfort = [float("inf")] * (len(indptr) - 1)
+    solutions = []
+
+    heap = [(h_length[source], h_discomfort[source], 0.0, 0.0, 0)]
+
+    while heap:
+        f1, f2, g1, g2, label = heapq.heappop(heap)
+        i = label_node[label]
+
+        if (g2 >= min_discomfort[i]) or (f2 >= min_discomfort[target]):
+            continue
+        min_discomfort[i] = g2
+
+        if i == target:
+            solutions.append((g1, g2, label))
+            continue
+
+        for e in range(indptr[i], indptr[i + 1]):
+            j = heads[e]
+            if h_length[j] == float("inf"):
+                continue
+            new_g2 = g2 + discomfort[e]
+            new_f2 = new_g2 + h_discomfort[j]
+            if (new_g2 >= min_discomfort[j]) or (new_f2 >= min_discomfort[target]):
+                continue
+            new_g1 = g1 + length[e]
+            label_node.append(j)
+            label_previous.append(label)
+            label_entry.append(e)
+            heapq.heappush(heap, (new_g1 + h_length[j], new_f2, new_g1, new_g2, len(label_node) - 1))
+
+    rows = []
+    for g1, g2, label in solutions:
+        entries = []
+        while label_previous[label] >= 0:
+            entries.append(label_entry[label])
+            label = label_previous[label]
+        entries = np.array(entries[::-1], dtype = np.int64)
+        positions = np.concatenate([[source], graph["heads"][entries]]).astype(np.int64)
+
+        rows.append({
+            "length": g1,
+            "discomfort": g2,
+            "path_nodes": graph["node_ids"][positions].tolist(),
+            "edge_rows": graph["edge_rows"][entries],
+        })
+
+    return pd.DataFrame(rows, columns = ["length", "discomfort", "path_nodes", "edge_rows"])
+
+def beta_breakpoints(frontier, beta_max = None):
+    """The routes of a Pareto frontier that are optimal for some beta >= 0, and the exact range of beta for which each is optimal.
+
+frontier: DataFrame from pareto_routes (sorted by increasing length).
+
+A route is optimal for beta when it minimizes length + beta * discomfort, so the optimal routes are the points on the
+lower convex hull of the frontier. Between two consecutive hull points a and b, the optimal route changes at
+beta = (length_b - length_a) / (discomfort_a - discomfort_b).
+
+Returns the hull rows of `frontier` with beta_from and beta_to columns (beta_to is inf for the last route).
+If beta_max is given, only routes that are optimal for some beta in [0, beta_max] are kept.
+"""
+    L = frontier["length"].to_numpy()
+    D = frontier["discomfort"].to_numpy()
+
+    hull = []
+    for k in range(len(frontier)):
+        # drop points that lie on or above the segment from the previous hull point to this one
+        while len(hull) >= 2:
+            a, b = hull[-2], hull[-1]
+            if (L[b] - L[a]) * (D[a] - D[k]) >= (L[k] - L[a]) * (D[a] - D[b]):
+                hull.pop()
+            else:
+                break
+        hull.append(k)
+
+    hull = np.array(hull, dtype = np.int64)
+    breakpoints = (L[hull[1:]] - L[hull[:-1]]) / (D[hull[:-1]] - D[hull[1:]])
+
+    result = frontier.iloc[hull].copy()
+    result["beta_from"] = np.concatenate([[0.0], breakpoints])
+    result["beta_to"] = np.concatenate([breakpoints, [np.inf]])
+
+    if beta_max is not None:
+        result = result.loc[result["beta_from"] <= beta_max]
+
+    return result
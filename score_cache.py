@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+
+import pandas as pd
+import numpy as np
+
+from discomfort_score_metadata import LEVEL_SCORES
+
+# On-disk cache of discomfort score vectors, shared by all sessions and users of the app.
+# Entries are keyed by a hash of the mode, the weight dicts, the version of the edge data and the level scores of the rules,
+# and the least recently used entries are removed once the cache grows past MAX_CACHE_BYTES.
+
+CACHE_FOLDER = "discomfort_and_curve_data/score_cache/"
+
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+
+DATA_FILES = {
+    "bike": ("Gb_edges.feather", "preproc_Gb.feather"),
+    "walk": ("Gw_edges.feather", "preproc_Gw.feather"),
+}
+
+_file_hashes = {}
+
+def file_hash(path):
+    """sha256 of a file's contents. Remembered per (path, size, mtime), so unchanged files are only read once per process."""
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+
+    if memo_key not in _file_hashes:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        _file_hashes[memo_key] = h.hexdigest()
+
+    return _file_hashes[memo_key]
+
+def edge_data_version(mode, folder = "discomfort_and_curve_data/"):
+    """Hash of the edge data that the scores of one mode are computed from."""
+    return hashlib.sha256("".join([file_hash(folder + filename) for filename in DATA_FILES[mode]]).encode()).hexdigest()
+
+def score_cache_key(mode, profile, data_version):
+    """Stable hash of a mode, a weight profile (dict of weight dicts), an edge data version and the level scores of the rules.
+
+Every weight is cast to float first, so that e.g. 1 and 1.0 (or numpy numbers from number inputs) give the same key.
+"""
+    profile = {name: {component: float(weight) for component, weight in weights.items()} for name, weights in profile.items()}
+
+    payload = json.dumps(
+        {"mode": mode, "profile": profile, "data_version": data_version, "level_scores": LEVEL_SCORES},
+        sort_keys = True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def cache_path(key, cache_folder = CACHE_FOLDER):
+    return os.path.join(cache_folder, f"{key}.npz")
+
+def load_cached_scores(key, cache_folder = CACHE_FOLDER):
+    """Return the cached scores for `key` as a DataFrame indexed by (u, v, key), or None if there is no entry."""
+    path = cache_path(key, cache_folder)
+
+    try:
+        with np.load(path) as data:
+            index = pd.MultiIndex.from_arrays([data["u"], data["v"], data["key"]], names = ["u", "v", "key"])
+            scores = pd.DataFrame(data["scores"], index = index, columns = list(data["columns"]))
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return None
+
+    # mark as recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return scores
+
+def store_scores(key, scores, cache_folder = CACHE_FOLDER, max_bytes = MAX_CACHE_BYTES):
+    """Write a DataFrame of scores (indexed by (u, v, key)) to the cache, then evict old entries if needed."""
+    os.makedirs(cache_folder, exist_ok = True)
+    path = cache_path(key, cache_folder)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            scores = scores.to_numpy(dtype = float),
+            columns = np.array(scores.columns, dtype = str),
+            u = scores.index.get_level_values("u").to_numpy(),
+            v = scores.index.get_level_values("v").to_numpy(),
+            key = scores.index.get_level_values("key").to_numpy(),
+        )
+    # atomic, so other sessions never read a half-written entry
+    os.replace(tmp_path, path)
+
+    evict_least_recently_used(cache_folder, max_bytes)
+
+def evict_least_recently_used(cache_folder = CACHE_FOLDER, max_bytes = MAX_CACHE_BYTES):
+    """Remove the least recently used entries until the cache is at most `max_bytes`."""
+    entries = []
+    for filename in os.listdir(cache_folder):
+        if filename.endswith(".npz"):
+            try:
+                stat = os.stat(os.path.join(cache_folder, filename))
+            except FileNotFoundError: # removed by another session
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+
+    total = sum([size for _, size, _ in entries])
+
+    for _, size, filename in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_folder, filename))
+        except FileNotFoundError:
+            pass
+        total -= size
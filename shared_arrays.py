@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Numpy arrays in shared memory, so that worker processes can read them without each receiving a copy.
+# share_arrays and attach_arrays work on any dict of arrays (e.g. the packed edge columns of parallel_scoring);
+# share_graph and attached_graph do the same for the routing graph used by the curve workers, and clean up after themselves.
+
+# the arrays of a routing graph that the searches need
+SHARED_GRAPH_ARRAYS = ["node_ids", "xy", "indptr", "tails", "heads", "length", "discomfort"]
+
+def share_arrays(arrays):
+    """Copy arrays into one shared memory block.
+
+Returns the SharedMemory object (the caller must close and unlink it) and a spec that workers use to attach.
+"""
+    layout = {}
+    offset = 0
+    for col, a in arrays.items():
+        layout[col] = (offset, a.dtype.str, a.shape)
+        offset += a.nbytes
+        offset += (-offset) % 8 # keep every array 8-byte aligned
+
+    shm = shared_memory.SharedMemory(create = True, size = max(offset, 1))
+    for col, a in arrays.items():
+        start, dtype, shape = layout[col]
+        np.ndarray(shape, dtype = dtype, buffer = shm.buf, offset = start)[...] = a
+
+    return shm, {"name": shm.name, "layout": layout}
+
+def attach_arrays(spec):
+    """Attach to a shared memory block made by share_arrays. The arrays are read-only views, not copies."""
+    shm = shared_memory.SharedMemory(name = spec["name"])
+    arrays = {}
+    for col, (start, dtype, shape) in spec["layout"].items():
+        a = np.ndarray(shape, dtype = dtype, buffer = shm.buf, offset = start)
+        a.flags.writeable = False
+        arrays[col] = a
+    return shm, arrays
+
+@contextmanager
+def share_graph(graph, names = SHARED_GRAPH_ARRAYS):
+    """Copy the arrays of a routing graph (from routing_engine.build_csr_graph) into shared memory for the duration of a with block.
+
+Yields the spec that workers pass to attached_graph. The shared memory is released when the block ends.
+"""
+    shm, spec = share_arrays({name: np.ascontiguousarray(graph[name]) for name in names})
+
+    try:
+        yield spec
+
+    finally:
+        shm.close()
+        shm.unlink()
+
+@contextmanager
+def attached_graph(spec, **extra):
+    """Worker: the routing graph shared by share_graph, as a dict of read-only views plus any `extra` entries, for the duration of a with block."""
+    shm, arrays = attach_arrays(spec)
+    graph = dict(arrays, **extra)
+
+    try:
+        yield graph
+
+    finally:
+        # the arrays are views of the shared block, so drop them before closing it
+        arrays.clear()
+        graph.clear()
+        shm.close()
@@ -6,6 +6,229 @@ import seaborn as sns
 import altair as alt
 import geopandas as gpd
 
+from edge_store import load_aligned_preproc
+from discomfort_score_metadata import load_discomfort_score_component_info
+from score_cache import edge_data_version, score_cache_key, load_cached_scores, store_scores
+from discomfort_engine import build_bike_basis, build_walk_basis, rescore_bike_from_basis, rescore_walk_from_basis, batch_rescore_bike_from_basis, batch_rescore_walk_from_basis, summarize_profile_scores, explain_bike_from_basis, explain_walk_from_basis
+
+@st.cache_data(ttl = None, max_entries = 1)
+def load_discomfort_basis():
+    """Unweighted subcomponent matrices of both networks. These do not depend on the weights, so every session can share them."""
+    folder = "discomfort_and_curve_data/"
+
+    Gb_edges = gpd.read_feather(folder + "Gb_edges.feather")
+    Gw_edges = gpd.read_feather(folder + "Gw_edges.feather")
+    preproc_Gb = load_aligned_preproc("b", edges = Gb_edges, folder = folder)
+    preproc_Gw = load_aligned_preproc("w", edges = Gw_edges, folder = folder)
+
+    return build_bike_basis(Gb_edges, preproc_Gb), build_walk_basis(Gw_edges, preproc_Gw)
+
+SESSION_WEIGHT_KEYS = {
+    "bike": ("weights_sub_bike_CYCLE", "weights_sub_bike_DISMOUNT", "weights_main_bike"),
+    "walk": ("weights_sub_walk", "weights_main_walk"),
+}
+
+def session_score_cache_key(mode):
+    """Score cache key of the weights currently in session state, for one network ("bike" or "walk")."""
+    ss = st.session_state
+
+    profile = {key: ss[key] for key in SESSION_WEIGHT_KEYS[mode]}
+    return score_cache_key(mode, profile, edge_data_version(mode))
+
+def default_score_cache_key(mode):
+    """Score cache key of the default weights, for one network ("bike" or "walk")."""
+    default_weights_subcomponents_bike_CYCLE, default_weights_subcomponents_bike_DISMOUNT, default_weights_main_components_bike, default_weights_subcomponents_walk, default_weights_main_components_walk = load_discomfort_score_component_info()[:5]
+
+    if mode == "bike":
+        default_weights = (default_weights_subcomponents_bike_CYCLE, default_weights_subcomponents_bike_DISMOUNT, default_weights_main_components_bike)
+    elif mode == "walk":
+        default_weights = (default_weights_subcomponents_walk, default_weights_main_components_walk)
+
+    profile = dict(zip(SESSION_WEIGHT_KEYS[mode], default_weights))
+    return score_cache_key(mode, profile, edge_data_version(mode))
+
+def rescore_rows_from_weights(mode, rows = None):
+    """Scores of some edges of one network ("bike" or "walk") using the weights currently in session state.
+
+rows: optional slice or array of row positions (in the order of the edges file); all edges if None.
+"""
+    ss = st.session_state
+
+    if ("bike_discomfort_basis" not in ss) or ("walk_discomfort_basis" not in ss):
+        ss["bike_discomfort_basis"], ss["walk_discomfort_basis"] = load_discomfort_basis()
+
+    if mode == "bike":
+        return rescore_bike_from_basis(
+            ss["bike_discomfort_basis"],
+            weights_CYCLE = ss["weights_sub_bike_CYCLE"],
+            weights_DISMOUNT = ss["weights_sub_bike_DISMOUNT"],
+            weights_main_components = ss["weights_main_bike"],
+            rows = rows
+        )
+    elif mode == "walk":
+        return rescore_walk_from_basis(
+            ss["walk_discomfort_basis"],
+            weights = ss["weights_sub_walk"],
+            weights_main_components = ss["weights_main_walk"],
+            rows = rows
+        )
+
+def store_session_scores(mode, scores):
+    """Keep score_weighted_by_main in ss["Gb_edges_discomfort"] or ss["Gw_edges_discomfort"], and return it."""
+    ss = st.session_state
+
+    result = scores["score_weighted_by_main"]
+
+    if mode == "bike":
+        ss["Gb_edges_discomfort"] = result
+    elif mode == "walk":
+        ss["Gw_edges_discomfort"] = result
+
+    return result
+
+def rescore_discomfort_from_weights(mode):
+    """Rescore every edge of one network ("bike" or "walk") using the weights currently in session state.
+
+Scores for weights that any session has already used are read from the on-disk score cache.
+
+The result is stored in ss["Gb_edges_discomfort"] or ss["Gw_edges_discomfort"], and also returned.
+"""
+    cache_key = session_score_cache_key(mode)
+
+    scores = load_cached_scores(cache_key)
+
+    if scores is None:
+        scores = rescore_rows_from_weights(mode)
+        store_scores(cache_key, scores)
+
+    return store_session_scores(mode, scores)
+
+def default_discomfort_scores(mode):
+    """Scores (score_weighted_by_main) of every edge of one network ("bike" or "walk") with the default weights, e.g. as a
+baseline for the scores of the weights in session state. Read from the score cache if possible.
+"""
+    ss = st.session_state
+
+    cache_key = default_score_cache_key(mode)
+
+    scores = load_cached_scores(cache_key)
+
+    if scores is None:
+        default_weights_subcomponents_bike_CYCLE, default_weights_subcomponents_bike_DISMOUNT, default_weights_main_components_bike, default_weights_subcomponents_walk, default_weights_main_components_walk = load_discomfort_score_component_info()[:5]
+
+        if ("bike_discomfort_basis" not in ss) or ("walk_discomfort_basis" not in ss):
+            ss["bike_discomfort_basis"], ss["walk_discomfort_basis"] = load_discomfort_basis()
+
+        if mode == "bike":
+            scores = rescore_bike_from_basis(
+                ss["bike_discomfort_basis"],
+                weights_CYCLE = default_weights_subcomponents_bike_CYCLE,
+                weights_DISMOUNT = default_weights_subcomponents_bike_DISMOUNT,
+                weights_main_components = default_weights_main_components_bike
+            )
+        elif mode == "walk":
+            scores = rescore_walk_from_basis(
+                ss["walk_discomfort_basis"],
+                weights = default_weights_subcomponents_walk,
+                weights_main_components = default_weights_main_components_walk
+            )
+
+        store_scores(cache_key, scores)
+
+    return scores["score_weighted_by_main"]
+
+def cached_session_scores(mode):
+    """Scores of the weights currently in session state from the score cache (as in rescore_discomfort_from_weights), or None."""
+    return load_cached_scores(session_score_cache_key(mode))
+
+def iter_rescore_discomfort_from_weights(mode, chunk_size = 2000, scores = None):
+    """Like rescore_discomfort_from_weights, but yields the scores (DataFrames indexed by (u, v, key)) one chunk of
+`chunk_size` edges at a time, as soon as each chunk is scored. Cached scores are yielded in the same chunks.
+
+scores: the cached scores of these weights, if they were already read with cached_session_scores.
+
+Once the last chunk has been yielded, the full result is cached and stored in session state.
+"""
+    cache_key = session_score_cache_key(mode)
+
+    if scores is None:
+        scores = load_cached_scores(cache_key)
+
+    if scores is not None:
+        for start in range(0, len(scores), chunk_size):
+            yield scores.iloc[start:start + chunk_size]
+
+    else:
+        ss = st.session_state
+        if ("bike_discomfort_basis" not in ss) or ("walk_discomfort_basis" not in ss):
+            ss["bike_discomfort_basis"], ss["walk_discomfort_basis"] = load_discomfort_basis()
+        num_edges = len(ss[f"{mode}_discomfort_basis"]["index"])
+
+        chunks = []
+        for start in range(0, num_edges, chunk_size):
+            chunk = rescore_rows_from_weights(mode, slice(start, start + chunk_size))
+            chunks.append(chunk)
+            yield chunk
+
+        scores = pd.concat(chunks)
+        store_scores(cache_key, scores)
+
+    store_session_scores(mode, scores)
+
+def explain_edge_scores(mode, edge_ids):
+    """Full discomfort breakdown (SW_, SU_, MW_ and MU_ columns) for a few edges of one network ("bike" or "walk"),
+using the weights currently in session state.
+
+edge_ids: list of (u, v, key) tuples.
+
+Only the selected edges are computed, so this is cheap enough to call on every selection.
+"""
+    ss = st.session_state
+
+    if ("bike_discomfort_basis" not in ss) or ("walk_discomfort_basis" not in ss):
+        ss["bike_discomfort_basis"], ss["walk_discomfort_basis"] = load_discomfort_basis()
+
+    basis = ss[f"{mode}_discomfort_basis"]
+    positions = basis["index"].get_indexer(edge_ids)
+
+    if (positions < 0).any():
+        raise KeyError("Some of the selected edges are not in the network.")
+
+    if mode == "bike":
+        return explain_bike_from_basis(
+            basis,
+            positions,
+            weights_CYCLE = ss["weights_sub_bike_CYCLE"],
+            weights_DISMOUNT = ss["weights_sub_bike_DISMOUNT"],
+            weights_main_components = ss["weights_main_bike"]
+        )
+    elif mode == "walk":
+        return explain_walk_from_basis(
+            basis,
+            positions,
+            weights = ss["weights_sub_walk"],
+            weights_main_components = ss["weights_main_walk"]
+        )
+
+def compare_weight_profiles(mode, profiles):
+    """Score every edge of one network ("bike" or "walk") under several weight profiles in one batched computation.
+
+profiles: dict mapping a profile name to a dict of weight dicts, keyed like the weights in session state.
+
+Returns the edges x profiles score matrix and a summary table with one row per profile.
+"""
+    ss = st.session_state
+
+    if ("bike_discomfort_basis" not in ss) or ("walk_discomfort_basis" not in ss):
+        ss["bike_discomfort_basis"], ss["walk_discomfort_basis"] = load_discomfort_basis()
+
+    if mode == "bike":
+        score_matrix = batch_rescore_bike_from_basis(ss["bike_discomfort_basis"], profiles)
+    elif mode == "walk":
+        score_matrix = batch_rescore_walk_from_basis(ss["walk_discomfort_basis"], profiles)
+
+    return score_matrix, summarize_profile_scores(score_matrix)
+
 def tradeoff_rate(r1, r2):
     dist_change_percent = 100 * ((r2["relative_distance"] / r1["relative_distance"]) - 1)
     discomfort_change_percent = 100 * (1 - (r2["relative_discomfort"] / r1["relative_discomfort"]))
@@ -14,53 +237,88 @@ def tradeoff_rate(r1, r2):
     dist_change_exact = abs(r2["relative_distance"] - r1["relative_distance"])
     discomfort_change_exact = abs(r2["relative_discomfort"] - r1["relative_discomfort"])
 
-    if dist_change_percent != 0:
+    if np.ndim(dist_change_percent) > 0:
+        # columns of results, for every pair of consecutive Betas at once
+        tor = (discomfort_change_percent / dist_change_percent).abs().where(dist_change_percent != 0)
+    elif dist_change_percent != 0:
         tor = abs( discomfort_change_percent / dist_change_percent )
     else:
         tor = np.nan
     
     return tor, dist_change_percent, discomfort_change_percent, dist_change_exact, discomfort_change_exact
 
+def collapse_identical_betas(results, decimals = 3, by = None):
+    """Keep the first (lowest) Beta of every run of consecutive Betas with the same relative distance and relative discomfort
+(after rounding to `decimals`), i.e. the Betas at which the routes change. Works on dense Beta grids without a loop.
+
+by: optional column (e.g. adm4_pcode) for results of several areas, which are collapsed separately.
+"""
+    results = results.sort_values(([by] if by is not None else []) + ["beta"], ascending = True)
+
+    values = results[["relative_distance", "relative_discomfort"]].round(decimals)
+    changed = values.ne(values.shift()).any(axis = 1)
+    if by is not None:
+        changed = changed | results[by].ne(results[by].shift())
+
+    return results.loc[changed]
+
 def tradeoff_rates_from_results(results):
-    new_rows = []
-    results_df = results.sort_values("beta", ascending = True).reset_index(drop = True)
+    """MTOR between every pair of consecutive Betas in `results`, computed for all pairs at once.
 
-    results_df["relative_discomfort_ROUNDED"] = results_df["relative_discomfort"].round(2)
-    results_df["relative_distance_ROUNDED"] = results_df["relative_distance"].round(2)
+Returns one row per Beta; the first row (lowest Beta) has no lower Beta, so its tradeoff_rate is "not applicable".
+"""
+    results_df = results.sort_values("beta", ascending = True).reset_index(drop = True)
 
-    max_index = results_df.shape[0] - 1
+    r1 = results_df.iloc[:-1].reset_index(drop = True)
+    r2 = results_df.iloc[1:].reset_index(drop = True)
+
+    tor, dist_change_percent, discomfort_change_percent, dist_change_exact, discomfort_change_exact = tradeoff_rate(r1, r2)
+
+    pairs = pd.DataFrame({
+        "lower_beta": r1["beta"],
+        "higher_beta": r2["beta"],
+        "beta_pair": "Beta=" + r1["beta"].astype(str) + " to Beta=" + r2["beta"].astype(str),
+        "relative_distance_PREVIOUS": r1["relative_distance"],
+        "relative_discomfort_PREVIOUS": r1["relative_discomfort"],
+        "tradeoff_rate": tor,
+        "tradeoff_rate_rounded": tor.round(2),
+        "distance_change_percent": dist_change_percent,
+        "discomfort_change_percent": discomfort_change_percent,
+        "distance_change_exact": dist_change_exact,
+        "discomfort_change_exact": discomfort_change_exact,
+    })
+    pairs["text_display"] = "MTOR = " + pairs["tradeoff_rate_rounded"].astype(str) # modified TOR
 
-    new_rows.append({
-        "higher_beta": results_df.loc[0]["beta"],
+    first_row = pd.DataFrame([{
+        "higher_beta": results_df.loc[0, "beta"],
         "tradeoff_rate": "not applicable",
         "text_display": "",
-    })
+    }])
 
-    for i, row1 in results_df.iterrows():
-        if i+1 <= max_index:
-            row2 = results_df.loc[i+1]
-            beta_pair = f'Beta={row1["beta"]} to Beta={row2["beta"]}'
-            tor, dist_change_percent, discomfort_change_percent, dist_change_exact, discomfort_change_exact = tradeoff_rate(row1, row2)
-            rounded_tor = round(tor, 2)
-            new_row = {
-                "lower_beta": row1["beta"],
-                "higher_beta": row2["beta"],
-                "beta_pair": beta_pair,
-                "relative_distance_PREVIOUS": row1["relative_distance"],
-                "relative_discomfort_PREVIOUS": row1["relative_discomfort"],
-                "tradeoff_rate": tor,
-                "tradeoff_rate_rounded": rounded_tor,
-                "distance_change_percent": dist_change_percent,
-                "discomfort_change_percent": discomfort_change_percent,
-                "distance_change_exact": dist_change_exact,
-                "discomfort_change_exact": discomfort_change_exact,
-                "text_display": fr"MTOR = {rounded_tor}", # modified TOR
-            }
-            new_rows.append(new_row)
-
-    tor_df = pd.DataFrame(new_rows)
+    tor_df = pd.concat([first_row, pairs], ignore_index = True)
     return tor_df
 
+def brgy_metrics_from_results(brgy_results):
+    """Averages over the Betas of each barangay, in the format of brgy_*_metrics.csv (indexed by adm4_pcode and sorted by name).
+The average MTOR is the mean over the pairs of consecutive Betas for which it can be computed, or 0 if there are none.
+"""
+    rows = []
+
+    for adm4_pcode, results in brgy_results.groupby("adm4_pcode", sort = False):
+        tradeoff_rates = pd.to_numeric(tradeoff_rates_from_results(results)["tradeoff_rate"].iloc[1:])
+        rows.append({
+            "adm4_en": results["adm4_en"].iloc[0],
+            "average_tradeoff_rate": tradeoff_rates.mean(),
+            "average_circuity": results["relative_distance"].mean(),
+            "average_relative_discomfort": results["relative_discomfort"].mean(),
+            "adm4_pcode": adm4_pcode,
+        })
+
+    brgy_metrics = pd.DataFrame(rows).set_index("adm4_pcode", drop = False).sort_values("adm4_en", ascending = True)
+    brgy_metrics["average_tradeoff_rate"] = brgy_metrics["average_tradeoff_rate"].fillna(0)
+
+    return brgy_metrics
+
 
 def display_explanation_expander():
     with st.expander("Explanations of Metrics", expanded=False):
@@ -72,21 +330,23 @@ def display_explanation_expander():
                                             
 - MTOR (Modified Trade-off Rate) is given by the proportion decrease in relative discomfort, divided by the proportion increase in relative distance. This correlates with the slope of the graph, though it is not equal to slope. Higher MTOR is better because it indicates that a relatively short detour can improve comfort greatly.""")
 
-def display_single_area_analysis(city_metrics, city_results, place_name, mode):
+def display_single_area_analysis(city_metrics, city_results, place_name, mode, beta_note = None):
 
-    tor_df = tradeoff_rates_from_results(city_results)
+    betas_tested = np.sort(city_results["beta"].unique())
 
-    city_results = city_results.merge(tor_df, left_on = "beta", right_on="higher_beta", how = "left")
+    # if both relative discomfort and relative distance had a very small change, keep only the lowest of those Betas,
+    # so dense Beta grids give one point (and one MTOR) per change of route
+    city_results = collapse_identical_betas(city_results).reset_index(drop = True)
 
-    # if both relative discomfort and relative distance had a very small change, drop duplicates.
-    city_results["relative_discomfort_ROUNDED"] = city_results["relative_discomfort"].round(3)
-    city_results["relative_distance_ROUNDED"] = city_results["relative_distance"].round(3)
-    city_results_length1 = city_results.shape[0]
+    some_betas_were_skipped = city_results.shape[0] < len(betas_tested)
+
+    tor_df = tradeoff_rates_from_results(city_results)
 
-    city_results = city_results.sort_values("beta", ascending = True).drop_duplicates(["relative_discomfort_ROUNDED", "relative_distance_ROUNDED"], keep = "first")
-    city_results_length2 = city_results.shape[0]
+    city_results = city_results.merge(tor_df, left_on = "beta", right_on="higher_beta", how = "left")
 
-    some_betas_were_skipped = city_results_length2 < city_results_length1
+    # a few Betas get a discrete color and an MTOR label each; many Betas get a color gradient and tooltips only
+    few_points = city_results.shape[0] <= 10
+    beta_type = "beta:N" if few_points else "beta:Q"
 
     domx = [max(city_results["relative_distance"].min() - 0.01, 1), city_results["relative_distance"].max() + 0.02]
     domy = [max(city_results["relative_discomfort"].min() - 0.01, 0), city_results["relative_discomfort"].max() + 0.01]
@@ -105,11 +365,11 @@ def display_single_area_analysis(city_metrics, city_results, place_name, mode):
     ).encode(
         x = alt.X("relative_distance:Q", title = "Relative Distance (Circuity)", scale = alt.Scale(domain = domx)),
         y = alt.Y("relative_discomfort:Q", title = "Relative Discomfort", scale = alt.Scale(domain = domy)),
-        color = alt.Color("beta:N", title = "Beta (Discomfort Sensitivity)", scale = alt.Scale(scheme = "viridis")),
+        color = alt.Color(beta_type, title = "Beta (Discomfort Sensitivity)", scale = alt.Scale(scheme = "viridis")),
         tooltip = [
             alt.Tooltip("relative_distance:Q", title = "Relative Distance (Circuity)"),
             alt.Tooltip("relative_discomfort:Q", title = "Relative Discomfort"),
-            alt.Tooltip("beta:N", title = "Beta (Discomfort Sensitivity)"),
+            alt.Tooltip("beta:Q", title = "Beta (Discomfort Sensitivity)"),
             alt.Tooltip("tradeoff_rate:N", title = "MTOR from previous Beta"),
         ]
     )
@@ -134,13 +394,15 @@ def display_single_area_analysis(city_metrics, city_results, place_name, mode):
         tooltip = [
             alt.Tooltip("relative_distance:Q", title = "Relative Distance (Circuity)"),
             alt.Tooltip("relative_discomfort:Q", title = "Relative Discomfort"),
-            alt.Tooltip("beta:N", title = "Beta (Discomfort Sensitivity)"),
+            alt.Tooltip("beta:Q", title = "Beta (Discomfort Sensitivity)"),
             alt.Tooltip("tradeoff_rate:N", title = "MTOR from previous Beta"),
         ]
     )
-    
-    chart = (base + text + chart2 + arrow).configure_point(
-        size = 500
+
+    layers = (base + text + chart2 + arrow) if few_points else (base + chart2 + arrow)
+
+    chart = layers.configure_point(
+        size = 500 if few_points else 120
     ).properties(
         title = f"{mode} Curve for {place_name}",
         width=650,
@@ -151,8 +413,14 @@ def display_single_area_analysis(city_metrics, city_results, place_name, mode):
 
     st.caption("*MTOR: Modified Trade-off Rate. **Higher MTOR is better.**")
 
-    if some_betas_were_skipped:
-        st.caption(r"The full set of Beta values tested is {0, 0.5, 1, 1.5, 2, 2.5, 3}. If any of these values are not present in the chart above, it is because there was no change in relative discomfort or relative distance was measured, compared to the next higher values of Beta.")
+    if beta_note is not None:
+        st.caption(beta_note)
+    elif some_betas_were_skipped:
+        if len(betas_tested) <= 10:
+            betas_text = "{" + ", ".join(f"{beta:g}" for beta in betas_tested) + "}"
+        else:
+            betas_text = f"{len(betas_tested)} values from {betas_tested[0]:g} to {betas_tested[-1]:g}"
+        st.caption(f"The full set of Beta values tested is {betas_text}. If any of these values are not present in the chart above, it is because there was no change in relative discomfort or relative distance was measured, compared to the next lower value of Beta.")
 
     if city_results.shape[0] <= 1:
 
@@ -163,7 +431,10 @@ def display_single_area_analysis(city_metrics, city_results, place_name, mode):
         st.markdown("### Interpretation")
         st.markdown("Higher values of Beta indicate higher sensitivity to discomfort, i.e., cyclists/pedestrians who are willing to take longer detours to improve comfort.\n\nThe lowest value, 'Beta=0.0', is the case where a person is not sensitive to discomfort; they simply try to take the shortest possible path.")
 
-        beta_pair_option = st.radio("Choose a Beta interval", options = city_results.index[1:], format_func = lambda x: tor_df.at[x, "beta_pair"], horizontal=True)
+        if few_points:
+            beta_pair_option = st.radio("Choose a Beta interval", options = city_results.index[1:], format_func = lambda x: tor_df.at[x, "beta_pair"], horizontal=True)
+        else:
+            beta_pair_option = st.selectbox("Choose a Beta interval", options = city_results.index[1:], format_func = lambda x: tor_df.at[x, "beta_pair"])
 
         row = city_results.loc[beta_pair_option]
 